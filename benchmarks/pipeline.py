@@ -0,0 +1,141 @@
+import argparse, json, os, platform, resource, subprocess, sys, time
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import yaml
+from datasets.loader_classifier import list_images_with_labels, read_image_gray, class_names
+from datasets.loader_segmenter import list_pairs
+from utils.rules import detect_features, detect_features_batch, classify_from_features, classify_batch
+from utils.metrics import confusion_matrix, per_class_accuracy
+
+"""
+Throughput benchmark for the rule pipeline and the synthetic data generators.
+
+    python benchmarks/pipeline.py --n_per_class 200 --seg_n 200 --out outputs/bench/run.json
+    python benchmarks/pipeline.py --reuse --compare outputs/bench/run.json
+
+Every stage reports images/s, p50/p99 per-image latency (for per-image
+stages) and the peak RSS of the process so far.
+"""
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return r / (1024.0 * 1024.0) if sys.platform == "darwin" else r / 1024.0
+
+def _summary(name, n, total_s, lat=None):
+    out = {"stage": name, "n": n, "total_s": total_s,
+           "items_per_s": n / total_s if total_s > 0 else float("inf"), "peak_rss_mb": peak_rss_mb()}
+    if lat is not None and len(lat):
+        out["p50_ms"] = float(np.percentile(lat, 50) * 1000.0)
+        out["p99_ms"] = float(np.percentile(lat, 99) * 1000.0)
+    return out
+
+def per_item(name, fn, xs):
+    lat = np.empty(len(xs))
+    out = []
+    t0 = time.perf_counter()
+    for i, x in enumerate(xs):
+        t = time.perf_counter()
+        out.append(fn(x))
+        lat[i] = time.perf_counter() - t
+    return _summary(name, len(xs), time.perf_counter() - t0, lat), out
+
+def whole(name, fn, n):
+    t0 = time.perf_counter()
+    out = fn()
+    return _summary(name, n, time.perf_counter() - t0), out
+
+def generate(work: str, n_per_class: int, seg_n: int, workers: int):
+    res = []
+    cls_out = os.path.join(work, "synth_cls"); seg_out = os.path.join(work, "synth")
+    for name, cmd, n in [
+        ("gen_cls", [sys.executable, "scripts/make_synth_fracture_cls.py", "--out", cls_out,
+                     "--n_per_class", str(n_per_class), "--workers", str(workers)], 5 * n_per_class),
+        ("gen_seg", [sys.executable, "scripts/make_synth_data.py", "--out", seg_out,
+                     "--n", str(seg_n), "--workers", str(workers)], seg_n),
+    ]:
+        t0 = time.perf_counter()
+        subprocess.run(cmd, cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+        res.append(_summary(name, n, time.perf_counter() - t0))
+    return res, cls_out, seg_out
+
+def run(cfg, cls_root, seg_root, plot=True):
+    res = []
+    split = os.path.join(cls_root, "val") if os.path.isdir(os.path.join(cls_root, "val")) else cls_root
+    t0 = time.perf_counter()
+    items = list_images_with_labels(split, ".png")
+    res.append(_summary("list_images_with_labels", len(items), time.perf_counter() - t0))
+    classes = class_names(split)
+    t0 = time.perf_counter()
+    pairs = list_pairs(os.path.join(seg_root, "val"), ".png", ".png")
+    res.append(_summary("list_pairs", len(pairs), time.perf_counter() - t0))
+
+    r, imgs = per_item("decode(read_image_gray)", lambda it: read_image_gray(it[0]), items); res.append(r)
+    r, feats = per_item("detect_features", lambda img: detect_features(img, cfg), imgs); res.append(r)
+    r, preds = per_item("classify_from_features", lambda f: classify_from_features(f, classes), feats); res.append(r)
+
+    arrs = [np.asarray(im) for im in imgs]
+    if arrs and len({a.shape for a in arrs}) == 1:
+        stack = np.stack(arrs)
+        r, bfeats = whole("detect_features_batch", lambda: detect_features_batch(stack, cfg), len(arrs)); res.append(r)
+        r, _ = whole("classify_batch", lambda: classify_batch(bfeats, classes), len(arrs)); res.append(r)
+
+    y_true = [label for _, label in items]
+    r, cm = whole("metrics", lambda: confusion_matrix(y_true, preds, len(classes)), len(items)); res.append(r)
+    per_class_accuracy(cm)
+    if plot:
+        from train_cls import plot_confusion_matrix
+        out_png = os.path.join(os.path.dirname(cls_root), "bench_cm.png")
+        r, _ = whole("plot_confusion_matrix", lambda: plot_confusion_matrix(cm, classes, out_png), 1); res.append(r)
+    return res
+
+def print_table(results, baseline=None):
+    base = {r["stage"]: r for r in (baseline or [])}
+    print(f"{'stage':28s} {'n':>7s} {'items/s':>11s} {'p50 ms':>8s} {'p99 ms':>8s} {'RSS MB':>8s}" + ("  vs base" if base else ""))
+    for r in results:
+        line = (f"{r['stage']:28s} {r['n']:7d} {r['items_per_s']:11.1f} "
+                f"{r.get('p50_ms', float('nan')):8.3f} {r.get('p99_ms', float('nan')):8.3f} {r['peak_rss_mb']:8.1f}")
+        b = base.get(r["stage"])
+        if b and b["items_per_s"] > 0:
+            line += f"  x{r['items_per_s'] / b['items_per_s']:.2f}"
+        print(line)
+
+def main(args):
+    cfg = yaml.safe_load(open(os.path.join(ROOT, args.cfg), "r"))
+    work = os.path.abspath(args.workdir)
+    results = []
+    cls_root, seg_root = os.path.join(work, "synth_cls"), os.path.join(work, "synth")
+    if not args.reuse or not os.path.isdir(cls_root):
+        gen, cls_root, seg_root = generate(work, args.n_per_class, args.seg_n, args.workers)
+        results.extend(gen)
+    results.extend(run(cfg, cls_root, seg_root, plot=not args.no_plot))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+    print_table(results, baseline)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        meta = {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+                "cpus": os.cpu_count(), "n_per_class": args.n_per_class, "seg_n": args.seg_n,
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        with open(args.out, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+        print(f"Saved {args.out}")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cfg", default="configs/classifier_letournel.yaml")
+    ap.add_argument("--workdir", default="outputs/bench/data", help="where the synthetic datasets go")
+    ap.add_argument("--n_per_class", type=int, default=100)
+    ap.add_argument("--seg_n", type=int, default=100)
+    ap.add_argument("--workers", type=int, default=1, help="generator processes")
+    ap.add_argument("--reuse", action="store_true", help="skip generation if workdir already has data")
+    ap.add_argument("--no_plot", action="store_true")
+    ap.add_argument("--out", default=None, help="save results JSON")
+    ap.add_argument("--compare", default=None, help="earlier results JSON to compare items/s against")
+    main(ap.parse_args())
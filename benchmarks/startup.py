@@ -0,0 +1,66 @@
+import argparse, json, os, statistics, subprocess, sys
+
+"""
+Import-time benchmark for the CLI entry points. Each module is imported in a
+fresh interpreter (like a short batch job would) and the wall time of the
+import is measured; heavy optional modules that got pulled in are listed.
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --max_ms 400 --forbid matplotlib,torch --out outputs/bench/startup.json
+
+Exits with status 1 when a budget is exceeded, so it can guard CI.
+"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_POINTS = ["train_cls", "tune_cls", "infer", "serve", "train", "eval"]
+HEAVY = ["matplotlib", "torch", "sklearn", "cv2", "scipy"]
+
+_PROBE = """
+import sys, time, json
+t0 = time.perf_counter()
+import {mod}
+dt = time.perf_counter() - t0
+print(json.dumps({{"ms": dt * 1000.0, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+def measure(mod: str, repeats: int = 5):
+    runs, heavy = [], []
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, "-c", _PROBE.format(mod=mod, heavy=HEAVY)],
+                             cwd=ROOT, capture_output=True, text=True)
+        if out.returncode != 0:
+            return {"module": mod, "error": out.stderr.strip().splitlines()[-1] if out.stderr else "failed"}
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        runs.append(r["ms"]); heavy = r["heavy"]
+    return {"module": mod, "median_ms": statistics.median(runs), "min_ms": min(runs), "heavy": heavy}
+
+def main(modules, repeats, max_ms, forbid, out_path):
+    results, failed = [], False
+    for mod in modules:
+        r = measure(mod, repeats)
+        results.append(r)
+        if "error" in r:
+            print(f"{mod:10s}  import failed: {r['error']}")
+            failed = True
+            continue
+        bad = [m for m in r["heavy"] if m in forbid]
+        over = max_ms is not None and r["median_ms"] > max_ms
+        flag = ("  OVER BUDGET" if over else "") + (f"  FORBIDDEN: {','.join(bad)}" if bad else "")
+        print(f"{mod:10s}  median {r['median_ms']:7.1f} ms  min {r['min_ms']:7.1f} ms  heavy={r['heavy']}{flag}")
+        failed = failed or over or bool(bad)
+    if out_path:
+        os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+        with open(out_path, "w") as f:
+            json.dump({"python": sys.version.split()[0], "results": results}, f, indent=2)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--modules", default=",".join(ENTRY_POINTS))
+    ap.add_argument("--repeats", type=int, default=5)
+    ap.add_argument("--max_ms", type=float, default=None, help="fail if any median import time exceeds this")
+    ap.add_argument("--forbid", default="matplotlib,torch", help="fail if importing an entry point loads these")
+    ap.add_argument("--out", default=None, help="write results as JSON")
+    args = ap.parse_args()
+    forbid = [m for m in args.forbid.split(",") if m]
+    sys.exit(main(args.modules.split(","), args.repeats, args.max_ms, forbid, args.out))
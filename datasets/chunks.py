@@ -0,0 +1,40 @@
+import io
+from typing import Dict, List, Tuple
+import numpy as np
+from PIL import Image
+from datasets.packed import PackedStore
+from datasets.shards import open_store as _open_store
+from utils import profiling
+
+"""
+Chunk loading shared by train_cls.py, tune_cls.py and the utils/features.py
+pool workers: a chunk of (path, label) items comes back as decoded gray
+arrays, either read + decoded from disk or as views into a packed / sharded
+store (datasets/packed.py, datasets/shards.py).
+"""
+
+_STORES: Dict[str, PackedStore] = {}
+
+def open_store(prefix: str) -> PackedStore:
+    # one memory map per process (also reused inside pool workers); shard sets work too
+    if prefix not in _STORES:
+        _STORES[prefix] = _open_store(prefix)
+    return _STORES[prefix]
+
+def _read_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+def load_chunk(items: List[Tuple[str, int]], store: str = None, start: int = 0):
+    # file reads and PNG decode are separate stages so instrumentation can tell them apart
+    if store:
+        with profiling.stage("io", len(items)):
+            st = open_store(store)
+            batch = st.batch(start, start + len(items))
+            if batch is not None:
+                return batch
+            return [st.image(i) for i in range(start, start + len(items))]
+    with profiling.stage("io", len(items)):
+        raw = [_read_bytes(p) for p, _ in items]
+    with profiling.stage("decode", len(items)):
+        return [np.asarray(Image.open(io.BytesIO(b)).convert("L")) for b in raw]
@@ -1,38 +1,49 @@
 import os
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Optional
 from PIL import Image
+from datasets.scan import scan_classes, iter_class_items, class_folder_manifest
 
-def list_images_with_labels(root_dir: str, img_ext: str = ".png") -> List[Tuple[str, int]]:
+def list_images_with_labels(root_dir: str, img_ext: str = ".png",
+                            manifest_path: Optional[str] = None) -> List[Tuple[str, int]]:
     """
     Expects a folder layout:
         root_dir/
           ClassA/*.png
           ClassB/*.png
           ...
-    Returns list of (image_path, class_index) and an ordered class_name list.
+    Returns list of (image_path, class_index). See list_images_and_classes
+    for the ordered class_name list from the same scan.
+    """
+    return list_images_and_classes(root_dir, img_ext, manifest_path)[0]
+
+def list_images_and_classes(root_dir: str, img_ext: str = ".png",
+                            manifest_path: Optional[str] = None) -> Tuple[List[Tuple[str, int]], List[str]]:
+    """
+    Single-pass (items, classes). With manifest_path, the listing is cached on
+    disk and reused while the class folders' mtimes are unchanged.
     """
     if not os.path.isdir(root_dir):
-        return []
-    classes = sorted([d for d in os.listdir(root_dir) if os.path.isdir(os.path.join(root_dir, d))])
-    items: List[Tuple[str, int]] = []
-    for ci, cname in enumerate(classes):
-        cdir = os.path.join(root_dir, cname)
-        for fn in sorted(os.listdir(cdir)):
-            if fn.lower().endswith(img_ext):
-                items.append((os.path.join(cdir, fn), ci))
-    return items
+        return [], []
+    if manifest_path:
+        m = class_folder_manifest(root_dir, img_ext, manifest_path)
+        return [(p, ci) for p, ci, _, _ in m["items"]], m["classes"]
+    classes = scan_classes(root_dir)
+    return list(iter_class_items(root_dir, img_ext, classes)), classes
 
 def read_image_gray(path: str):
     """
-    Loads an image as 8-bit grayscale PIL.Image.
+    Loads an image as 8-bit grayscale PIL.Image; file:// / http(s):// / s3://
+    URIs are fetched through datasets/remote.py.
     """
+    if "://" in path:
+        import io
+        from datasets.remote import read_bytes
+        return Image.open(io.BytesIO(read_bytes(path))).convert("L")
     img = Image.open(path).convert("L")
     return img
 
 def class_names(root_dir: str) -> List[str]:
-    if not os.path.isdir(root_dir):
-        return []
-    return sorted([d for d in os.listdir(root_dir) if os.path.isdir(os.path.join(root_dir, d))])
+    return scan_classes(root_dir)
 
 
 # ---
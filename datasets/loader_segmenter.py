@@ -1,18 +1,11 @@
 import os
 from PIL import Image
-from typing import List, Tuple
+from typing import List, Tuple, Optional
+from datasets.scan import iter_pairs, pairs_manifest
 
-def list_pairs(root_dir: str, img_ext: str = ".png", mask_ext: str = ".png") -> List[Tuple[str, str]]:
-    images_dir = os.path.join(root_dir, "images")
-    masks_dir  = os.path.join(root_dir, "masks")
-    pairs = []
-    if not os.path.isdir(images_dir):
-        return pairs
-    for fn in sorted(os.listdir(images_dir)):
-        if not fn.endswith(img_ext): 
-            continue
-        img_p = os.path.join(images_dir, fn)
-        mask_p = os.path.join(masks_dir, fn.replace(img_ext, mask_ext))
-        if os.path.exists(mask_p):
-            pairs.append((img_p, mask_p))
-    return pairs
\ No newline at end of file
+def list_pairs(root_dir: str, img_ext: str = ".png", mask_ext: str = ".png",
+               manifest_path: Optional[str] = None) -> List[Tuple[str, str]]:
+    if manifest_path and os.path.isdir(os.path.join(root_dir, "images")):
+        m = pairs_manifest(root_dir, img_ext, mask_ext, manifest_path)
+        return [(img_p, mask_p) for img_p, mask_p, _, _ in m["items"]]
+    return list(iter_pairs(root_dir, img_ext, mask_ext))
@@ -0,0 +1,138 @@
+import argparse, os, json
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from PIL import Image
+from datasets.scan import scan_classes, iter_class_items, iter_pairs
+
+"""
+Decoded-image store: every image (and mask) is decoded once to 8-bit gray and
+appended to one raw uint8 file <prefix>.bin; <prefix>.json holds offsets,
+shapes and labels. PackedStore memory-maps the .bin and hands out zero-copy
+views, so re-scoring the same set never touches PNG decoding again.
+
+    python -m datasets.packed --root data/synth_cls/val --out data/packed/cls_val
+    python -m datasets.packed --root data/synth/val --layout pairs --out data/packed/seg_val
+"""
+
+STORE_VERSION = 1
+
+def append_array(f, arr: np.ndarray, offsets: List[int], shapes: List[List[int]], pos: int) -> int:
+    arr = np.ascontiguousarray(arr, dtype=np.uint8)
+    f.write(arr.tobytes())
+    offsets.append(pos); shapes.append(list(arr.shape))
+    return pos + arr.size
+
+def _decode(path: str) -> np.ndarray:
+    return np.asarray(Image.open(path).convert("L"))
+
+def write_index(prefix: str, index: Dict):
+    tmp = prefix + ".json.tmp"
+    with open(tmp, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp, prefix + ".json")
+
+def pack_class_folder(root_dir: str, out_prefix: str, img_ext: str = ".png") -> int:
+    """
+    Packs the list_images_with_labels layout. Returns number of images.
+    """
+    os.makedirs(os.path.dirname(out_prefix) or ".", exist_ok=True)
+    classes = scan_classes(root_dir)
+    paths, labels, offsets, shapes = [], [], [], []
+    pos = 0
+    with open(out_prefix + ".bin", "wb") as f:
+        for p, ci in iter_class_items(root_dir, img_ext, classes):
+            pos = append_array(f, _decode(p), offsets, shapes, pos)
+            paths.append(p); labels.append(ci)
+    write_index(out_prefix, {"version": STORE_VERSION, "kind": "classes", "classes": classes,
+                              "paths": paths, "labels": labels, "offsets": offsets, "shapes": shapes})
+    return len(paths)
+
+def pack_pairs(root_dir: str, out_prefix: str, img_ext: str = ".png", mask_ext: str = ".png") -> int:
+    """
+    Packs the list_pairs layout; image i and mask i are stored back to back.
+    """
+    os.makedirs(os.path.dirname(out_prefix) or ".", exist_ok=True)
+    paths, mask_paths, offsets, shapes, mask_offsets, mask_shapes = [], [], [], [], [], []
+    pos = 0
+    with open(out_prefix + ".bin", "wb") as f:
+        for img_p, mask_p in iter_pairs(root_dir, img_ext, mask_ext):
+            pos = append_array(f, _decode(img_p), offsets, shapes, pos)
+            pos = append_array(f, _decode(mask_p), mask_offsets, mask_shapes, pos)
+            paths.append(img_p); mask_paths.append(mask_p)
+    write_index(out_prefix, {"version": STORE_VERSION, "kind": "pairs",
+                              "paths": paths, "offsets": offsets, "shapes": shapes,
+                              "mask_paths": mask_paths, "mask_offsets": mask_offsets,
+                              "mask_shapes": mask_shapes})
+    return len(paths)
+
+class PackedStore:
+    """
+    Read-only, memory-mapped view over a store written by pack_class_folder /
+    pack_pairs. image(i) / mask(i) return (H, W) uint8 views into the map.
+    """
+    def __init__(self, prefix: str):
+        with open(prefix + ".json", "r") as f:
+            self.index = json.load(f)
+        if self.index.get("version") != STORE_VERSION:
+            raise ValueError(f"unsupported packed store version in {prefix}.json")
+        self.kind = self.index["kind"]
+        self.paths: List[str] = self.index["paths"]
+        self.classes: List[str] = self.index.get("classes", [])
+        self.labels: List[int] = self.index.get("labels", [])
+        self._offsets = np.asarray(self.index["offsets"], dtype=np.int64)
+        self._shapes = [tuple(s) for s in self.index["shapes"]]
+        size = os.path.getsize(prefix + ".bin")
+        # np.memmap refuses zero-length files
+        self._mm = np.memmap(prefix + ".bin", dtype=np.uint8, mode="r") if size else np.zeros(0, np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def _view(self, off: int, shape: Tuple[int, ...]) -> np.ndarray:
+        n = int(np.prod(shape))
+        return self._mm[off:off+n].reshape(shape)
+
+    def image(self, i: int) -> np.ndarray:
+        return self._view(int(self._offsets[i]), self._shapes[i])
+
+    def mask(self, i: int) -> np.ndarray:
+        if self.kind != "pairs":
+            raise ValueError("store has no masks (kind=%r)" % self.kind)
+        return self._view(int(self.index["mask_offsets"][i]), tuple(self.index["mask_shapes"][i]))
+
+    def items(self) -> List[Tuple[str, int]]:
+        """
+        (path, class_index) list matching list_images_with_labels.
+        """
+        return list(zip(self.paths, self.labels))
+
+    def batch(self, start: int, stop: int) -> Optional[np.ndarray]:
+        """
+        (N, H, W) zero-copy view of images start..stop-1 when they share a shape
+        and sit back to back in the file (always true for class-folder stores);
+        None otherwise.
+        """
+        shapes = set(self._shapes[start:stop])
+        if len(shapes) != 1:
+            return None
+        shape = shapes.pop()
+        n = stop - start
+        step = int(np.prod(shape))
+        off = int(self._offsets[start])
+        if n > 1 and not np.all(np.diff(self._offsets[start:stop]) == step):
+            return None
+        return self._mm[off:off + n*step].reshape((n,) + shape)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--root", required=True, help="class-folder root or pairs root (images/, masks/)")
+    ap.add_argument("--out", required=True, help="output prefix (writes <out>.bin and <out>.json)")
+    ap.add_argument("--layout", choices=["classes", "pairs"], default="classes")
+    ap.add_argument("--img_ext", default=".png")
+    ap.add_argument("--mask_ext", default=".png")
+    args = ap.parse_args()
+    if args.layout == "classes":
+        n = pack_class_folder(args.root, args.out, args.img_ext)
+    else:
+        n = pack_pairs(args.root, args.out, args.img_ext, args.mask_ext)
+    print(f"Packed {n} items -> {args.out}.bin / {args.out}.json")
@@ -0,0 +1,78 @@
+import os, queue, threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+from PIL import Image
+
+_DONE = object()
+
+def iter_image_files(folder: str, img_ext: str = ".png") -> Iterator[str]:
+    """
+    Lazily yields image paths in folder (directory order, no full listing in memory).
+    """
+    with os.scandir(folder) as it:
+        for e in it:
+            if e.name.lower().endswith(img_ext) and e.is_file():
+                yield e.path
+
+def decode_gray(path: str) -> np.ndarray:
+    return np.asarray(Image.open(path).convert("L"))
+
+def _try_decode(decode: Callable, path: str) -> Tuple[Optional[np.ndarray], Optional[str]]:
+    try:
+        return decode(path), None
+    except Exception as e:  # unreadable / truncated files are reported, not fatal
+        return None, f"{type(e).__name__}: {e}"
+
+def prefetch_batches(paths: Iterable[str], batch_size: int = 64, workers: int = 4, depth: int = 4,
+                     decode: Callable[[str], np.ndarray] = decode_gray
+                     ) -> Iterator[Tuple[List[str], List[Optional[np.ndarray]], List[Optional[str]]]]:
+    """
+    Decodes paths on a background thread pool and yields (paths, arrays, errors)
+    batches. At most `depth` decoded batches wait in the queue, so memory stays
+    bounded no matter how many paths there are. arrays[i] is None when
+    errors[i] says why the file could not be decoded.
+    """
+    q: "queue.Queue" = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def producer():
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                batch: List[str] = []
+                for p in paths:
+                    batch.append(p)
+                    if len(batch) == batch_size:
+                        _put(batch, pool)
+                        batch = []
+                    if stop.is_set():
+                        return
+                if batch:
+                    _put(batch, pool)
+        except Exception as e:
+            q.put(e)
+        finally:
+            q.put(_DONE)
+
+    def _put(batch, pool):
+        res = list(pool.map(lambda p: _try_decode(decode, p), batch))
+        q.put((batch, [r[0] for r in res], [r[1] for r in res]))
+
+    t = threading.Thread(target=producer, daemon=True)
+    t.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        # drain so a blocked producer can observe `stop` and exit
+        while t.is_alive():
+            try:
+                q.get(timeout=0.1)
+            except queue.Empty:
+                pass
@@ -0,0 +1,346 @@
+import asyncio, datetime, hashlib, hmac, io, os, queue, ssl, threading
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import quote, urlsplit
+import numpy as np
+from PIL import Image
+
+"""
+Async fetch layer for URI-style image paths (stdlib only: asyncio streams, no
+aiohttp / boto3):
+
+    /abs/or/rel/path, file:///path   read on a thread pool
+    http://host:port/a.png            pooled keep-alive HTTP/1.1 (https too)
+    s3://bucket/key                   S3-compatible GET, path-style, SigV4-signed
+                                      when credentials are set
+
+    for uris, arrs, errors in fetch_batches(uris, batch_size=64, concurrency=32):
+        ...                           # same shape as datasets.prefetch.prefetch_batches
+
+At most `concurrency` fetches run at once (and per_host connections per
+host); fetched bytes go straight to a decode thread pool and decoded batches
+wait in a bounded in-memory queue, so the network stays busy while the caller
+runs the rules.
+
+S3 settings come from S3Config / the environment: AWS_ENDPOINT_URL (e.g. a
+local MinIO / moto server), AWS_REGION, AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY,
+AWS_SESSION_TOKEN.
+"""
+
+_DONE = object()
+_EMPTY_SHA256 = hashlib.sha256(b"").hexdigest()
+
+def is_uri(path: str) -> bool:
+    return "://" in path
+
+def _read_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+class S3Config:
+    def __init__(self, endpoint: Optional[str] = None, region: Optional[str] = None,
+                 access_key: Optional[str] = None, secret_key: Optional[str] = None, token: Optional[str] = None):
+        env = os.environ
+        self.endpoint = (endpoint or env.get("AWS_ENDPOINT_URL") or "https://s3.amazonaws.com").rstrip("/")
+        self.region = region or env.get("AWS_REGION") or env.get("AWS_DEFAULT_REGION") or "us-east-1"
+        self.access_key = access_key or env.get("AWS_ACCESS_KEY_ID")
+        self.secret_key = secret_key or env.get("AWS_SECRET_ACCESS_KEY")
+        self.token = token or env.get("AWS_SESSION_TOKEN")
+
+    def url(self, bucket: str, key: str = "", query: str = "") -> str:
+        return f"{self.endpoint}/{bucket}/{quote(key, safe='/~')}" + (f"?{query}" if query else "")
+
+    def headers(self, method: str, url: str) -> Dict[str, str]:
+        """
+        AWS Signature V4 headers for an empty-body request (none without credentials).
+        """
+        if not (self.access_key and self.secret_key):
+            return {}
+        u = urlsplit(url)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        amz_date, day = now.strftime("%Y%m%dT%H%M%SZ"), now.strftime("%Y%m%d")
+        h = {"host": u.netloc, "x-amz-content-sha256": _EMPTY_SHA256, "x-amz-date": amz_date}
+        if self.token:
+            h["x-amz-security-token"] = self.token
+        pairs = sorted(tuple(p.partition("=")[::2]) for p in u.query.split("&")) if u.query else []
+        query = "&".join(f"{k}={v}" for k, v in pairs)
+        signed = ";".join(sorted(h))
+        canonical = "\n".join([method, u.path or "/", query,
+                               "".join(f"{k}:{h[k]}\n" for k in sorted(h)), signed, _EMPTY_SHA256])
+        scope = f"{day}/{self.region}/s3/aws4_request"
+        to_sign = "\n".join(["AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical.encode()).hexdigest()])
+        k = f"AWS4{self.secret_key}".encode()
+        for part in (day, self.region, "s3", "aws4_request"):
+            k = hmac.new(k, part.encode(), hashlib.sha256).digest()
+        sig = hmac.new(k, to_sign.encode(), hashlib.sha256).hexdigest()
+        h["authorization"] = f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, SignedHeaders={signed}, Signature={sig}"
+        del h["host"]
+        return h
+
+async def _read_response(reader: asyncio.StreamReader, method: str) -> Tuple[int, Dict[str, str], bytes, bool]:
+    # -> (status, headers, body, connection reusable)
+    line = await reader.readuntil(b"\r\n")
+    version, status = line.split(b" ", 2)[:2]
+    status = int(status)
+    headers: Dict[str, str] = {}
+    while True:
+        line = await reader.readuntil(b"\r\n")
+        if line == b"\r\n":
+            break
+        k, _, v = line.decode("latin-1").partition(":")
+        headers[k.strip().lower()] = v.strip()
+    conn = headers.get("connection", "").lower()
+    keep = conn != "close" if version == b"HTTP/1.1" else conn == "keep-alive"
+    if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+        return status, headers, b"", keep
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        parts = []
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+            if size == 0:
+                while await reader.readuntil(b"\r\n") != b"\r\n":  # trailers
+                    pass
+                break
+            parts.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+        return status, headers, b"".join(parts), keep
+    if "content-length" in headers:
+        return status, headers, await reader.readexactly(int(headers["content-length"])), keep
+    return status, headers, await reader.read(), False
+
+class ConnectionPool:
+    """
+    Keep-alive HTTP/1.1 connections, at most per_host open per (scheme, host, port).
+    A request on a reused connection that turns out to be stale is retried once
+    on a fresh one.
+    """
+    def __init__(self, per_host: int = 8, timeout: float = 30.0):
+        self.per_host, self.timeout = per_host, timeout
+        self._idle: Dict[Tuple, List] = {}
+        self._sems: Dict[Tuple, asyncio.Semaphore] = {}
+        self._ssl = None
+        self.opened = 0
+
+    async def _connect(self, scheme: str, host: str, port: int):
+        ctx = None
+        if scheme == "https":
+            ctx = self._ssl = self._ssl or ssl.create_default_context()
+        self.opened += 1
+        return await asyncio.wait_for(asyncio.open_connection(host, port, ssl=ctx), self.timeout)
+
+    async def request(self, method: str, url: str, headers: Optional[Dict[str, str]] = None) -> Tuple[int, Dict[str, str], bytes]:
+        u = urlsplit(url)
+        port = u.port or (443 if u.scheme == "https" else 80)
+        key = (u.scheme, u.hostname, port)
+        path = (u.path or "/") + (f"?{u.query}" if u.query else "")
+        head = {"host": u.netloc, "connection": "keep-alive", "accept-encoding": "identity"}
+        head.update({k.lower(): v for k, v in (headers or {}).items()})
+        req = (f"{method} {path} HTTP/1.1\r\n" + "".join(f"{k}: {v}\r\n" for k, v in head.items()) + "\r\n").encode()
+        sem = self._sems.setdefault(key, asyncio.Semaphore(self.per_host))
+        async with sem:
+            idle = self._idle.setdefault(key, [])
+            for attempt in range(2):
+                reused = bool(idle)
+                reader, writer = idle.pop() if reused else await self._connect(*key)
+                try:
+                    writer.write(req)
+                    await writer.drain()
+                    status, rh, body, keep = await asyncio.wait_for(_read_response(reader, method), self.timeout)
+                except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+                    writer.close()
+                    if reused and attempt == 0:
+                        continue
+                    raise
+                except BaseException:
+                    writer.close()
+                    raise
+                if keep:
+                    idle.append((reader, writer))
+                else:
+                    writer.close()
+                return status, rh, body
+
+    async def close(self):
+        for conns in self._idle.values():
+            for _, w in conns:
+                w.close()
+        self._idle.clear()
+
+class AsyncFetcher:
+    """
+    fetch(uri) -> bytes for file / http(s) / s3 URIs (see the module docstring),
+    at most `concurrency` at a time. Use inside one event loop; close() at the end.
+    """
+    def __init__(self, concurrency: int = 32, per_host: int = 8, timeout: float = 30.0,
+                 s3: Optional[S3Config] = None, file_workers: int = 8):
+        self.concurrency = concurrency
+        self.pool = ConnectionPool(per_host, timeout)
+        self.s3 = s3
+        self._files = ThreadPoolExecutor(max_workers=file_workers, thread_name_prefix="fetch")
+        self._sem: Optional[asyncio.Semaphore] = None
+
+    async def _get(self, url: str, headers: Optional[Dict[str, str]] = None) -> bytes:
+        status, _, body = await self.pool.request("GET", url, headers)
+        if status != 200:
+            raise IOError(f"HTTP {status} for {url}")
+        return body
+
+    async def fetch(self, uri: str) -> bytes:
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.concurrency)
+        async with self._sem:
+            u = urlsplit(uri)
+            if not is_uri(uri) or u.scheme == "file":
+                path = uri if not is_uri(uri) else u.path
+                return await asyncio.get_running_loop().run_in_executor(self._files, _read_bytes, path)
+            if u.scheme in ("http", "https"):
+                return await self._get(uri)
+            if u.scheme == "s3":
+                self.s3 = self.s3 or S3Config()
+                url = self.s3.url(u.netloc, u.path.lstrip("/"))
+                return await self._get(url, self.s3.headers("GET", url))
+            raise ValueError(f"unsupported URI scheme {u.scheme!r} in {uri}")
+
+    async def list_s3(self, prefix_uri: str, suffix: str = "") -> List[str]:
+        """
+        s3://bucket/prefix -> sorted s3:// URIs of the keys under it (ListObjectsV2, paginated).
+        """
+        self.s3 = self.s3 or S3Config()
+        u = urlsplit(prefix_uri)
+        bucket, prefix = u.netloc, u.path.lstrip("/")
+        out, token = [], None
+        while True:
+            q = f"list-type=2&prefix={quote(prefix, safe='')}"
+            if token:
+                q += f"&continuation-token={quote(token, safe='')}"
+            url = self.s3.url(bucket, "", q)
+            root = ET.fromstring(await self._get(url, self.s3.headers("GET", url)))
+            ns = root.tag[:root.tag.index("}") + 1] if root.tag.startswith("{") else ""
+            out += [f"s3://{bucket}/{c.findtext(ns + 'Key')}" for c in root.iter(ns + "Contents")
+                    if c.findtext(ns + "Key", "").lower().endswith(suffix)]
+            token = root.findtext(ns + "NextContinuationToken")
+            if root.findtext(ns + "IsTruncated") != "true" or not token:
+                return sorted(out)
+
+    async def close(self):
+        await self.pool.close()
+        self._files.shutdown(wait=False)
+
+def decode_gray_bytes(data: bytes) -> np.ndarray:
+    return np.asarray(Image.open(io.BytesIO(data)).convert("L"))
+
+def read_bytes(uri: str, s3: Optional[S3Config] = None) -> bytes:
+    """
+    Blocking one-off fetch (local paths skip the event loop).
+    """
+    if not is_uri(uri):
+        return _read_bytes(uri)
+
+    async def one():
+        f = AsyncFetcher(concurrency=1, s3=s3)
+        try:
+            return await f.fetch(uri)
+        finally:
+            await f.close()
+    return asyncio.run(one())
+
+def list_uris(source: str, suffix: str = ".png", s3: Optional[S3Config] = None) -> List[str]:
+    """
+    URIs to fetch: an s3://bucket/prefix listing, or a text file with one URI per line.
+    """
+    if source.startswith("s3://"):
+        async def ls():
+            f = AsyncFetcher(concurrency=1, s3=s3)
+            try:
+                return await f.list_s3(source, suffix)
+            finally:
+                await f.close()
+        return asyncio.run(ls())
+    with open(source, "r") as f:
+        return [ln.strip() for ln in f if ln.strip() and not ln.startswith("#")]
+
+def fetch_batches(uris: Iterable[str], batch_size: int = 64, concurrency: int = 32, per_host: int = 8,
+                  decode_workers: int = 4, depth: int = 4, decode: Callable = decode_gray_bytes,
+                  s3: Optional[S3Config] = None, timeout: float = 30.0
+                  ) -> Iterator[Tuple[List[str], List[Optional[np.ndarray]], List[Optional[str]]]]:
+    """
+    Fetches on an asyncio loop in a background thread, decodes on
+    decode_workers threads (decode gets the raw bytes) and yields
+    (uris, arrays, errors) batches in input order, like prefetch_batches:
+    arrays[i] is None when errors[i] says why the URI could not be fetched or
+    decoded. At most `depth` batches are being fetched and `depth` decoded
+    batches wait in the queue.
+    """
+    q: "queue.Queue" = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    decoder = ThreadPoolExecutor(max_workers=decode_workers, thread_name_prefix="decode")
+
+    async def one(fetcher, uri):
+        try:
+            data = await fetcher.fetch(uri)
+        except Exception as e:  # missing objects / dropped connections are reported, not fatal
+            return None, f"{type(e).__name__}: {e}"
+        try:
+            return await asyncio.get_running_loop().run_in_executor(decoder, decode, data), None
+        except Exception as e:
+            return None, f"{type(e).__name__}: {e}"
+
+    async def produce():
+        loop = asyncio.get_running_loop()
+        fetcher = AsyncFetcher(concurrency, per_host, timeout, s3)
+        pending = deque()
+
+        async def emit():
+            batch, fut = pending.popleft()
+            res = await fut
+            await loop.run_in_executor(None, q.put, (batch, [r[0] for r in res], [r[1] for r in res]))
+
+        try:
+            batch: List[str] = []
+            for u in uris:
+                batch.append(u)
+                if len(batch) == batch_size:
+                    pending.append((batch, asyncio.gather(*(one(fetcher, x) for x in batch))))
+                    batch = []
+                    if len(pending) >= depth:
+                        await emit()
+                if stop.is_set():
+                    break
+            if batch and not stop.is_set():
+                pending.append((batch, asyncio.gather(*(one(fetcher, x) for x in batch))))
+            while pending and not stop.is_set():
+                await emit()
+            for _, fut in pending:
+                fut.cancel()
+        finally:
+            await fetcher.close()
+
+    def run():
+        try:
+            asyncio.run(produce())
+        except Exception as e:
+            q.put(e)
+        finally:
+            q.put(_DONE)
+
+    t = threading.Thread(target=run, daemon=True)
+    t.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        # drain so a blocked producer can observe `stop` and exit
+        while t.is_alive():
+            try:
+                q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        decoder.shutdown(wait=False)
@@ -0,0 +1,126 @@
+import os, json
+from typing import Dict, Iterator, List, Optional, Tuple
+
+MANIFEST_VERSION = 1
+
+def _sorted_entries(dir_path: str) -> List[os.DirEntry]:
+    with os.scandir(dir_path) as it:
+        return sorted(it, key=lambda e: e.name)
+
+def scan_classes(root_dir: str) -> List[str]:
+    """
+    Sorted class subfolder names of root_dir (one scandir call).
+    """
+    if not os.path.isdir(root_dir):
+        return []
+    return [e.name for e in _sorted_entries(root_dir) if e.is_dir()]
+
+def iter_class_items(root_dir: str, img_ext: str = ".png", classes: Optional[List[str]] = None,
+                     with_stat: bool = False) -> Iterator[Tuple]:
+    """
+    Lazily yields (image_path, class_index) for the root_dir/ClassX/*.png layout,
+    one class folder at a time. With with_stat=True also yields (size, mtime_ns).
+    """
+    if classes is None:
+        classes = scan_classes(root_dir)
+    for ci, cname in enumerate(classes):
+        for e in _sorted_entries(os.path.join(root_dir, cname)):
+            if not e.name.lower().endswith(img_ext):
+                continue
+            if with_stat:
+                st = e.stat()
+                yield (e.path, ci, st.st_size, st.st_mtime_ns)
+            else:
+                yield (e.path, ci)
+
+def iter_pairs(root_dir: str, img_ext: str = ".png", mask_ext: str = ".png",
+               with_stat: bool = False) -> Iterator[Tuple]:
+    """
+    Lazily yields (image_path, mask_path) for root_dir/{images,masks}. The mask
+    folder is listed once instead of one os.path.exists per image.
+    With with_stat=True also yields the image (size, mtime_ns).
+    """
+    images_dir = os.path.join(root_dir, "images")
+    masks_dir  = os.path.join(root_dir, "masks")
+    if not os.path.isdir(images_dir):
+        return
+    masks = set()
+    if os.path.isdir(masks_dir):
+        with os.scandir(masks_dir) as it:
+            masks = {e.name for e in it}
+    for e in _sorted_entries(images_dir):
+        if not e.name.endswith(img_ext):
+            continue
+        mask_fn = e.name.replace(img_ext, mask_ext)
+        if mask_fn not in masks:
+            continue
+        mask_p = os.path.join(masks_dir, mask_fn)
+        if with_stat:
+            st = e.stat()
+            yield (e.path, mask_p, st.st_size, st.st_mtime_ns)
+        else:
+            yield (e.path, mask_p)
+
+# ---------- manifest ----------
+def _dir_mtimes(dirs: List[str]) -> Dict[str, int]:
+    return {d: os.stat(d).st_mtime_ns for d in dirs}
+
+def _manifest_valid(m: Dict, kind: str, root_dir: str, exts: List[str]) -> bool:
+    if m.get("version") != MANIFEST_VERSION or m.get("kind") != kind:
+        return False
+    if m.get("root") != os.path.abspath(root_dir) or m.get("exts") != exts:
+        return False
+    try:
+        return _dir_mtimes(list(m["dirs"])) == m["dirs"]
+    except OSError:
+        return False
+
+def _read_manifest(path: str) -> Optional[Dict]:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_manifest(path: str, m: Dict):
+    d = os.path.dirname(path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(m, f)
+    os.replace(tmp, path)
+
+def class_folder_manifest(root_dir: str, img_ext: str, manifest_path: str) -> Dict:
+    """
+    Returns {"classes": [...], "items": [[path, label, size, mtime_ns], ...]}.
+    Reuses manifest_path when none of the scanned directory mtimes changed,
+    otherwise rescans root_dir and rewrites it.
+    """
+    m = _read_manifest(manifest_path)
+    if m is not None and _manifest_valid(m, "classes", root_dir, [img_ext]):
+        return m
+    classes = scan_classes(root_dir)
+    # stat dirs before listing so a concurrent write invalidates the manifest next time
+    dirs = _dir_mtimes([root_dir] + [os.path.join(root_dir, c) for c in classes])
+    items = [list(t) for t in iter_class_items(root_dir, img_ext, classes, with_stat=True)]
+    m = {"version": MANIFEST_VERSION, "kind": "classes", "root": os.path.abspath(root_dir),
+         "exts": [img_ext], "dirs": dirs, "classes": classes, "items": items}
+    _write_manifest(manifest_path, m)
+    return m
+
+def pairs_manifest(root_dir: str, img_ext: str, mask_ext: str, manifest_path: str) -> Dict:
+    """
+    Returns {"items": [[img_path, mask_path, size, mtime_ns], ...]}, cached like
+    class_folder_manifest.
+    """
+    m = _read_manifest(manifest_path)
+    if m is not None and _manifest_valid(m, "pairs", root_dir, [img_ext, mask_ext]):
+        return m
+    sub = [os.path.join(root_dir, "images"), os.path.join(root_dir, "masks")]
+    dirs = _dir_mtimes([d for d in [root_dir] + sub if os.path.isdir(d)])
+    items = [list(t) for t in iter_pairs(root_dir, img_ext, mask_ext, with_stat=True)]
+    m = {"version": MANIFEST_VERSION, "kind": "pairs", "root": os.path.abspath(root_dir),
+         "exts": [img_ext, mask_ext], "dirs": dirs, "items": items}
+    _write_manifest(manifest_path, m)
+    return m
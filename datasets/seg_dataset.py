@@ -0,0 +1,145 @@
+import random
+from typing import List, Optional, Tuple
+import numpy as np
+import torch
+from torch.utils.data import Dataset, DataLoader, IterableDataset, get_worker_info
+from PIL import Image
+from datasets.packed import PackedStore
+from datasets.shards import ShardedStore, open_store
+
+"""
+torch Dataset / DataLoader over list_pairs (or a packed pairs store). Images are
+decoded and augmented inside the DataLoader workers; augment ops come from the
+`augment:` section of configs/segmenter_unet.yaml:
+
+    random_flip:<p>      horizontal flip with probability p
+    random_rotate:<deg>  rotation by U(-deg, deg) (bilinear image, nearest mask)
+    center_crop:<size>   center crop (zero pad when smaller)
+"""
+
+def parse_augment(ops: Optional[List[str]]) -> List[Tuple[str, float]]:
+    out = []
+    for op in ops or []:
+        name, _, arg = op.partition(":")
+        if name not in ("random_flip", "random_rotate", "center_crop"):
+            raise ValueError(f"unknown augment op {op!r}")
+        out.append((name, float(arg) if arg else 0.0))
+    return out
+
+def _center_crop(a: np.ndarray, size: int) -> np.ndarray:
+    h, w = a.shape
+    if h < size or w < size:
+        ph, pw = max(0, size - h), max(0, size - w)
+        a = np.pad(a, ((ph // 2, ph - ph // 2), (pw // 2, pw - pw // 2)))
+        h, w = a.shape
+    y0, x0 = (h - size) // 2, (w - size) // 2
+    return a[y0:y0+size, x0:x0+size]
+
+def apply_augment(img: np.ndarray, mask: np.ndarray, ops, rng: random.Random):
+    for name, arg in ops:
+        if name == "random_flip":
+            if rng.random() < arg:
+                img, mask = img[:, ::-1], mask[:, ::-1]
+        elif name == "random_rotate":
+            angle = rng.uniform(-arg, arg)
+            img = np.asarray(Image.fromarray(np.ascontiguousarray(img)).rotate(angle, resample=Image.BILINEAR))
+            mask = np.asarray(Image.fromarray(np.ascontiguousarray(mask)).rotate(angle, resample=Image.NEAREST))
+        elif name == "center_crop":
+            img, mask = _center_crop(img, int(arg)), _center_crop(mask, int(arg))
+    return img, mask
+
+class SegmentationDataset(Dataset):
+    """
+    Items are (image [1,H,W] float32 in [0,1], mask [1,H,W] float32 in {0,1}).
+    Source is either a list of (img_path, mask_path) pairs or a PackedStore /
+    shard set prefix (zero-copy reads instead of PNG decode).
+    """
+    def __init__(self, pairs: Optional[List[Tuple[str, str]]] = None, store: Optional[str] = None,
+                 augment: Optional[List[str]] = None, seed: int = 0):
+        if (pairs is None) == (store is None):
+            raise ValueError("pass exactly one of pairs / store")
+        self.pairs, self.store_prefix = pairs, store
+        self._store = None
+        self.ops = parse_augment(augment)
+        self.seed = seed
+        self.epoch = 0
+
+    def __len__(self) -> int:
+        if self.pairs is not None:
+            return len(self.pairs)
+        return len(self._open())
+
+    def _open(self) -> PackedStore:
+        # opened lazily so each DataLoader worker maps the file itself
+        if self._store is None:
+            self._store = open_store(self.store_prefix)
+        return self._store
+
+    def __getstate__(self):
+        # never ship the memory map to workers (pickling it would copy the data)
+        state = dict(self.__dict__)
+        state["_store"] = None
+        return state
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+
+    def __getitem__(self, i: int):
+        if self.pairs is not None:
+            img_p, mask_p = self.pairs[i]
+            img = np.asarray(Image.open(img_p).convert("L"))
+            mask = np.asarray(Image.open(mask_p).convert("L"))
+        else:
+            st = self._open()
+            img, mask = st.image(i), st.mask(i)
+        # per-(epoch, index) stream: augmentation does not depend on worker count
+        rng = random.Random((self.seed * 1000003 + self.epoch) * 1000003 + i)
+        img, mask = apply_augment(img, mask, self.ops, rng)
+        return _to_tensors(img, mask)
+
+def _to_tensors(img: np.ndarray, mask: np.ndarray):
+    x = torch.from_numpy(np.ascontiguousarray(img, dtype=np.float32) / 255.0)[None]
+    y = torch.from_numpy((np.ascontiguousarray(mask) > 0).astype(np.float32))[None]
+    return x, y
+
+class ShardStreamDataset(IterableDataset):
+    """
+    Sequential stream over a pairs shard set (datasets/shards.py) through a
+    shuffle buffer; DataLoader workers split the shards between them. Use
+    instead of SegmentationDataset when random access per item is too slow
+    (network filesystems).
+    """
+    def __init__(self, prefix: str, augment: Optional[List[str]] = None, seed: int = 0, shuffle_buffer: int = 256):
+        self.prefix = prefix
+        self.ops = parse_augment(augment)
+        self.seed, self.shuffle_buffer = seed, shuffle_buffer
+        self.epoch = 0
+        st = ShardedStore(prefix)
+        self.n, self.n_shards = len(st), len(st.shard_prefixes)
+
+    def __len__(self) -> int:
+        return self.n
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+
+    def __iter__(self):
+        info = get_worker_info()
+        wid, nw = (info.id, info.num_workers) if info is not None else (0, 1)
+        st = ShardedStore(self.prefix)
+        rng = random.Random((self.seed * 1000003 + self.epoch) * 1000003 + wid)
+        for img, mask in st.iter_samples(self.shuffle_buffer, self.seed, self.epoch,
+                                         shards=list(range(wid, self.n_shards, nw))):
+            img, mask = apply_augment(img, mask, self.ops, rng)
+            yield _to_tensors(img, mask)
+
+def make_loader(ds: SegmentationDataset, batch_size: int, shuffle: bool, num_workers: int = 0,
+                seed: int = 0, pin_memory: bool = False, prefetch_factor: int = 2) -> DataLoader:
+    # workers are not persistent: they re-pickle the dataset each epoch and so see set_epoch()
+    g = torch.Generator()
+    g.manual_seed(seed)
+    kw = {"prefetch_factor": prefetch_factor} if num_workers > 0 else {}
+    if isinstance(ds, IterableDataset):
+        shuffle = False  # the stream shuffles itself
+    return DataLoader(ds, batch_size=batch_size, shuffle=shuffle, num_workers=num_workers,
+                      pin_memory=pin_memory, drop_last=False, generator=g, **kw)
@@ -0,0 +1,256 @@
+import argparse, bisect, json, os, random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from PIL import Image
+from datasets.loader_classifier import list_images_and_classes
+from datasets.loader_segmenter import list_pairs
+from datasets.packed import STORE_VERSION, PackedStore, append_array, write_index
+
+"""
+Sharded decoded-image stores for large datasets on network filesystems.
+
+A shard is an ordinary packed store (<prefix>-00000.bin / .json, see
+datasets/packed.py) capped at --shard_mb; <prefix>.shards.json lists the
+shards. Decode (and optional resize) runs in a process pool, the main process
+appends results to the current shard in input order, so output is the same for
+any worker count.
+
+    python -m datasets.shards --root data/synth_cls/train --out data/shards/cls_train --workers 8
+    python -m datasets.shards --root data/synth/train --layout pairs --out data/shards/seg_train --size 256
+
+ShardedStore has the PackedStore interface (image/mask/items/batch), so any
+--store / *_store option accepts a shard prefix too. iter_samples() streams the
+shards front to back (sequential reads) through a shuffle buffer.
+"""
+
+def _resize(a: np.ndarray, size: Optional[Tuple[int, int]], resample) -> np.ndarray:
+    if size is None or a.shape[::-1] == tuple(size):
+        return a
+    return np.asarray(Image.fromarray(a).resize(tuple(size), resample))
+
+def _load(args) -> List[np.ndarray]:
+    paths, size = args
+    out = [_resize(np.asarray(Image.open(paths[0]).convert("L")), size, Image.BOX)]
+    if len(paths) > 1:  # mask: nearest, so it stays binary
+        out.append(_resize(np.asarray(Image.open(paths[1]).convert("L")), size, Image.NEAREST))
+    return out
+
+def _load_chunk(args: List) -> List[List[np.ndarray]]:
+    return [_load(a) for a in args]
+
+class _ShardWriter:
+    def __init__(self, out_prefix: str, kind: str, classes: List[str], shard_bytes: int):
+        self.out_prefix, self.kind, self.classes, self.shard_bytes = out_prefix, kind, classes, shard_bytes
+        self.shards: List[Dict] = []
+        self.f = None
+
+    def _open(self):
+        self.name = f"{os.path.basename(self.out_prefix)}-{len(self.shards):05d}"
+        self.prefix = os.path.join(os.path.dirname(self.out_prefix), self.name)
+        self.f = open(self.prefix + ".bin", "wb")
+        self.pos = 0
+        self.idx = {"paths": [], "labels": [], "offsets": [], "shapes": [],
+                    "mask_paths": [], "mask_offsets": [], "mask_shapes": []}
+
+    def add(self, paths: Tuple[str, ...], label: Optional[int], arrs: List[np.ndarray]):
+        need = sum(a.size for a in arrs)
+        if self.f is not None and self.pos and self.pos + need > self.shard_bytes:
+            self._close()
+        if self.f is None:
+            self._open()
+        ix = self.idx
+        self.pos = append_array(self.f, arrs[0], ix["offsets"], ix["shapes"], self.pos)
+        ix["paths"].append(paths[0])
+        if self.kind == "pairs":
+            self.pos = append_array(self.f, arrs[1], ix["mask_offsets"], ix["mask_shapes"], self.pos)
+            ix["mask_paths"].append(paths[1])
+        else:
+            ix["labels"].append(label)
+
+    def _close(self):
+        self.f.close()
+        self.f = None
+        ix = self.idx
+        index = {"version": STORE_VERSION, "kind": self.kind, "paths": ix["paths"],
+                 "offsets": ix["offsets"], "shapes": ix["shapes"]}
+        if self.kind == "pairs":
+            index.update(mask_paths=ix["mask_paths"], mask_offsets=ix["mask_offsets"], mask_shapes=ix["mask_shapes"])
+        else:
+            index.update(classes=self.classes, labels=ix["labels"])
+        write_index(self.prefix, index)
+        self.shards.append({"name": self.name, "n": len(ix["paths"]), "bytes": self.pos})
+
+    def finish(self) -> Dict:
+        if self.f is not None:
+            self._close()
+        index = {"version": STORE_VERSION, "kind": self.kind, "classes": self.classes,
+                 "n": sum(s["n"] for s in self.shards), "shards": self.shards}
+        tmp = self.out_prefix + ".shards.json.tmp"
+        with open(tmp, "w") as f:
+            json.dump(index, f, indent=1)
+        os.replace(tmp, self.out_prefix + ".shards.json")
+        return index
+
+def pack_shards(root_dir: str, out_prefix: str, layout: str = "classes", img_ext: str = ".png",
+                mask_ext: str = ".png", shard_mb: float = 1024, workers: int = 4,
+                size: Optional[Tuple[int, int]] = None, chunksize: int = 32) -> Dict:
+    """
+    Packs a list_images_with_labels (layout="classes") or list_pairs
+    (layout="pairs") dataset into shards of at most shard_mb MiB (a single
+    oversized image still gets its own shard). size=(w, h) resizes on the way.
+    Returns the top-level index.
+    """
+    os.makedirs(os.path.dirname(out_prefix) or ".", exist_ok=True)
+    if layout == "classes":
+        items, classes = list_images_and_classes(root_dir, img_ext)
+        jobs = [((p,), ci) for p, ci in items]
+    else:
+        classes = []
+        jobs = [((ip, mp), None) for ip, mp in list_pairs(root_dir, img_ext, mask_ext)]
+    w = _ShardWriter(out_prefix, layout, classes, int(shard_mb * 1024 * 1024))
+    args = [(paths, size) for paths, _ in jobs]
+    if workers > 1:
+        # at most 2 * workers chunks in flight, so decoded arrays cannot pile up ahead of the writer
+        pending = deque()
+
+        def drain():
+            s, fut = pending.popleft()
+            for (paths, label), arrs in zip(jobs[s:s + chunksize], fut.result()):
+                w.add(paths, label, arrs)
+
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            for s in range(0, len(args), chunksize):
+                pending.append((s, ex.submit(_load_chunk, args[s:s + chunksize])))
+                if len(pending) >= 2 * workers:
+                    drain()
+            while pending:
+                drain()
+    else:
+        for (paths, label), a in zip(jobs, args):
+            w.add(paths, label, _load(a))
+    return w.finish()
+
+class ShardedStore:
+    """
+    PackedStore-compatible view over <prefix>.shards.json; shards are
+    memory-mapped on first use.
+    """
+    def __init__(self, prefix: str):
+        with open(prefix + ".shards.json", "r") as f:
+            self.index = json.load(f)
+        if self.index.get("version") != STORE_VERSION:
+            raise ValueError(f"unsupported shard index version in {prefix}.shards.json")
+        self.kind = self.index["kind"]
+        self.classes: List[str] = self.index.get("classes", [])
+        root = os.path.dirname(prefix)
+        self.shard_prefixes = [os.path.join(root, s["name"]) for s in self.index["shards"]]
+        self._starts = [0]
+        for s in self.index["shards"]:
+            self._starts.append(self._starts[-1] + s["n"])
+        self._open: Dict[int, PackedStore] = {}
+        self._paths: Optional[List[str]] = None
+        self._labels: Optional[List[int]] = None
+
+    def __len__(self) -> int:
+        return self._starts[-1]
+
+    def shard(self, k: int) -> PackedStore:
+        if k not in self._open:
+            self._open[k] = PackedStore(self.shard_prefixes[k])
+        return self._open[k]
+
+    def _locate(self, i: int) -> Tuple[int, int]:
+        k = bisect.bisect_right(self._starts, i) - 1
+        return k, i - self._starts[k]
+
+    def image(self, i: int) -> np.ndarray:
+        k, j = self._locate(i)
+        return self.shard(k).image(j)
+
+    def mask(self, i: int) -> np.ndarray:
+        k, j = self._locate(i)
+        return self.shard(k).mask(j)
+
+    @property
+    def paths(self) -> List[str]:
+        if self._paths is None:
+            self._paths = [p for k in range(len(self.shard_prefixes)) for p in self.shard(k).paths]
+        return self._paths
+
+    @property
+    def labels(self) -> List[int]:
+        if self._labels is None:
+            self._labels = [c for k in range(len(self.shard_prefixes)) for c in self.shard(k).labels]
+        return self._labels
+
+    def items(self) -> List[Tuple[str, int]]:
+        return list(zip(self.paths, self.labels))
+
+    def batch(self, start: int, stop: int) -> Optional[np.ndarray]:
+        # zero-copy only inside one shard; callers fall back to image(i) otherwise
+        if stop <= start:
+            return None
+        k, j = self._locate(start)
+        if stop > self._starts[k + 1]:
+            return None
+        return self.shard(k).batch(j, j + stop - start)
+
+    def iter_samples(self, shuffle_buffer: int = 0, seed: int = 0, epoch: int = 0,
+                     shards: Optional[List[int]] = None) -> Iterator[Tuple]:
+        """
+        Streams (image, label) or (image, mask) shard by shard. With
+        shuffle_buffer > 0 the shard order is shuffled per (seed, epoch) and
+        samples leave through a buffer of that many items (random pick,
+        replaced by the next read). `shards` restricts the stream, e.g. to one
+        DataLoader worker's share.
+        """
+        rng = random.Random(seed * 1000003 + epoch)
+        order = list(range(len(self.shard_prefixes))) if shards is None else list(shards)
+        if shuffle_buffer > 0:
+            rng.shuffle(order)
+
+        def stream():
+            for k in order:
+                st = self.shard(k)
+                for j in range(len(st)):
+                    yield (st.image(j), st.mask(j)) if self.kind == "pairs" else (st.image(j), st.labels[j])
+
+        if shuffle_buffer <= 0:
+            yield from stream()
+            return
+        buf: List[Tuple] = []
+        for s in stream():
+            if len(buf) < shuffle_buffer:
+                buf.append(s)
+                continue
+            r = rng.randrange(shuffle_buffer)
+            yield buf[r]
+            buf[r] = s
+        rng.shuffle(buf)
+        yield from buf
+
+def open_store(prefix: str):
+    """
+    ShardedStore when <prefix>.shards.json exists, else PackedStore.
+    """
+    if os.path.exists(prefix + ".shards.json"):
+        return ShardedStore(prefix)
+    return PackedStore(prefix)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--root", required=True, help="class-folder root or pairs root (images/, masks/)")
+    ap.add_argument("--out", required=True, help="output prefix (writes <out>-NNNNN.bin/.json and <out>.shards.json)")
+    ap.add_argument("--layout", choices=["classes", "pairs"], default="classes")
+    ap.add_argument("--img_ext", default=".png")
+    ap.add_argument("--mask_ext", default=".png")
+    ap.add_argument("--shard_mb", type=float, default=1024)
+    ap.add_argument("--workers", type=int, default=4, help="decode/resize processes")
+    ap.add_argument("--size", type=int, nargs="+", default=None, help="resize to W [H] while packing")
+    args = ap.parse_args()
+    size = None if args.size is None else (args.size[0], args.size[-1])
+    idx = pack_shards(args.root, args.out, args.layout, args.img_ext, args.mask_ext,
+                      args.shard_mb, args.workers, size)
+    print(f"Packed {idx['n']} items into {len(idx['shards'])} shards -> {args.out}.shards.json")
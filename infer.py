@@ -1,20 +1,158 @@
-import argparse, os, glob, shutil, yaml
+import argparse, io, os, csv, json, time, yaml
+from functools import partial
+from datasets.loader_classifier import class_names
+from datasets.prefetch import iter_image_files, prefetch_batches, decode_gray
+from utils.fullres import fullres_cfg, reference_size, decode_decimated
+from utils.rules import FEATURE_NAMES, detect_features_arrays, classify_batch, compile_rules, rule_table_from_cfg, feature_codes
+from utils.feature_cache import FeatureCache, codes_to_features
+from utils.cascade import cascade_cfg, classify_staged, partial_features, plan_for, staged_decode
 
-def main(cfg_path, images_dir):
+DEFAULT_CLASSES = ["AC", "BC", "PC", "PW", "T"]
+
+class PredictionWriter:
+    """
+    Streams one row per image to .csv or .jsonl (chosen by extension).
+    """
+    def __init__(self, path: str):
+        self.jsonl = path.endswith(".jsonl")
+        self.f = open(path, "w", newline="")
+        self.fields = ["path", "pred"] + FEATURE_NAMES + ["error"]
+        if not self.jsonl:
+            self.w = csv.writer(self.f)
+            self.w.writerow(self.fields)
+
+    def write(self, row: dict):
+        if self.jsonl:
+            self.f.write(json.dumps(row) + "\n")
+        else:
+            self.w.writerow([row.get(k, "") for k in self.fields])
+
+    def close(self):
+        self.f.close()
+
+def resolve_classes(cfg):
+    # explicit list in the config, else the val_dir class folders, else the synthetic default
+    return cfg["data"].get("classes") or class_names(cfg["data"].get("val_dir", "")) or DEFAULT_CLASSES
+
+def _chunks(it, n):
+    buf = []
+    for x in it:
+        buf.append(x)
+        if len(buf) == n:
+            yield buf
+            buf = []
+    if buf:
+        yield buf
+
+def _from_bytes(data: bytes, decode):
+    # remote fetches hand over bytes; the path decoders accept any file object
+    return decode(io.BytesIO(data))
+
+def run(cfg, images_dir: str, out_path: str, batch_size: int = 64, workers: int = 4, depth: int = 4):
+    """
+    images_dir is a local folder, an s3://bucket/prefix or a text file of
+    URIs (file:// / http(s):// / s3://, see datasets/remote.py); the latter
+    two are fetched asynchronously with the cfg `remote:` settings, through
+    one fetcher for the whole run (the feature cache only covers local folders).
+    """
+    classes = resolve_classes(cfg)
+    lut = compile_rules(classes, rule_table_from_cfg(cfg))
+    local = os.path.isdir(images_dir)
+    cache = FeatureCache.from_cfg(cfg) if local else None
+    writer = PredictionWriter(out_path)
+    n = n_err = 0
+    t0 = time.time()
+
+    def emit(batch_paths, feats, preds=None):
+        # cascade rows come with their predictions; features it skipped are None
+        preds = classify_batch(feats, classes, lut=lut) if preds is None else preds
+        for j, p in enumerate(batch_paths):
+            row = {"path": p, "pred": classes[preds[j]]}
+            row.update({k: None if feats[k][j] is None else bool(feats[k][j]) for k in FEATURE_NAMES})
+            writer.write(row)
+
+    try:
+        # in decimate mode the decoder threads downsample, so only reference-size arrays are queued
+        decimated = fullres_cfg(cfg)["mode"] == "decimate"
+        ext = cfg["data"].get("img_ext", ".png")
+        decode = partial(decode_decimated, size=reference_size(cfg)) if decimated else decode_gray
+        casc = cascade_cfg(cfg)
+        if casc["enabled"]:
+            # draft bounds live on the reference frame, i.e. only hold for decimated images
+            plans = plan_for(cfg, classes)
+            decode = partial(staged_decode, cfg=cfg, classes=classes, decode_full=decode,
+                             draft_scale=casc["draft_scale"] if decimated else 0, margin=casc["margin"], plans=plans)
+        if local:
+            paths = iter_image_files(images_dir, ext)
+            batches = lambda w: prefetch_batches(w, batch_size, workers, depth, decode)
+        else:
+            # asyncio / ssl are only imported for remote sources
+            from datasets.remote import S3Config, fetch_batches, list_uris
+            r = cfg.get("remote") or {}
+            s3 = S3Config(r.get("s3_endpoint"), r.get("s3_region"))
+            paths = list_uris(images_dir, ext, s3)
+            batches = lambda w: fetch_batches(w, batch_size, int(r.get("concurrency", 32)), int(r.get("per_host", 8)),
+                                              workers, depth, partial(_from_bytes, decode=decode), s3,
+                                              float(r.get("timeout", 30.0)))
+        # with a cache, each window of paths is looked up first and only the misses are decoded
+        for window in (_chunks(paths, batch_size * depth) if cache is not None else [paths]):
+            keys = {}
+            if cache is not None:
+                ks = cache.keys(window)
+                found = cache.get_many(ks)
+                hit = [i for i, k in enumerate(ks) if k in found]
+                if hit:
+                    emit([window[i] for i in hit], codes_to_features([found[ks[i]] for i in hit]))
+                    n += len(hit)
+                keys = {p: k for p, k in zip(window, ks) if k not in found}
+                window = list(keys)
+            for batch_paths, arrs, errors in batches(window):
+                ok = [i for i, a in enumerate(arrs) if a is not None]
+                if ok and casc["enabled"]:
+                    pred, mask, vals = classify_staged([arrs[i] for i in ok], cfg, classes, plans)
+                    emit([batch_paths[i] for i in ok], partial_features(mask, vals), pred)
+                    # only images whose five features were all computed at full resolution are cached
+                    if cache is not None and not casc["draft_scale"]:
+                        done = [j for j, m in enumerate(mask.tolist()) if m == (1 << len(FEATURE_NAMES)) - 1]
+                        cache.put_many([keys[batch_paths[ok[j]]] for j in done], vals[done])
+                elif ok:
+                    feats = detect_features_arrays([arrs[i] for i in ok], cfg)
+                    emit([batch_paths[i] for i in ok], feats)
+                    if cache is not None:
+                        cache.put_many([keys[batch_paths[i]] for i in ok], feature_codes(feats))
+                for i, err in enumerate(errors):
+                    if err is not None:
+                        writer.write({"path": batch_paths[i], "pred": "", "error": err})
+                        n_err += 1
+                n += len(batch_paths)
+    finally:
+        writer.close()
+        if cache is not None:
+            cache.evict()
+            cache.close()
+    return n, n_err, time.time() - t0
+
+def main(cfg_path, images_dir, out_path=None, batch_size=64, workers=4):
     cfg = yaml.safe_load(open(cfg_path, 'r'))
-    os.makedirs(cfg["viz_dir"], exist_ok=True)
-    imgs = glob.glob(os.path.join(images_dir, "*.png"))
-    if not imgs:
+    if not (os.path.isdir(images_dir) or os.path.isfile(images_dir) or images_dir.startswith("s3://")):
+        print(f"Not a folder, URI list or s3:// prefix: {images_dir}")
+        return
+    if out_path is None:
+        out_path = os.path.join(cfg["output"]["log_dir"], "predictions.csv")
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    n, n_err, dt = run(cfg, images_dir, out_path, batch_size, workers)
+    if n == 0:
         print("No PNG images found. Provide a folder of .png images.")
         return
-    for i, p in enumerate(imgs[:5]):
-        dst = os.path.join(cfg["viz_dir"], f"pred_{i}.png")
-        shutil.copy(p, dst)
-    print(f"Saved {min(5, len(imgs))} mock predictions to {cfg['viz_dir']}")
+    print(f"Classified {n - n_err} images ({n_err} unreadable) -> {out_path}")
+    print(f"Throughput: {n / dt if dt > 0 else 0.0:.1f} images/s ({dt:.2f}s)")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--cfg", default="configs/segmenter_unet.yaml")
-    parser.add_argument("--images", required=True, help="folder of PNGs")
+    parser.add_argument("--cfg", default="configs/classifier_letournel.yaml")
+    parser.add_argument("--images", required=True, help="folder of PNGs, s3://bucket/prefix, or a text file of URIs")
+    parser.add_argument("--out", default=None, help="predictions .csv or .jsonl (default: <log_dir>/predictions.csv)")
+    parser.add_argument("--batch_size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=4, help="decoder threads (fetch concurrency: cfg remote:)")
     args = parser.parse_args()
-    main(args.cfg, args.images)
+    main(args.cfg, args.images, args.out, args.batch_size, args.workers)
@@ -0,0 +1,73 @@
+from typing import Dict, List
+import numpy as np
+
+# SVM baseline on the utils/features.py ROI features (configs/classifier_sklearn.yaml).
+# sklearn is imported inside the functions so the rule path never loads it.
+
+def _large(cfg: Dict, n_samples: int) -> bool:
+    return n_samples > int(cfg.get("model", {}).get("nystroem_above", 20000))
+
+def build_model(cfg: Dict, n_samples: int = 0):
+    """
+    StandardScaler + exact SVC. Above model.nystroem_above training samples
+    (default 20000) exact kernel training (quadratic in the sample count) is
+    replaced by a Nystroem RBF feature map (rbf kernel only) and a hinge-loss
+    SGD linear SVM with alpha = 1 / (C * n_samples).
+    """
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.svm import SVC
+    m = cfg.get("model", {})
+    kernel = m.get("kernel", "rbf")
+    C = float(m.get("C", 1.0))
+    gamma = m.get("gamma", "scale")
+    gamma = gamma if isinstance(gamma, str) else float(gamma)
+    seed = int(cfg.get("seed", 0))
+    if not _large(cfg, n_samples):
+        return Pipeline([("scale", StandardScaler()), ("svc", SVC(kernel=kernel, C=C, gamma=gamma))])
+    from sklearn.linear_model import SGDClassifier
+    steps = [("scale", StandardScaler())]
+    if kernel == "rbf":
+        from sklearn.kernel_approximation import Nystroem
+        # gamma=None is 1 / n_features, i.e. SVC's "scale" on standardized features
+        steps.append(("map", Nystroem(gamma=None if isinstance(gamma, str) else gamma,
+                                      n_components=int(m.get("n_components", 300)), random_state=seed)))
+    elif kernel != "linear":
+        raise ValueError(f"kernel {kernel!r} is not supported above nystroem_above samples")
+    steps.append(("svc", SGDClassifier(loss="hinge", alpha=1.0 / (C * n_samples), random_state=seed)))
+    return Pipeline(steps)
+
+def param_grid(cfg: Dict, n_samples: int = 0, large: bool = None) -> Dict[str, List]:
+    """
+    model.grid: {C: [...], gamma: [...]} -> GridSearchCV grid. For the large
+    model C becomes the SGD alpha and gamma moves to the Nystroem map.
+    """
+    grid = cfg.get("model", {}).get("grid") or {}
+    vals = {k: [v if isinstance(v, str) else float(v) for v in vs] for k, vs in grid.items()}
+    if not (_large(cfg, n_samples) if large is None else large):
+        return {f"svc__{k}": v for k, v in vals.items()}
+    out = {}
+    if "C" in vals:
+        out["svc__alpha"] = [1.0 / (c * n_samples) for c in vals["C"]]
+    if "gamma" in vals and cfg.get("model", {}).get("kernel", "rbf") == "rbf":
+        out["map__gamma"] = [None if isinstance(g, str) else g for g in vals["gamma"]]
+    return out
+
+def fit(cfg: Dict, X: np.ndarray, y: np.ndarray, workers: int = 1):
+    """
+    Fits the model; with model.grid set, picks the parameters by
+    model.cv-fold (default 5) stratified cross-validation run over `workers`
+    processes. Returns (fitted estimator, cv results dict or None).
+    """
+    from sklearn.model_selection import GridSearchCV, StratifiedKFold
+    model = build_model(cfg, len(X))
+    cv = int(cfg.get("model", {}).get("cv", 5))
+    # alpha is scaled by the size of a training fold, not of the whole set
+    grid = param_grid(cfg, len(X) * (cv - 1) // cv, large=_large(cfg, len(X)))
+    if not grid:
+        return model.fit(X, y), None
+    folds = StratifiedKFold(n_splits=cv, shuffle=True, random_state=int(cfg.get("seed", 0)))
+    search = GridSearchCV(model, grid, cv=folds, n_jobs=workers, refit=True)
+    search.fit(X, y)
+    return search.best_estimator_, {"best_params": search.best_params_, "best_score": float(search.best_score_),
+                                    "cv_results": search.cv_results_}
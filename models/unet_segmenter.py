@@ -1,2 +1,57 @@
-# Placeholder file. For a torch-based UNet, plug your implementation here.
-# The repo supports a dummy training mode that does not require PyTorch.
\ No newline at end of file
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+# Small 2D UNet for the toy segmentation task (1-channel in, 1 logit map out).
+# Only imported by the torch training path; the dummy mode in train.py does not need it.
+
+class ConvBlock(nn.Module):
+    def __init__(self, c_in: int, c_out: int):
+        super().__init__()
+        self.net = nn.Sequential(
+            nn.Conv2d(c_in, c_out, 3, padding=1, bias=False),
+            nn.BatchNorm2d(c_out),
+            nn.ReLU(inplace=True),
+            nn.Conv2d(c_out, c_out, 3, padding=1, bias=False),
+            nn.BatchNorm2d(c_out),
+            nn.ReLU(inplace=True),
+        )
+    def forward(self, x):
+        return self.net(x)
+
+class UNet(nn.Module):
+    def __init__(self, in_channels: int = 1, out_channels: int = 1, base_channels: int = 16, depth: int = 3):
+        super().__init__()
+        chs = [base_channels * 2**i for i in range(depth + 1)]
+        self.downs = nn.ModuleList()
+        c = in_channels
+        for ch in chs[:-1]:
+            self.downs.append(ConvBlock(c, ch))
+            c = ch
+        self.bottom = ConvBlock(chs[-2], chs[-1])
+        self.ups = nn.ModuleList()
+        self.up_blocks = nn.ModuleList()
+        for ch in reversed(chs[:-1]):
+            self.ups.append(nn.ConvTranspose2d(ch * 2, ch, 2, stride=2))
+            self.up_blocks.append(ConvBlock(ch * 2, ch))
+        self.head = nn.Conv2d(chs[0], out_channels, 1)
+
+    def forward(self, x):
+        skips = []
+        for down in self.downs:
+            x = down(x)
+            skips.append(x)
+            x = F.max_pool2d(x, 2)
+        x = self.bottom(x)
+        for up, block, skip in zip(self.ups, self.up_blocks, reversed(skips)):
+            x = up(x)
+            if x.shape[-2:] != skip.shape[-2:]:
+                # odd input sizes: pad the upsampled map to the skip size
+                x = F.pad(x, [0, skip.shape[-1] - x.shape[-1], 0, skip.shape[-2] - x.shape[-2]])
+            x = block(torch.cat([skip, x], dim=1))
+        return self.head(x)
+
+def build_model(cfg) -> nn.Module:
+    m = cfg.get("model", {})
+    return UNet(in_channels=1, out_channels=1,
+                base_channels=int(m.get("base_channels", 16)), depth=int(m.get("depth", 3)))
@@ -1,42 +1,58 @@
 import argparse, os, random
+from multiprocessing import Pool
+import numpy as np
 from PIL import Image, ImageDraw
-random.seed(2025)
 
-def draw_blob(draw, w, h):
-    rw, rh = random.randint(int(0.2*w), int(0.5*w)), random.randint(int(0.2*h), int(0.5*h))
-    x0 = random.randint(10, w-rw-10)
-    y0 = random.randint(10, h-rh-10)
+SEED = 2025
+
+def sample_rng(seed: int, i: int) -> random.Random:
+    # independent stream per sample -> same output for any worker count / order
+    return random.Random(seed * 1000003 + i)
+
+def draw_blob(draw, w, h, rng=random):
+    rw, rh = rng.randint(int(0.2*w), int(0.5*w)), rng.randint(int(0.2*h), int(0.5*h))
+    x0 = rng.randint(10, w-rw-10)
+    y0 = rng.randint(10, h-rh-10)
     draw.ellipse([x0, y0, x0+rw, y0+rh], fill=255)
 
-def generate_pair(w=256, h=256):
-    img = Image.new("L", (w,h), 0)
+def _texture(w, h):
+    yy, xx = np.indices((h, w))
+    return (120 + (xx + yy) % 40).astype(np.uint8)
+
+def generate_pair(w=256, h=256, rng=random):
     mask = Image.new("L", (w,h), 0)
     draw_m = ImageDraw.Draw(mask)
-    draw_blob(draw_m, w, h)
-    for y in range(h):
-        for x in range(w):
-            if mask.getpixel((x,y))>0:
-                img.putpixel((x,y), 120 + (x+y)%40)
-    return img, mask
-
-def main(out_dir, n):
+    draw_blob(draw_m, w, h, rng)
+    img = np.where(np.asarray(mask) > 0, _texture(w, h), 0).astype(np.uint8)
+    return Image.fromarray(img), mask
+
+def _save_one(args):
+    i, n, out_dir, seed = args
+    img, mask = generate_pair(rng=sample_rng(seed, i))
+    split = "train" if i < int(0.8*n) else "val"
+    img.save(os.path.join(out_dir, split, "images", f"{i:04d}.png"))
+    mask.save(os.path.join(out_dir, split, "masks", f"{i:04d}.png"))
+
+def main(out_dir, n, workers=1, seed=SEED):
     tr_img = os.path.join(out_dir, "train/images"); tr_msk = os.path.join(out_dir, "train/masks")
     va_img = os.path.join(out_dir, "val/images");   va_msk = os.path.join(out_dir, "val/masks")
     for d in [tr_img, tr_msk, va_img, va_msk]:
         os.makedirs(d, exist_ok=True)
-    for i in range(n):
-        img, mask = generate_pair()
-        if i < int(0.8*n):
-            img.save(os.path.join(tr_img, f"{i:04d}.png"))
-            mask.save(os.path.join(tr_msk, f"{i:04d}.png"))
-        else:
-            img.save(os.path.join(va_img, f"{i:04d}.png"))
-            mask.save(os.path.join(va_msk, f"{i:04d}.png"))
+    tasks = [(i, n, out_dir, seed) for i in range(n)]
+    if workers > 1:
+        with Pool(workers) as pool:
+            for _ in pool.imap_unordered(_save_one, tasks, chunksize=max(1, n // (workers * 8))):
+                pass
+    else:
+        for t in tasks:
+            _save_one(t)
     print(f"Generated {n} pairs at {out_dir}")
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("--out", default="data/synth")
     ap.add_argument("--n", type=int, default=64)
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--seed", type=int, default=SEED)
     args = ap.parse_args()
-    main(args.out, args.n)
\ No newline at end of file
+    main(args.out, args.n, args.workers, args.seed)
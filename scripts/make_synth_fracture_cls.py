@@ -1,4 +1,7 @@
-import argparse, os
+import argparse, os, io
+from functools import lru_cache
+from multiprocessing import Pool
+import numpy as np
 from PIL import Image, ImageDraw
 
 """
@@ -15,12 +18,12 @@ Classes created:
 
 W, H = 256, 256
 
+# diagonal (x + y) % 37 == 0 pattern as a paste mask
+_NOISE_MASK = Image.fromarray(((np.add.outer(np.arange(H), np.arange(W)) % 37 == 0) * 255).astype(np.uint8))
+
 def draw_background_noise(img: Image.Image, level: int = 50):
     # very light noise-ish background so lines stand out
-    for y in range(H):
-        for x in range(W):
-            if (x + y) % 37 == 0:
-                img.putpixel((x, y), level)
+    img.paste(level, (0, 0, W, H), _NOISE_MASK)
 
 def draw_line(draw: ImageDraw.ImageDraw, y: int, broken: bool):
     """
@@ -103,23 +106,40 @@ def make_image(label: str) -> Image.Image:
 
     return img
 
-def main(out_dir: str, n_per_class: int):
+@lru_cache(maxsize=None)
+def _encoded(label: str) -> bytes:
+    # make_image has no randomness, so each class is encoded once per process
+    buf = io.BytesIO()
+    make_image(label).save(buf, format="PNG")
+    return buf.getvalue()
+
+def _save_one(args):
+    out_dir, c, i, n_per_class = args
+    split = "train" if i < int(0.8 * n_per_class) else "val"
+    with open(os.path.join(out_dir, split, c, f"{c}_{i:04d}.png"), "wb") as f:
+        f.write(_encoded(c))
+
+def main(out_dir: str, n_per_class: int, workers: int = 1):
     classes = ["AC", "PC", "PW", "T", "BC"]
     for split in ["train", "val"]:
         for c in classes:
             os.makedirs(os.path.join(out_dir, split, c), exist_ok=True)
 
     # generate images
-    for c in classes:
-        for i in range(n_per_class):
-            img = make_image(c)
-            split = "train" if i < int(0.8 * n_per_class) else "val"
-            img.save(os.path.join(out_dir, split, c, f"{c}_{i:04d}.png"))
+    tasks = [(out_dir, c, i, n_per_class) for c in classes for i in range(n_per_class)]
+    if workers > 1:
+        with Pool(workers) as pool:
+            for _ in pool.imap_unordered(_save_one, tasks, chunksize=max(1, len(tasks) // (workers * 8))):
+                pass
+    else:
+        for t in tasks:
+            _save_one(t)
     print(f"Generated {n_per_class} images per class at {out_dir}")
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("--out", default="data/synth_cls")
     ap.add_argument("--n_per_class", type=int, default=40)
+    ap.add_argument("--workers", type=int, default=1)
     args = ap.parse_args()
-    main(args.out, args.n_per_class)
+    main(args.out, args.n_per_class, args.workers)
@@ -1,17 +1,25 @@
-import argparse, os, random
+import argparse, os, io, random
+from functools import lru_cache
+from multiprocessing import Pool
+import numpy as np
 from PIL import Image, ImageDraw
 
-# Reproducible seed
-random.seed(2025)
+# Reproducible seed; each sample gets its own stream (see _sample_rng)
+SEED = 2025
 
 W, H = 256, 256
 
+_YY, _XX = np.indices((H, W))
+_NOISE_MASK = Image.fromarray(((_XX + _YY) % 37 == 0).astype(np.uint8) * 255)
+_TEXTURE = (120 + (_XX + _YY) % 40).astype(np.uint8)
+
+def _sample_rng(seed, i):
+    # same output for any worker count / order
+    return random.Random(seed * 1000003 + i)
+
 # ---------- low-level helpers ----------
 def _noise_bg(img, level=40):
-    for y in range(H):
-        for x in range(W):
-            if (x + y) % 37 == 0:
-                img.putpixel((x, y), level)
+    img.paste(level, (0, 0, W, H), _NOISE_MASK)
 
 def _bright_rect(draw, xy, val=230):
     draw.rectangle(xy, fill=val)
@@ -34,21 +42,18 @@ def _iliac_wing_mark(draw):
     draw.polygon([(25, 25), (65, 25), (25, 65)], fill=210)
 
 # ---------- segmentation pair (blob) ----------
-def gen_seg_pair():
+def gen_seg_pair(rng=random):
     img = Image.new("L", (W, H), 0)
     mask = Image.new("L", (W, H), 0)
     _noise_bg(img)
     # oval "organ-like" blob as mask
     draw_m = ImageDraw.Draw(mask)
-    rw, rh = random.randint(60, 120), random.randint(60, 120)
-    x0 = random.randint(20, W - rw - 20)
-    y0 = random.randint(20, H - rh - 20)
+    rw, rh = rng.randint(60, 120), rng.randint(60, 120)
+    x0 = rng.randint(20, W - rw - 20)
+    y0 = rng.randint(20, H - rh - 20)
     draw_m.ellipse([x0, y0, x0 + rw, y0 + rh], fill=255)
     # paint brighter texture inside mask
-    for y in range(H):
-        for x in range(W):
-            if mask.getpixel((x, y)) > 0:
-                img.putpixel((x, y), 120 + ((x + y) % 40))
+    img.paste(Image.fromarray(_TEXTURE), (0, 0, W, H), mask)
     return img, mask
 
 # ---------- classification image (Letournel cues; toy) ----------
@@ -83,30 +88,48 @@ def gen_cls_image(label):
         _spur(draw)
     return img
 
-def save_seg_dataset(out_dir, n=64):
+@lru_cache(maxsize=None)
+def _encoded_cls(label):
+    # gen_cls_image is deterministic: encode each class once per process
+    buf = io.BytesIO()
+    gen_cls_image(label).save(buf, format="PNG")
+    return buf.getvalue()
+
+def _save_seg(args):
+    out_dir, i, n, seed = args
+    img, msk = gen_seg_pair(_sample_rng(seed, i))
+    split = "train" if i < int(0.8 * n) else "val"
+    img.save(os.path.join(out_dir, split, "images", f"{i:04d}.png"))
+    msk.save(os.path.join(out_dir, split, "masks", f"{i:04d}.png"))
+
+def _save_cls(args):
+    out_dir, c, i, n_per_class = args
+    split = "train" if i < int(0.8 * n_per_class) else "val"
+    with open(os.path.join(out_dir, split, c, f"{c}_{i:04d}.png"), "wb") as f:
+        f.write(_encoded_cls(c))
+
+def _run(fn, tasks, workers):
+    if workers > 1:
+        with Pool(workers) as pool:
+            for _ in pool.imap_unordered(fn, tasks, chunksize=max(1, len(tasks) // (workers * 8))):
+                pass
+    else:
+        for t in tasks:
+            fn(t)
+
+def save_seg_dataset(out_dir, n=64, workers=1, seed=SEED):
     tr_img = os.path.join(out_dir, "train/images"); tr_msk = os.path.join(out_dir, "train/masks")
     va_img = os.path.join(out_dir, "val/images");   va_msk = os.path.join(out_dir, "val/masks")
     for d in [tr_img, tr_msk, va_img, va_msk]:
         os.makedirs(d, exist_ok=True)
-    for i in range(n):
-        img, msk = gen_seg_pair()
-        if i < int(0.8 * n):
-            img.save(os.path.join(tr_img, f"{i:04d}.png"))
-            msk.save(os.path.join(tr_msk, f"{i:04d}.png"))
-        else:
-            img.save(os.path.join(va_img, f"{i:04d}.png"))
-            msk.save(os.path.join(va_msk, f"{i:04d}.png"))
-
-def save_cls_dataset(out_dir, n_per_class=40):
+    _run(_save_seg, [(out_dir, i, n, seed) for i in range(n)], workers)
+
+def save_cls_dataset(out_dir, n_per_class=40, workers=1):
     classes = ["AC", "PC", "PW", "T", "BC"]
     for split in ["train", "val"]:
         for c in classes:
             os.makedirs(os.path.join(out_dir, split, c), exist_ok=True)
-    for c in classes:
-        for i in range(n_per_class):
-            img = gen_cls_image(c)
-            split = "train" if i < int(0.8 * n_per_class) else "val"
-            img.save(os.path.join(out_dir, split, c, f"{c}_{i:04d}.png"))
+    _run(_save_cls, [(out_dir, c, i, n_per_class) for c in classes for i in range(n_per_class)], workers)
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
@@ -114,7 +137,9 @@ if __name__ == "__main__":
     ap.add_argument("--seg_n", type=int, default=64)
     ap.add_argument("--cls_out", default="data/synth_cls")
     ap.add_argument("--cls_n_per_class", type=int, default=40)
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--seed", type=int, default=SEED)
     args = ap.parse_args()
-    save_seg_dataset(args.seg_out, args.seg_n)
-    save_cls_dataset(args.cls_out, args.cls_n_per_class)
+    save_seg_dataset(args.seg_out, args.seg_n, args.workers, args.seed)
+    save_cls_dataset(args.cls_out, args.cls_n_per_class, args.workers)
     print(f"[OK] segmentation pairs -> {args.seg_out} ; classification -> {args.cls_out}")
@@ -0,0 +1,157 @@
+import argparse, io, json, os, queue, socketserver, threading, time, yaml
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+import numpy as np
+from PIL import Image
+from utils.rules import FEATURE_NAMES, detect_features_arrays, classify_batch, compile_rules, rule_table_from_cfg
+from infer import resolve_classes
+
+"""
+Long-running rule classifier. The config is parsed once; concurrent requests
+are micro-batched into one detect_features_arrays call.
+
+    python serve.py --cfg configs/classifier_letournel.yaml --port 8765
+    python serve.py --unix /tmp/acetab.sock
+
+    curl --data-binary @img.png -H "Content-Type: image/png" localhost:8765/classify
+    curl -d '{"paths": ["a.png", "b.png"]}' localhost:8765/classify
+"""
+
+class MicroBatcher:
+    """
+    Collects single images from many threads and classifies them together:
+    a batch is flushed when it reaches max_batch or max_wait_ms after its first item.
+    """
+    def __init__(self, cfg, classes: List[str], max_batch: int = 64, max_wait_ms: float = 5.0):
+        self.cfg, self.classes = cfg, classes
+        self.lut = compile_rules(classes, rule_table_from_cfg(cfg))
+        self.max_batch, self.max_wait = max_batch, max_wait_ms / 1000.0
+        self.q: "queue.Queue" = queue.Queue()
+        self.batches = self.images = 0
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def submit(self, arr: np.ndarray) -> Future:
+        fut: Future = Future()
+        self.q.put((arr, fut))
+        return fut
+
+    def _loop(self):
+        while True:
+            items = [self.q.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(items) < self.max_batch:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                try:
+                    items.append(self.q.get(timeout=left))
+                except queue.Empty:
+                    break
+            self._run(items)
+
+    def _run(self, items):
+        try:
+            feats = detect_features_arrays([a for a, _ in items], self.cfg)
+            preds = classify_batch(feats, self.classes, lut=self.lut)
+        except Exception as e:
+            for _, fut in items:
+                fut.set_exception(e)
+            return
+        self.batches += 1; self.images += len(items)
+        for j, (_, fut) in enumerate(items):
+            fut.set_result({
+                "class": self.classes[preds[j]],
+                "features": {k: bool(feats[k][j]) for k in FEATURE_NAMES},
+            })
+
+class Handler(BaseHTTPRequestHandler):
+    batcher: MicroBatcher = None
+    timeout_s = 30.0
+
+    def address_string(self):
+        # client_address is "" on a Unix socket
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _reply(self, code: int, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            b = self.batcher
+            self._reply(200, {"ok": True, "images": b.images, "batches": b.batches})
+        else:
+            self._reply(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/classify":
+            return self._reply(404, {"error": "not found"})
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        ctype = self.headers.get("Content-Type", "")
+        try:
+            if ctype.startswith("application/json"):
+                req = json.loads(body)
+                paths = req["paths"] if "paths" in req else [req["path"]]
+                arrs = [np.asarray(Image.open(p).convert("L")) for p in paths]
+            else:
+                paths = None
+                arrs = [np.asarray(Image.open(io.BytesIO(body)).convert("L"))]
+        except Exception as e:
+            return self._reply(400, {"error": f"{type(e).__name__}: {e}"})
+        futs = [self.batcher.submit(a) for a in arrs]
+        try:
+            results = [f.result(timeout=self.timeout_s) for f in futs]
+        except Exception as e:
+            return self._reply(500, {"error": f"{type(e).__name__}: {e}"})
+        if paths is None:
+            return self._reply(200, results[0])
+        for p, r in zip(paths, results):
+            r["path"] = p
+        self._reply(200, {"results": results})
+
+class TCPServer(ThreadingHTTPServer):
+    request_queue_size = 128   # listen backlog; the default of 5 resets bursts of clients
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+def make_server(cfg, host="127.0.0.1", port=8765, unix_path=None, max_batch=64, max_wait_ms=5.0):
+    Handler.batcher = MicroBatcher(cfg, resolve_classes(cfg), max_batch, max_wait_ms)
+    if unix_path:
+        if os.path.exists(unix_path):
+            os.remove(unix_path)
+        return UnixHTTPServer(unix_path, Handler)
+    return TCPServer((host, port), Handler)
+
+def main(cfg_path, host, port, unix_path, max_batch, max_wait_ms):
+    cfg = yaml.safe_load(open(cfg_path, "r"))
+    srv = make_server(cfg, host, port, unix_path, max_batch, max_wait_ms)
+    print(f"Serving on {unix_path or f'http://{host}:{port}'} (max_batch={max_batch}, max_wait={max_wait_ms}ms)")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.server_close()
+        if unix_path and os.path.exists(unix_path):
+            os.remove(unix_path)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cfg", default="configs/classifier_letournel.yaml")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--unix", default=None, help="listen on this Unix socket path instead of TCP")
+    ap.add_argument("--max_batch", type=int, default=64)
+    ap.add_argument("--max_wait_ms", type=float, default=5.0, help="how long a batch waits for more requests")
+    args = ap.parse_args()
+    main(args.cfg, args.host, args.port, args.unix, args.max_batch, args.max_wait_ms)
@@ -0,0 +1,275 @@
+import asyncio, hashlib, hmac, io, os, sys, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, quote, unquote, urlsplit
+import numpy as np
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from datasets.remote import AsyncFetcher, S3Config, fetch_batches, list_uris, read_bytes
+
+"""
+datasets/remote.py against local stand-ins: a plain HTTP/1.1 server (keep-alive,
+chunked bodies, 404 / 5xx) and a minimal S3 mock that verifies SigV4 headers
+and pages ListObjectsV2 results.
+
+    python -m pytest -q tests
+"""
+
+def _png(v: int) -> bytes:
+    buf = io.BytesIO()
+    Image.fromarray(np.full((8, 12), v, dtype=np.uint8)).save(buf, format="PNG")
+    return buf.getvalue()
+
+IMAGES = {f"{i:03d}.png": _png(i) for i in range(40)}
+
+class _Server:
+    """
+    ThreadingHTTPServer on 127.0.0.1 with connection / in-flight request counters.
+    """
+    def __init__(self, handler):
+        self.conns = 0
+        self.inflight = self.max_inflight = 0
+        self.requests = []
+        self.lock = threading.Lock()
+        handler.state = self
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: _Server = None
+    delay = 0.0
+
+    def setup(self):
+        super().setup()
+        with self.state.lock:
+            self.state.conns += 1
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, status: int, body: bytes, ctype: str = "application/octet-stream"):
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        st = self.state
+        with st.lock:
+            st.inflight += 1
+            st.max_inflight = max(st.max_inflight, st.inflight)
+            st.requests.append(self.path)
+        try:
+            if self.delay:
+                time.sleep(self.delay)
+            self.route()
+        finally:
+            with st.lock:
+                st.inflight -= 1
+
+class HttpHandler(_Handler):
+    def route(self):
+        kind, _, name = self.path.lstrip("/").partition("/")
+        if kind == "img" and name in IMAGES:
+            self.send_body(200, IMAGES[name], "image/png")
+        elif kind == "chunked" and name in IMAGES:
+            self.send_response(200)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            data = IMAGES[name]
+            for s in range(0, len(data), 7):
+                part = data[s:s + 7]
+                self.wfile.write(b"%x;ext=1\r\n%s\r\n" % (len(part), part))
+            self.wfile.write(b"0\r\nX-Trailer: 1\r\n\r\n")
+        elif kind == "boom":
+            self.send_body(503, b"unavailable")
+        else:
+            self.send_body(404, b"not found")
+
+class SlowHandler(HttpHandler):
+    delay = 0.05
+
+@pytest.fixture
+def http_server():
+    srv = _Server(HttpHandler)
+    yield srv
+    srv.close()
+
+@pytest.fixture
+def slow_server():
+    srv = _Server(SlowHandler)
+    yield srv
+    srv.close()
+
+def _run(coro_fn):
+    async def go():
+        f = AsyncFetcher(concurrency=4, per_host=1)
+        try:
+            return await coro_fn(f), f.pool.opened
+        finally:
+            await f.close()
+    return asyncio.run(go())
+
+def test_keep_alive_reuses_one_connection(http_server):
+    names = sorted(IMAGES)[:10]
+
+    async def get_all(f):
+        return [await f.fetch(f"{http_server.url}/img/{n}") for n in names]
+    bodies, opened = _run(get_all)
+    assert bodies == [IMAGES[n] for n in names]
+    assert opened == 1 and http_server.conns == 1
+
+def test_chunked_body(http_server):
+    async def get(f):
+        return await f.fetch(f"{http_server.url}/chunked/007.png")
+    body, _ = _run(get)
+    assert body == IMAGES["007.png"]
+
+def test_error_statuses_raise_and_keep_connection(http_server):
+    async def get(f):
+        out = []
+        for path in ("/missing.png", "/boom/x.png", "/img/001.png"):
+            try:
+                out.append(await f.fetch(http_server.url + path))
+            except IOError as e:
+                out.append(str(e))
+        return out
+    (missing, boom, ok), opened = _run(get)
+    assert missing.startswith("HTTP 404") and boom.startswith("HTTP 503")
+    assert ok == IMAGES["001.png"]
+    assert opened == 1
+
+def test_fetch_batches_reports_errors_in_order(http_server):
+    uris = [f"{http_server.url}/img/{n}" for n in sorted(IMAGES)[:6]]
+    uris[2] = http_server.url + "/missing.png"
+    uris[4] = http_server.url + "/boom/x.png"
+    got_uris, arrs, errors = [], [], []
+    for bu, ba, be in fetch_batches(uris, batch_size=4, concurrency=4, per_host=2):
+        got_uris += bu; arrs += ba; errors += be
+    assert got_uris == uris
+    for i, (a, e) in enumerate(zip(arrs, errors)):
+        if i == 2:
+            assert a is None and "HTTP 404" in e
+        elif i == 4:
+            assert a is None and "HTTP 503" in e
+        else:
+            assert e is None and a.shape == (8, 12) and int(a[0, 0]) == i
+
+def test_read_bytes_local_and_file_uri(tmp_path):
+    p = tmp_path / "a.png"
+    p.write_bytes(IMAGES["003.png"])
+    assert read_bytes(str(p)) == IMAGES["003.png"]
+    assert read_bytes(p.as_uri()) == IMAGES["003.png"]
+
+@pytest.mark.parametrize("concurrency,per_host,bound", [(3, 8, 3), (16, 2, 2)])
+def test_fetch_batches_respects_concurrency(slow_server, concurrency, per_host, bound):
+    uris = [f"{slow_server.url}/img/{n}" for n in sorted(IMAGES)]
+    n = 0
+    for _, arrs, errors in fetch_batches(uris, batch_size=8, concurrency=concurrency, per_host=per_host, depth=4):
+        assert all(e is None for e in errors)
+        n += len(arrs)
+    assert n == len(uris)
+    assert 2 <= slow_server.max_inflight <= bound
+    assert slow_server.conns <= bound
+
+# ---------- S3 mock ----------
+ACCESS, SECRET, REGION, BUCKET = "AKIDEXAMPLE", "wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY", "eu-west-1", "scans"
+OBJECTS = {f"cases/{k}": v for k, v in list(IMAGES.items())[:7]}
+OBJECTS["cases/notes.txt"] = b"not an image"
+OBJECTS["other/000.png"] = IMAGES["000.png"]
+PAGE = 3
+
+def _expected_signature(method: str, raw_path: str, headers, auth: str) -> str:
+    # server-side SigV4 check, rebuilt from the request as received
+    fields = dict(p.strip().split("=", 1) for p in auth[len("AWS4-HMAC-SHA256 "):].split(","))
+    access, day, region, service, term = fields["Credential"].split("/")
+    assert (access, region, service, term) == (ACCESS, REGION, "s3", "aws4_request")
+    signed = fields["SignedHeaders"].split(";")
+    assert "host" in signed and "x-amz-date" in signed and "x-amz-content-sha256" in signed
+    u = urlsplit(raw_path)
+    query = "&".join(f"{quote(k, safe='-_.~')}={quote(v, safe='-_.~')}"
+                     for k, v in sorted(parse_qsl(u.query, keep_blank_values=True)))
+    canonical = "\n".join([method, quote(unquote(u.path), safe="/-_.~"), query,
+                           "".join(f"{h}:{headers[h].strip()}\n" for h in signed), ";".join(signed),
+                           headers["x-amz-content-sha256"]])
+    amz_date = headers["x-amz-date"]
+    assert amz_date.startswith(day)
+    scope = f"{day}/{REGION}/s3/aws4_request"
+    to_sign = "\n".join(["AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical.encode()).hexdigest()])
+    k = f"AWS4{SECRET}".encode()
+    for part in (day, REGION, "s3", "aws4_request"):
+        k = hmac.new(k, part.encode(), hashlib.sha256).digest()
+    return hmac.new(k, to_sign.encode(), hashlib.sha256).hexdigest()
+
+class S3Handler(_Handler):
+    def route(self):
+        auth = self.headers.get("Authorization", "")
+        try:
+            ok = auth.split("Signature=")[1] == _expected_signature("GET", self.path, self.headers, auth)
+        except (AssertionError, IndexError, KeyError, ValueError):
+            ok = False
+        if not ok:
+            return self.send_body(403, b"<Error><Code>SignatureDoesNotMatch</Code></Error>", "application/xml")
+        u = urlsplit(self.path)
+        bucket, _, key = unquote(u.path).lstrip("/").partition("/")
+        if bucket != BUCKET:
+            return self.send_body(404, b"<Error><Code>NoSuchBucket</Code></Error>", "application/xml")
+        if key:
+            if key not in OBJECTS:
+                return self.send_body(404, b"<Error><Code>NoSuchKey</Code></Error>", "application/xml")
+            return self.send_body(200, OBJECTS[key])
+        q = dict(parse_qsl(u.query))
+        assert q["list-type"] == "2"
+        keys = sorted(k for k in OBJECTS if k.startswith(q.get("prefix", "")))
+        start = int(q["continuation-token"].split("/")[1]) if "continuation-token" in q else 0
+        page = keys[start:start + PAGE]
+        more = start + PAGE < len(keys)
+        xml = ['<?xml version="1.0" encoding="UTF-8"?>',
+               '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">',
+               f"<Name>{BUCKET}</Name><KeyCount>{len(page)}</KeyCount>",
+               f"<IsTruncated>{'true' if more else 'false'}</IsTruncated>"]
+        xml += [f"<Contents><Key>{k}</Key><Size>{len(OBJECTS[k])}</Size></Contents>" for k in page]
+        if more:  # tokens with reserved characters exercise the query encoding
+            xml.append(f"<NextContinuationToken>tok/{start + PAGE}/a+b=</NextContinuationToken>")
+        xml.append("</ListBucketResult>")
+        self.send_body(200, "".join(xml).encode(), "application/xml")
+
+@pytest.fixture
+def s3_server():
+    srv = _Server(S3Handler)
+    yield srv
+    srv.close()
+
+def _s3(srv, secret=SECRET) -> S3Config:
+    return S3Config(srv.url, REGION, ACCESS, secret)
+
+def test_s3_list_paginates_with_continuation_tokens(s3_server):
+    uris = list_uris(f"s3://{BUCKET}/cases/", ".png", _s3(s3_server))
+    assert uris == sorted(f"s3://{BUCKET}/{k}" for k in OBJECTS if k.startswith("cases/") and k.endswith(".png"))
+    tokens = [p for p in s3_server.requests if "continuation-token=" in p]
+    assert len(tokens) == 2  # 8 keys under cases/, pages of 3
+
+def test_s3_get_signed_objects(s3_server):
+    s3 = _s3(s3_server)
+    uris = list_uris(f"s3://{BUCKET}/cases/", ".png", s3)
+    got = []
+    for bu, arrs, errors in fetch_batches(uris, batch_size=4, concurrency=4, s3=s3):
+        assert all(e is None for e in errors)
+        got += [int(a[0, 0]) for a in arrs]
+    assert got == [int(u[-7:-4]) for u in uris]
+    assert read_bytes(f"s3://{BUCKET}/cases/notes.txt", s3) == b"not an image"
+
+def test_s3_rejects_bad_signature_and_missing_keys(s3_server):
+    with pytest.raises(IOError, match="HTTP 403"):
+        read_bytes(f"s3://{BUCKET}/cases/000.png", _s3(s3_server, secret="wrong"))
+    with pytest.raises(IOError, match="HTTP 404"):
+        read_bytes(f"s3://{BUCKET}/cases/none.png", _s3(s3_server))
@@ -1,54 +1,218 @@
-import argparse, os, time, yaml, csv
+import argparse, math, os, time, yaml, csv
 from utils.seed import set_seed
 from datasets.loader_segmenter import list_pairs
 from utils.losses import fake_loss
 from utils import viz as viz_utils
+from utils import profiling
 
 def simulate_epoch(epoch, total_epochs):
     # Simple decreasing curve to simulate training loss
     return fake_loss(1.0 - (epoch + 1) / (total_epochs + 2))
 
-def main(cfg_path):
-    cfg = yaml.safe_load(open(cfg_path, 'r'))
-    set_seed(cfg.get("seed", 2025))
+def torch_available() -> bool:
+    try:
+        import torch  # noqa: F401
+        return True
+    except ImportError:
+        return False
 
-    os.makedirs(cfg["ckpt_dir"], exist_ok=True)
-    os.makedirs(cfg["log_dir"], exist_ok=True)
-    os.makedirs(cfg["viz_dir"], exist_ok=True)
+# ---------- torch training path ----------
+def build_optimizer(params, tcfg):
+    import torch
+    name = str(tcfg.get("optimizer", "adamw")).lower()
+    lr = float(tcfg.get("lr", 1e-3))               # yaml reads "3e-4" as a string
+    wd = float(tcfg.get("weight_decay", 0.0))
+    if name == "adamw":
+        return torch.optim.AdamW(params, lr=lr, weight_decay=wd)
+    if name == "adam":
+        return torch.optim.Adam(params, lr=lr, weight_decay=wd)
+    if name == "sgd":
+        return torch.optim.SGD(params, lr=lr, weight_decay=wd, momentum=float(tcfg.get("momentum", 0.9)))
+    raise ValueError(f"unknown optimizer {name!r}")
 
-    train_pairs = list_pairs(cfg["data"]["train_dir"], cfg["data"]["img_ext"], cfg["data"]["mask_ext"])
-    val_pairs   = list_pairs(cfg["data"]["val_dir"],   cfg["data"]["img_ext"], cfg["data"]["mask_ext"])
+def build_scheduler(opt, tcfg, steps_per_epoch: int):
+    # per-step schedule: linear warmup, then cosine decay (or constant for "none")
+    import torch
+    sc = tcfg.get("scheduler") or {}
+    name = str(sc.get("name", "none")).lower()
+    warm = int(sc.get("warmup_epochs", 0)) * steps_per_epoch
+    total = int(tcfg["epochs"]) * steps_per_epoch
+    if name not in ("cosine", "none", "constant"):
+        raise ValueError(f"unknown scheduler {name!r}")
 
-    if not train_pairs or not val_pairs:
-        print("⚠️ No synthetic data found or folder structure incomplete. Please run:")
-        print("    python scripts/make_synth_data.py --out data/synth --n 64")
-        print("Then re-run train.py.")
+    def factor(step):
+        if step < warm:
+            return (step + 1) / float(warm)
+        if name == "cosine":
+            return 0.5 * (1.0 + math.cos(math.pi * (step - warm) / max(1, total - warm)))
+        return 1.0
+    return torch.optim.lr_scheduler.LambdaLR(opt, factor)
+
+def build_loss(cfg):
+    import torch.nn as nn
+    from utils.losses import DiceLoss, TverskyLoss, FocalLoss
+    table = {"dice": DiceLoss, "tversky": TverskyLoss, "focal": FocalLoss, "bce": nn.BCEWithLogitsLoss}
+    lcfg = cfg.get("loss", {})
+    primary = table[lcfg.get("primary", "dice")]()
+    aux = table[lcfg["aux"]]() if lcfg.get("aux") else None
+    aux_w = float(lcfg.get("aux_weight", 1.0))
+    return lambda logits, y: primary(logits, y) + (aux_w * aux(logits, y) if aux is not None else 0.0)
+
+def _dataset(pairs, store, augment, seed, shuffle_buffer=0):
+    from datasets.seg_dataset import SegmentationDataset, ShardStreamDataset
+    if store and shuffle_buffer > 0 and os.path.exists(store + ".shards.json"):
+        return ShardStreamDataset(store, augment=augment, seed=seed, shuffle_buffer=shuffle_buffer)
+    if store:
+        return SegmentationDataset(store=store, augment=augment, seed=seed)
+    return SegmentationDataset(pairs=pairs, augment=augment, seed=seed)
+
+def train_torch(cfg, train_pairs, val_pairs, history_path):
+    import torch
+    from models.unet_segmenter import build_model
+    from datasets.seg_dataset import make_loader
+    from utils.metrics import SegmentationAccumulator
+
+    tcfg = cfg["train"]
+    seed = int(cfg.get("seed", 2025))
+    if int(cfg.get("threads", 0)) > 0:
+        torch.set_num_threads(int(cfg["threads"]))
+    device = torch.device(cfg.get("device", "cpu"))
+    aug = cfg.get("augment", {})
+    train_ds = _dataset(train_pairs, cfg["data"].get("train_store"), aug.get("train"), seed,
+                        int(tcfg.get("shuffle_buffer", 0)))
+    val_ds = _dataset(val_pairs, cfg["data"].get("val_store"), aug.get("val"), seed)
+    nw = int(tcfg.get("num_workers", 0))
+    pin = device.type == "cuda"
+    bs = int(tcfg["batch_size"])
+    train_dl = make_loader(train_ds, bs, shuffle=True, num_workers=nw, seed=seed, pin_memory=pin)
+    val_dl = make_loader(val_ds, bs, shuffle=False, num_workers=nw, seed=seed, pin_memory=pin)
+
+    model = build_model(cfg).to(device)
+    opt = build_optimizer(model.parameters(), tcfg)
+    sched = build_scheduler(opt, tcfg, max(1, len(train_dl)))
+    loss_fn = build_loss(cfg)
+    best = -1.0
+
+    with open(history_path, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["epoch", "train_loss", "val_metric", "val_iou", "lr", "train_img_s", "val_img_s", "epoch_s"])
+        for e in range(int(tcfg["epochs"])):
+            t0 = time.time()
+            train_ds.set_epoch(e)
+            model.train()
+            loss_sum, n_train = 0.0, 0
+            with profiling.stage("train", len(train_ds)):
+                for x, y in train_dl:
+                    x, y = x.to(device, non_blocking=pin), y.to(device, non_blocking=pin)
+                    loss = loss_fn(model(x), y)
+                    opt.zero_grad(set_to_none=True)
+                    loss.backward()
+                    opt.step()
+                    sched.step()
+                    loss_sum += loss.item() * x.shape[0]; n_train += x.shape[0]
+            t_train = time.time() - t0
+
+            t1 = time.time()
+            model.eval()
+            acc = SegmentationAccumulator()
+            with profiling.stage("val", len(val_ds)), torch.no_grad():
+                for x, y in val_dl:
+                    pred = model(x.to(device)) > 0
+                    acc.update(pred[:, 0].cpu().numpy(), y[:, 0].numpy() > 0.5)
+            t_val = time.time() - t1
+            s = acc.summary()
+            train_loss = loss_sum / max(1, n_train)
+            lr = opt.param_groups[0]["lr"]
+            w.writerow([e, f"{train_loss:.4f}", f"{s['mean_dice']:.4f}", f"{s['mean_iou']:.4f}", f"{lr:.6g}",
+                        f"{n_train / t_train if t_train > 0 else 0:.1f}", f"{s['n'] / t_val if t_val > 0 else 0:.1f}",
+                        f"{time.time() - t0:.1f}"])
+            f.flush()
+
+            with profiling.stage("checkpoint"):
+                state = {"model": model.state_dict(), "epoch": e, "val_dice": s["mean_dice"], "cfg": cfg}
+                torch.save(state, os.path.join(cfg["ckpt_dir"], "last.pt"))
+                if s["mean_dice"] > best:
+                    best = s["mean_dice"]
+                    torch.save(state, os.path.join(cfg["ckpt_dir"], "best.pt"))
+            print(f"E{e:03d} loss={train_loss:.4f} val={s['mean_dice']:.4f} "
+                  f"train={n_train / t_train if t_train > 0 else 0:.1f} img/s time={time.time()-t0:.1f}s")
+    print(f"Best val Dice: {best:.4f} -> {os.path.join(cfg['ckpt_dir'], 'best.pt')}")
 
+# ---------- dummy path (no torch needed) ----------
+def train_dummy(cfg, train_pairs, val_pairs, history_path):
     # Write training history to CSV
-    history_path = os.path.join(cfg["log_dir"], "history.csv")
     with open(history_path, "w", newline="") as f:
         w = csv.writer(f)
         w.writerow(["epoch", "train_loss", "val_metric"])
         for e in range(cfg["train"]["epochs"]):
             t0 = time.time()
-            train_loss = simulate_epoch(e, cfg["train"]["epochs"])
-            # Simulate validation metric increasing gradually with epochs
-            val_metric = 0.5 + 0.4 * (e + 1) / cfg["train"]["epochs"]  # final value ~0.9
+            with profiling.stage("train", len(train_pairs)):
+                train_loss = simulate_epoch(e, cfg["train"]["epochs"])
+            with profiling.stage("val", len(val_pairs)):
+                # Simulate validation metric increasing gradually with epochs
+                val_metric = 0.5 + 0.4 * (e + 1) / cfg["train"]["epochs"]  # final value ~0.9
             w.writerow([e, f"{train_loss:.4f}", f"{val_metric:.4f}"])
             print(f"E{e:03d} loss={train_loss:.4f} val={val_metric:.4f} time={time.time()-t0:.1f}s")
 
-    # Save 1–3 overlay examples if validation data is available
-    if len(val_pairs) > 0:
-        for i, (img_p, mask_p) in enumerate(val_pairs[:3]):
-            out_p = os.path.join(cfg["viz_dir"], f"overlay_{i}.png")
-            viz_utils.overlay(img_p, mask_p, out_p)
-
     # Save a placeholder "best checkpoint"
     with open(os.path.join(cfg["ckpt_dir"], "best.txt"), "w") as f:
         f.write("placeholder for best checkpoint\n")
 
+def main(cfg_path, mode="auto"):
+    cfg = yaml.safe_load(open(cfg_path, 'r'))
+    if mode == "auto":
+        mode = "torch" if torch_available() else "dummy"
+    if mode == "torch":
+        import torch  # noqa: F401  (imported first so set_seed seeds it too)
+    set_seed(cfg.get("seed", 2025))
+
+    os.makedirs(cfg["ckpt_dir"], exist_ok=True)
+    os.makedirs(cfg["log_dir"], exist_ok=True)
+    os.makedirs(cfg["viz_dir"], exist_ok=True)
+
+    with profiling.stage("list"):
+        train_pairs = list_pairs(cfg["data"]["train_dir"], cfg["data"]["img_ext"], cfg["data"]["mask_ext"])
+        val_pairs   = list_pairs(cfg["data"]["val_dir"],   cfg["data"]["img_ext"], cfg["data"]["mask_ext"])
+
+    have_data = (train_pairs or cfg["data"].get("train_store")) and (val_pairs or cfg["data"].get("val_store"))
+    if not have_data:
+        print("⚠️ No synthetic data found or folder structure incomplete. Please run:")
+        print("    python scripts/make_synth_data.py --out data/synth --n 64")
+        print("Then re-run train.py.")
+
+    history_path = os.path.join(cfg["log_dir"], "history.csv")
+    if mode == "torch" and have_data:
+        train_torch(cfg, train_pairs, val_pairs, history_path)
+    else:
+        if mode == "torch":
+            print("No data: falling back to the dummy training loop.")
+        train_dummy(cfg, train_pairs, val_pairs, history_path)
+
+    # Overlays for the val set (viz.max_overlays, 0 = all) plus a contact sheet for QA
+    vcfg = cfg.get("viz") or {}
+    n_viz = int(vcfg.get("max_overlays", 3)) or len(val_pairs)
+    if len(val_pairs) > 0:
+        pairs = val_pairs[:n_viz]
+        with profiling.stage("viz", len(pairs)):
+            sheet = os.path.join(cfg["viz_dir"], "contact_sheet.png") if vcfg.get("contact_sheet", False) else None
+            viz_utils.overlay_batch(pairs, cfg["viz_dir"], workers=int(vcfg.get("workers", 4)),
+                                    sheet_path=sheet, sheet_cols=int(vcfg.get("sheet_cols", 8)),
+                                    sheet_max=int(vcfg.get("sheet_max", 256)))
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--cfg", default="configs/segmenter_unet.yaml")
+    parser.add_argument("--mode", choices=["auto", "torch", "dummy"], default="auto",
+                        help="torch = real UNet training, dummy = simulated curve (auto: torch if installed)")
+    parser.add_argument("--instrument", default=None,
+                        help="write per-stage timings here (*.trace.json = Chrome trace, else JSON summary)")
+    parser.add_argument("--profile", choices=["cprofile", "tracemalloc"], default=None)
     args = parser.parse_args()
-    main(args.cfg)
+    instr = profiling.use(profiling.Instrument(enabled=bool(args.instrument or args.profile),
+                                               trace=bool(args.instrument and args.instrument.endswith(".trace.json"))))
+    with profiling.profiled(args.profile, os.path.splitext(args.instrument or "outputs/logs/train")[0]):
+        main(args.cfg, args.mode)
+    if instr.enabled:
+        print(instr.report())
+        if args.instrument:
+            instr.save(args.instrument)
@@ -1,90 +1,389 @@
-import argparse, os, yaml, csv
+import argparse, csv, hashlib, json, os, yaml
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 from typing import List, Tuple
-from PIL import Image
-from datasets.loader_classifier import list_images_with_labels, read_image_gray, class_names
-from utils.rules import detect_features, classify_from_features
-import matplotlib.pyplot as plt
-
-def confusion_matrix(y_true: List[int], y_pred: List[int], ncls: int) -> np.ndarray:
-    cm = np.zeros((ncls, ncls), dtype=int)
-    for t, p in zip(y_true, y_pred):
-        cm[t, p] += 1
-    return cm
-
-def per_class_accuracy(cm: np.ndarray) -> List[float]:
-    accs = []
-    for i in range(cm.shape[0]):
-        denom = cm[i].sum()
-        accs.append(float(cm[i, i]) / denom if denom > 0 else 0.0)
-    return accs
-
-def main(cfg_path: str):
+from datasets.loader_classifier import list_images_and_classes
+from datasets.chunks import open_store, load_chunk
+from utils.rules import FEATURE_NAMES, detect_features_arrays, classify_batch, compile_rules, rule_table_from_cfg, feature_codes
+from utils.feature_cache import FeatureCache, rules_hash, codes_to_features
+from utils.cascade import cascade_cfg, classify_arrays, plan_for
+from utils.metrics import confusion_matrix, ConfusionAccumulator
+from utils.features import feature_names, feature_matrix, hash_items
+from utils.report import ReportWriter, write_report_csv, write_per_class_csv, render_heatmap
+from utils import profiling
+
+_CACHES = {}
+
+def open_cache(cfg):
+    # per process: an SQLite connection must not cross a fork
+    c = cfg.get("cache") or {}
+    if not (c.get("enabled", False) and c.get("path")):
+        return None
+    key = (os.getpid(), c["path"], rules_hash(cfg))
+    if key not in _CACHES:
+        _CACHES[key] = FeatureCache.from_cfg(cfg)
+    return _CACHES[key]
+
+def predict_items(items: List[Tuple[str, int]], cfg, classes: List[str], batch_size: int = 256,
+                  store: str = None, start: int = 0) -> List[int]:
+    """
+    Decodes items in chunks and runs the vectorized feature extractor per chunk
+    (one batched call per distinct image size in the chunk).
+    With store (a PackedStore prefix), items[k] is read from store entry start+k
+    as a zero-copy view instead of being decoded. Otherwise, with cache.enabled
+    in cfg, only images missing from the feature cache are decoded.
+    rules.cascade.enabled computes only the features the rules need
+    (utils/cascade.py), for cache misses too; misses the cascade settled
+    early are not cached.
+    """
+    lut = compile_rules(classes, rule_table_from_cfg(cfg))
+    cache = None if store else open_cache(cfg)
+    casc = cascade_cfg(cfg)["enabled"]
+    plans = plan_for(cfg, classes) if casc else None
+    preds = []
+    for s in range(0, len(items), batch_size):
+        chunk = items[s:s+batch_size]
+        if cache is None and casc:
+            arrs = load_chunk(chunk, store, start + s)
+            with profiling.stage("cascade", len(arrs)):
+                pred, mask, _ = classify_arrays(arrs, cfg, classes, plans=plans)
+            profiling.count("cascade_features", sum(bin(m).count("1") for m in mask.tolist()))
+            preds.extend(pred.tolist())
+            continue
+        if cache is None:
+            arrs = load_chunk(chunk, store, start + s)
+            with profiling.stage("features", len(arrs)):
+                feats = detect_features_arrays(arrs, cfg)
+        else:
+            with profiling.stage("cache", len(chunk)):
+                keys = cache.keys(p for p, _ in chunk)
+                found = cache.get_many(keys)
+            codes = np.array([found.get(k, -1) for k in keys], dtype=np.int64)
+            miss = np.flatnonzero(codes < 0)
+            profiling.count("cache_hits", len(chunk) - len(miss))
+            if len(miss):
+                arrs = load_chunk([chunk[i] for i in miss])
+                if casc:
+                    with profiling.stage("cascade", len(arrs)):
+                        cascaded = classify_arrays(arrs, cfg, classes, plans=plans)
+                    mask, vals = cascaded[1], cascaded[2]
+                    profiling.count("cascade_features", sum(bin(m).count("1") for m in mask.tolist()))
+                    # only images whose five features were all computed have a complete code
+                    full = mask == (1 << len(FEATURE_NAMES)) - 1
+                    codes[miss[full]] = vals[full]
+                else:
+                    with profiling.stage("features", len(arrs)):
+                        codes[miss] = feature_codes(detect_features_arrays(arrs, cfg))
+                put = miss[codes[miss] >= 0]
+                with profiling.stage("cache", len(put)):
+                    cache.put_many([keys[i] for i in put], codes[put])
+            feats = codes_to_features(codes)
+        with profiling.stage("classify", len(chunk)):
+            pred = classify_batch(feats, classes, lut=lut)
+        if cache is not None and casc and len(miss):
+            pred[miss] = cascaded[0]
+        preds.extend(pred.tolist())
+    return preds
+
+def _score_chunk(args) -> np.ndarray:
+    # process-pool worker: decode + features + rules for one chunk -> partial confusion matrix
+    items, cfg, classes, store, start = args
+    y_true = [label for _, label in items]
+    return confusion_matrix(y_true, predict_items(items, cfg, classes, store=store, start=start), len(classes))
+
+def _score_chunk_worker(args):
+    # pool side: fresh per-task instrument (a forked copy of the parent's would double count)
+    chunk, instr = args
+    if instr is None:
+        return _score_chunk(chunk), None
+    profiling.use(profiling.Instrument(enabled=True, trace=instr))
+    return _score_chunk(chunk), profiling.current().state()
+
+def eval_key(items: List[Tuple[str, int]], cfg, classes: List[str], store: str = None) -> str:
+    # what a checkpoint is valid for: the item list (and file stats), label order, rules and source
+    h = hashlib.sha1()
+    h.update(json.dumps({"classes": classes, "rules": rules_hash(cfg), "table": rule_table_from_cfg(cfg),
+                         "store": store}, sort_keys=True).encode())
+    hash_items(h, items, store)
+    return h.hexdigest()[:20]
+
+def load_checkpoint(path: str, key: str, ncls: int) -> Tuple[int, ConfusionAccumulator]:
+    """
+    (items already scored, their confusion counts) from a score_items
+    checkpoint; (0, empty) when there is none or it belongs to another run.
+    """
+    acc = ConfusionAccumulator(ncls)
+    if not path or not os.path.exists(path):
+        return 0, acc
+    with open(path, "r") as f:
+        ck = json.load(f)
+    if ck.get("key") != key:
+        print(f"Checkpoint {path} is for a different item list / config; starting over.")
+        return 0, acc
+    return int(ck["done"]), ConfusionAccumulator.from_state(ck["scores"])
+
+def save_checkpoint(path: str, key: str, done: int, total: int, acc: ConfusionAccumulator):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"key": key, "done": done, "total": total, "accuracy": acc.accuracy(),
+                   "scores": acc.state()}, f)
+    os.replace(tmp, path)
+
+def score_items(items: List[Tuple[str, int]], cfg, classes: List[str], workers: int = 1,
+                chunk_size: int = 256, store: str = None, checkpoint: str = None,
+                checkpoint_every: int = 10000, log_every: int = 0) -> ConfusionAccumulator:
+    """
+    Scores items chunk by chunk (in a process pool when workers > 1, at most
+    2*workers chunks in flight) and merges the per-chunk confusion matrices in
+    item order; the result does not depend on workers.
+
+    With checkpoint, the counts and the number of items scored so far are
+    saved there every checkpoint_every items (and on the way out of an
+    interrupted run); a rerun over the same items / config resumes after
+    them. log_every > 0 prints the running accuracy every that many items.
+    """
+    if workers > 1:
+        chunk_size = max(1, min(chunk_size, -(-len(items) // (workers * 4))))
+    key = eval_key(items, cfg, classes, store) if checkpoint else None
+    done, acc = load_checkpoint(checkpoint, key, len(classes)) if checkpoint else (0, ConfusionAccumulator(len(classes)))
+    if done:
+        print(f"Resuming from {checkpoint}: {done}/{len(items)} images already scored (accuracy {acc.accuracy():.4f})")
+    chunks = ((items[s:s+chunk_size], cfg, classes, store, s) for s in range(done, len(items), chunk_size))
+    saved, logged = done, done
+
+    def consume(part, n):
+        nonlocal done, saved, logged
+        acc.merge(part)
+        done += n
+        if log_every and done - logged >= log_every:
+            print(f"  [{done}/{len(items)}] accuracy {acc.accuracy():.4f}", flush=True)
+            logged = done
+        if checkpoint and done - saved >= checkpoint_every:
+            with profiling.stage("checkpoint"):
+                save_checkpoint(checkpoint, key, done, len(items), acc)
+            saved = done
+
+    try:
+        if workers > 1:
+            parent = profiling.current()
+            instr = parent.trace if parent.enabled else None
+            pending = deque()
+
+            def drain():
+                fut, n = pending.popleft()
+                part, state = fut.result()
+                parent.merge(state)
+                consume(part, n)
+
+            with ProcessPoolExecutor(max_workers=workers) as ex:
+                for c in chunks:
+                    pending.append((ex.submit(_score_chunk_worker, (c, instr)), len(c[0])))
+                    if len(pending) >= 2 * workers:
+                        drain()
+                while pending:
+                    drain()
+        else:
+            for c in chunks:
+                consume(_score_chunk(c), len(c[0]))
+    finally:
+        # only whole chunks are ever merged, so the counts always match `done`
+        if checkpoint and done > saved:
+            save_checkpoint(checkpoint, key, done, len(items), acc)
+    return acc
+
+def warm_matplotlib():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot  # noqa: F401
+
+def plot_confusion_matrix(cm: np.ndarray, classes: List[str], out_path: str, title: str = "Confusion Matrix (rule-based)"):
+    # matplotlib is imported here so CSV-only runs (--no-plot) never pay for it
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    ncls = len(classes)
+    fig = plt.figure()
+    ax = fig.add_subplot(111)
+    im = ax.imshow(cm, interpolation="nearest")
+    ax.set_title(title)
+    ax.set_xlabel("Predicted")
+    ax.set_ylabel("True")
+    ax.set_xticks(range(ncls)); ax.set_xticklabels(classes, rotation=45, ha="right")
+    ax.set_yticks(range(ncls)); ax.set_yticklabels(classes)
+    for i in range(ncls):
+        for j in range(ncls):
+            ax.text(j, i, cm[i, j], ha="center", va="center")
+    plt.tight_layout()
+    plt.savefig(out_path, bbox_inches="tight")
+    plt.close()
+
+def write_cv_csv(path: str, cv: dict):
+    keys = ["params", "mean_test_score", "std_test_score", "rank_test_score", "mean_fit_time"]
+    res = cv["cv_results"]
+    with open(path, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(keys)
+        for i in range(len(res["params"])):
+            w.writerow([json.dumps(res["params"][i])] + [f"{float(res[k][i]):.4f}" for k in keys[1:]])
+
+def run_svm(cfg, classes: List[str], val_items, workers: int = 1, store: str = None):
+    """
+    SVM baseline: one float32 feature matrix per split (utils/features.py,
+    cached under cache.matrix_dir), fit with optional parallel grid-search CV,
+    then score val. Returns (ConfusionAccumulator, extra report jobs).
+    """
+    from models.svm_classifier import fit
+    names = feature_names(cfg)
+    with profiling.stage("list"):
+        train_items, train_classes = list_images_and_classes(cfg["data"]["train_dir"], cfg["data"]["img_ext"])
+    # train labels follow the val class order; classes missing from val are dropped
+    remap = {i: classes.index(c) for i, c in enumerate(train_classes) if c in classes}
+    train_items = [(p, remap[ci]) for p, ci in train_items if ci in remap]
+    if not train_items:
+        print("No training images found in train_dir.")
+        return None, []
+    cache_dir = (cfg.get("cache") or {}).get("matrix_dir")
+    with profiling.stage("features", len(train_items) + len(val_items)):
+        X_tr, y_tr = feature_matrix(train_items, cfg, names, cache_dir, workers)
+        X_va, y_va = feature_matrix(val_items, cfg, names, cache_dir, workers, store=store)
+    print(f"Features {names}: train {X_tr.shape}, val {X_va.shape}")
+    with profiling.stage("fit", len(X_tr)):
+        model, cv = fit(cfg, X_tr, y_tr, workers)
+    with profiling.stage("classify", len(X_va)):
+        pred = model.predict(X_va)
+    extra = []
+    log_dir = cfg["output"]["log_dir"]
+    if cv is not None:
+        print(f"CV best {cv['best_params']} (mean acc {cv['best_score']:.4f})")
+        extra.append((write_cv_csv, (cfg["output"].get("cv_csv") or os.path.join(log_dir, "cv_results_sklearn.csv"), cv)))
+    import joblib
+    extra.append((joblib.dump, (model, cfg["output"].get("model_path") or os.path.join(log_dir, "svm.joblib"))))
+    return ConfusionAccumulator(len(classes)).update(y_va, pred), extra
+
+def main(cfg_path: str, workers: int = 1, manifest: str = None, store: str = None, plot: bool = True,
+         cache: bool = True, plot_backend: str = "auto", report_mode: str = "thread",
+         checkpoint: str = None, checkpoint_every: int = 10000, log_every: int = 0, wait: bool = True):
+    """
+    The report writer starts before scoring (warming up matplotlib when it
+    will plot) and writes the CSVs / PNG while main finishes. wait=False
+    returns it unjoined so the caller can carry on and close() it at exit.
+    """
+    rw = ReportWriter(report_mode)
+    try:
+        _evaluate(rw, cfg_path, workers, manifest, store, plot, cache, plot_backend,
+                  checkpoint, checkpoint_every, log_every)
+    except BaseException as e:
+        rw.__exit__(type(e), e, e.__traceback__)
+        raise
+    if not wait:
+        return rw
+    with profiling.stage("report_wait"):
+        rw.close()
+
+def _evaluate(rw: ReportWriter, cfg_path: str, workers: int, manifest: str, store: str, plot: bool,
+              cache: bool, plot_backend: str, checkpoint: str, checkpoint_every: int, log_every: int):
     cfg = yaml.safe_load(open(cfg_path, "r"))
+    if not cache:
+        cfg.pop("cache", None)
 
     os.makedirs(cfg["output"]["log_dir"], exist_ok=True)
 
-    # gather class lists from VAL set (authoritative for label order)
-    classes = class_names(cfg["data"]["val_dir"])
+    # gather class lists from VAL set (authoritative for label order); one scan gives items + classes
+    with profiling.stage("list"):
+        if store:
+            st = open_store(store)
+            val_items, classes = st.items(), st.classes
+        else:
+            val_items, classes = list_images_and_classes(cfg["data"]["val_dir"], cfg["data"]["img_ext"], manifest)
+    profiling.count("images", len(val_items))
     if not classes:
         print("No classes found in val_dir. Expected subfolders per class.")
         return
     print("Classes:", classes)
 
-    val_items = list_images_with_labels(cfg["data"]["val_dir"], cfg["data"]["img_ext"])
     if not val_items:
         print("No images found in val_dir. Generate synthetic data first:")
         print("  python scripts/make_synth_fracture_cls.py --out data/synth_cls --n_per_class 40")
         return
 
-    if cfg["rules"]["enabled"]:
-        y_true, y_pred = [], []
-        for path, label in val_items:
-            img = read_image_gray(path)
-            feats = detect_features(img, cfg)
-            pred_idx = classify_from_features(feats, classes)
-            y_true.append(label)
-            y_pred.append(pred_idx)
-
-        ncls = len(classes)
-        cm = confusion_matrix(y_true, y_pred, ncls)
-        acc = float(np.trace(cm)) / float(cm.sum()) if cm.sum() > 0 else 0.0
-        pc_acc = per_class_accuracy(cm)
-
-        # save a small report CSV
-        report_csv = cfg["output"]["report_csv"]
-        with open(report_csv, "w", newline="") as f:
-            w = csv.writer(f)
-            w.writerow(["metric", "value"])
-            w.writerow(["accuracy", f"{acc:.4f}"])
-            for i, c in enumerate(classes):
-                w.writerow([f"acc_{c}", f"{pc_acc[i]:.4f}"])
-        print(f"Accuracy: {acc:.4f}")
-        for i, c in enumerate(classes):
-            print(f"  {c}: {pc_acc[i]:.4f}")
-
-        # plot confusion matrix
-        fig = plt.figure()
-        ax = fig.add_subplot(111)
-        im = ax.imshow(cm, interpolation="nearest")
-        ax.set_title("Confusion Matrix (rule-based)")
-        ax.set_xlabel("Predicted")
-        ax.set_ylabel("True")
-        ax.set_xticks(range(ncls)); ax.set_xticklabels(classes, rotation=45, ha="right")
-        ax.set_yticks(range(ncls)); ax.set_yticklabels(classes)
-        for i in range(ncls):
-            for j in range(ncls):
-                ax.text(j, i, cm[i, j], ha="center", va="center")
-        plt.tight_layout()
-        plt.savefig(cfg["output"]["cm_path"], bbox_inches="tight")
-        plt.close()
+    backend = plot_backend
+    if backend == "auto":
+        backend = "matplotlib" if len(classes) <= 30 else "pil"
+    if plot and backend == "matplotlib":
+        # the writer imports pyplot while the images are scored
+        rw.submit(warm_matplotlib)
+
+    extra = []   # (writer fn, args) for path-specific artifacts
+    if cfg.get("rules", {}).get("enabled", False):
+        scores = score_items(val_items, cfg, classes, workers, store=store, checkpoint=checkpoint,
+                             checkpoint_every=checkpoint_every, log_every=log_every)
+    elif cfg.get("model", {}).get("name") == "sklearn_svm":
+        scores, extra = run_svm(cfg, classes, val_items, workers, store)
+        if scores is None:
+            return
     else:
-        print("rules.enabled == False; no ML baseline implemented in this lightweight template.")
-        print("You can add a simple sklearn or PyTorch classifier later.")
+        print("rules.enabled == False and model.name is not sklearn_svm; nothing to evaluate.")
+        print("Use configs/classifier_sklearn.yaml for the SVM baseline.")
         return
+    cm = scores.cm
+    acc = scores.accuracy()
+    pc_acc = scores.per_class_accuracy()
+
+    # report CSVs and the confusion-matrix PNG are written in the background
+    report_csv = cfg["output"]["report_csv"]
+    per_class_csv = cfg["output"].get("per_class_csv") or os.path.splitext(report_csv)[0] + "_per_class.csv"
+    with profiling.stage("report"):
+        rw.submit(write_report_csv, report_csv, cm, classes)
+        rw.submit(write_per_class_csv, per_class_csv, cm, classes)
+        for fn, args in extra:
+            rw.submit(fn, *args)
+        if plot:
+            fn = plot_confusion_matrix if backend == "matplotlib" else render_heatmap
+            title = "Confusion Matrix (rule-based)" if cfg.get("rules", {}).get("enabled") else "Confusion Matrix (SVM)"
+            rw.submit(fn, cm, classes, cfg["output"]["cm_path"], title)
+
+    fc = None if store else open_cache(cfg)
+    if fc is not None:
+        with profiling.stage("cache_evict"):
+            evicted = fc.evict()
+        print(f"Feature cache: {len(fc)} entries ({evicted} evicted) in {fc.path}")
+    print(f"Accuracy: {acc:.4f}")
+    for i, c in enumerate(classes):
+        print(f"  {c}: {pc_acc[i]:.4f}")
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("--cfg", default="configs/classifier_letournel.yaml")
+    ap.add_argument("--workers", type=int, default=1, help="process-pool size (1 = serial)")
+    ap.add_argument("--manifest", default=None, help="cache the val_dir listing in this JSON manifest")
+    ap.add_argument("--store", default=None, help="read val images from a packed store (datasets/packed.py) or shard set (datasets/shards.py) prefix")
+    ap.add_argument("--no-plot", dest="plot", action="store_false", help="skip the confusion-matrix PNG (matplotlib is never imported)")
+    ap.add_argument("--plot_backend", choices=["auto", "matplotlib", "pil"], default="auto",
+                    help="confusion-matrix renderer (auto: matplotlib up to 30 classes, else the NumPy/PIL heatmap)")
+    ap.add_argument("--report_writer", choices=["thread", "process", "sync"], default="thread",
+                    help="where report CSVs / plots are written (background thread, worker process, inline)")
+    ap.add_argument("--no-cache", dest="cache", action="store_false", help="ignore the cfg cache: section (recompute every image)")
+    ap.add_argument("--checkpoint", default=None,
+                    help="save running counts here and resume from them on rerun (rule path)")
+    ap.add_argument("--checkpoint_every", type=int, default=10000, help="images between checkpoint writes")
+    ap.add_argument("--log_every", type=int, default=0, help="print the running accuracy every N images (0 = off)")
+    ap.add_argument("--instrument", default=None,
+                    help="write per-stage timings here (*.trace.json = Chrome trace, else JSON summary)")
+    ap.add_argument("--profile", choices=["cprofile", "tracemalloc"], default=None)
     args = ap.parse_args()
-    main(args.cfg)
+    instr = profiling.use(profiling.Instrument(enabled=bool(args.instrument or args.profile),
+                                               trace=bool(args.instrument and args.instrument.endswith(".trace.json"))))
+    out_prefix = os.path.splitext(args.instrument or "outputs/logs/train_cls")[0]
+    with profiling.profiled(args.profile, out_prefix):
+        rw = main(args.cfg, args.workers, args.manifest, args.store, args.plot, args.cache, args.plot_backend,
+                  args.report_writer, args.checkpoint, args.checkpoint_every, args.log_every, wait=False)
+    try:
+        if instr.enabled:
+            print(instr.report())
+            if args.instrument:
+                instr.save(args.instrument)
+    finally:
+        # the report artifacts finish here, at process exit
+        rw.close()
@@ -0,0 +1,75 @@
+import argparse, os, yaml, csv, copy
+import numpy as np
+from datasets.loader_classifier import list_images_and_classes
+from utils.rules import roi_stats_batch, rule_table_from_cfg
+from utils.tune import TUNE_KEYS, expand_grid, concat_stats, sweep, surface_rows, best_params
+from datasets.chunks import open_store, load_chunk
+
+"""
+Threshold auto-tuner for the rule classifier. Each val image is decoded once
+and reduced to per-ROI cumulative histograms; every combination of the
+`tune:` grid in the config is then scored from those histograms only.
+
+    python tune_cls.py --cfg configs/classifier_letournel.yaml
+"""
+
+def collect_stats(items, cfg, store: str = None, batch_size: int = 256):
+    parts = []
+    for s in range(0, len(items), batch_size):
+        arrs = load_chunk(items[s:s+batch_size], store, s)
+        if isinstance(arrs, np.ndarray):
+            parts.append(roi_stats_batch(arrs, cfg))
+        elif len({a.shape for a in arrs}) == 1:
+            parts.append(roi_stats_batch(np.stack(arrs), cfg))
+        else:
+            parts.extend(roi_stats_batch(a, cfg) for a in arrs)
+    return concat_stats(parts)
+
+def main(cfg_path: str, store: str = None, top: int = 5):
+    cfg = yaml.safe_load(open(cfg_path, "r"))
+    os.makedirs(cfg["output"]["log_dir"], exist_ok=True)
+
+    if store:
+        st = open_store(store)
+        val_items, classes = st.items(), st.classes
+    else:
+        val_items, classes = list_images_and_classes(cfg["data"]["val_dir"], cfg["data"]["img_ext"])
+    if not val_items:
+        print("No images found in val_dir. Generate synthetic data first:")
+        print("  python scripts/make_synth_fracture_cls.py --out data/synth_cls --n_per_class 40")
+        return
+
+    grid = expand_grid(cfg.get("tune"), cfg["rules"]["thresholds"])
+    ncombo = int(np.prod([len(grid[k]) for k in TUNE_KEYS]))
+    print(f"Images: {len(val_items)}  combinations: {ncombo}")
+
+    stats = collect_stats(val_items, cfg, store)
+    acc = sweep(stats, [label for _, label in val_items], classes, grid, rule_table_from_cfg(cfg))
+
+    rows = surface_rows(acc, grid)
+    surface_csv = cfg["output"].get("tune_csv", os.path.join(cfg["output"]["log_dir"], "tune_surface.csv"))
+    with open(surface_csv, "w", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=TUNE_KEYS + ["accuracy"])
+        w.writeheader()
+        for r in rows:
+            w.writerow({**r, "accuracy": f"{r['accuracy']:.4f}"})
+
+    for r in sorted(rows, key=lambda r: -r["accuracy"])[:top]:
+        print("  " + " ".join(f"{k}={r[k]:g}" for k in TUNE_KEYS) + f"  acc={r['accuracy']:.4f}")
+
+    best, best_acc = best_params(acc, grid)
+    best_cfg = copy.deepcopy(cfg)
+    best_cfg["rules"]["thresholds"].update(best)
+    best_yaml = cfg["output"].get("tune_best", os.path.join(cfg["output"]["log_dir"], "tune_best.yaml"))
+    with open(best_yaml, "w") as f:
+        yaml.safe_dump(best_cfg, f, sort_keys=False)
+    print(f"Best accuracy: {best_acc:.4f} -> {best_yaml}")
+    print(f"Surface: {surface_csv}")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cfg", default="configs/classifier_letournel.yaml")
+    ap.add_argument("--store", default=None, help="read val images from a packed store (datasets/packed.py) or shard set (datasets/shards.py) prefix")
+    ap.add_argument("--top", type=int, default=5, help="print the N best combinations")
+    args = ap.parse_args()
+    main(args.cfg, args.store, args.top)
@@ -0,0 +1,280 @@
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from PIL import Image
+from utils.rules import FEATURE_NAMES, _roi_slices, compile_rules, rule_table_from_cfg, table_key
+from utils.fullres import decimate, fullres_cfg, reference_size, scaled_rules
+
+"""
+Early-exit rule classification (rules.cascade.enabled).
+
+The compiled rule LUT (utils.rules.compile_rules) often settles the class
+before all five features are known: with both lines intact and no PW fragment
+neither the spur nor the iliac wing can change the answer. For every partial
+state (which features are known, and their values) two tables are
+precomputed once per (class order, rule table):
+
+    DEC[mask, values]   class index if every completion of the state gives
+                        the same class, else -1
+    NEXT[mask, values]  feature to compute next: the one minimizing the
+                        expected ROI pixels still to be read (each unknown
+                        feature taken as 50/50), or -1 when decided
+
+classify_stack() then computes, per round, only the next feature of the
+still-undecided images, reading only that ROI; predictions are identical
+to classify_batch(detect_features_batch(...)).
+
+Draft stage (rules.cascade.draft_scale = 2, 4 or 8, infer.py): JPEGs are
+first decoded at 1/draft_scale of the reference size (PIL draft = DCT
+scaling, no full decode). Every draft pixel is a block mean, which bounds
+each ROI statistic of the reference image (draft_bounds); features whose
+threshold lies outside those bounds (widened by `margin` for decoder error)
+are taken as known, and the full-resolution image is only decoded when they
+do not settle the class. Thin ROIs (the 3-row line boxes) give wide bounds,
+so images near a threshold always get the full decode. PNG has no reduced
+decode, so PNGs always go straight to full resolution.
+"""
+
+# feature -> (roi, statistic, threshold key, default, True when stat >= thr / < thr)
+SPECS: Dict[str, Tuple[str, str, str, float, bool]] = {
+    "iliopectineal_broken": ("iliopectineal", "bright", "line_pixels", 620, False),
+    "ilioischial_broken":   ("ilioischial", "bright", "line_pixels", 620, False),
+    "posterior_wall_frag":  ("posterior_wall", "bright", "pw_pixels", 800, True),
+    "spur_sign":            ("spur_area", "bright", "spur_pixels", 100, True),
+    "iliac_wing_involved":  ("iliac_wing", "mean", "fragment_mean", 170, True),
+}
+
+DRAFT_MARGIN = 0.05
+
+def cascade_cfg(cfg: Dict) -> Dict:
+    c = cfg["rules"].get("cascade") or {}
+    out = {"enabled": bool(c.get("enabled", False)), "draft_scale": int(c.get("draft_scale", 0) or 0),
+           "margin": float(c.get("margin", DRAFT_MARGIN))}
+    # the JPEG DCT scales; the draft bounds also assume whole-pixel blocks
+    if out["draft_scale"] not in (0, 1, 2, 4, 8):
+        raise ValueError(f"rules.cascade.draft_scale must be 0 or 1 (no draft), 2, 4 or 8, not {out['draft_scale']}")
+    return out
+
+def _costs(cfg: Dict) -> List[float]:
+    # pixels read per feature on the reference frame
+    rw, rh = reference_size(cfg)
+    sl = _roi_slices(cfg["rules"]["roi"], rh, rw)
+    area = {k: (ys.stop - ys.start) * (xs.stop - xs.start) for k, (ys, xs) in sl.items()}
+    return [max(1, area[SPECS[f][0]]) for f in FEATURE_NAMES]
+
+def plan(lut: np.ndarray, costs: List[float]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (DEC, NEXT), both (32, 32) int64 indexed [mask, values] (values only
+    meaningful under mask).
+    """
+    nf = len(FEATURE_NAMES)
+    codes = np.arange(1 << nf)
+    dec = np.full((1 << nf, 1 << nf), -1, dtype=np.int64)
+    nxt = np.full((1 << nf, 1 << nf), -1, dtype=np.int64)
+    exp = np.zeros((1 << nf, 1 << nf))
+    # most-known states first, so both children of a state are solved before it
+    for mask in sorted(range(1 << nf), key=lambda m: -bin(m).count("1")):
+        for vals in range(1 << nf):
+            if vals & ~mask:
+                continue
+            classes = np.unique(lut[(codes & mask) == vals])
+            if len(classes) == 1:
+                dec[mask, vals] = classes[0]
+                continue
+            best, arg = np.inf, -1
+            for f in range(nf):
+                b = 1 << f
+                if mask & b:
+                    continue
+                e = costs[f] + 0.5 * (exp[mask | b, vals] + exp[mask | b, vals | b])
+                if e < best:
+                    best, arg = e, f
+            exp[mask, vals], nxt[mask, vals] = best, arg
+    return dec, nxt
+
+_PLANS: Dict[Tuple, Tuple] = {}
+
+def plan_for(cfg: Dict, classes: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    # rebuilds the key from cfg (~20 us): per-image callers take `plans` from one call instead
+    table = rule_table_from_cfg(cfg)
+    costs = _costs(cfg)
+    key = (tuple(classes), table_key(table), tuple(costs))
+    if key not in _PLANS:
+        _PLANS[key] = plan(compile_rules(classes, table), costs)
+    return _PLANS[key]
+
+def _feature(stack: np.ndarray, idx: np.ndarray, name: str, sl: Dict, thr: Dict) -> np.ndarray:
+    roi, stat, key, default, ge = SPECS[name]
+    ys, xs = sl[roi]
+    crop = stack[idx, ys, xs]
+    if stat == "bright":
+        v = np.count_nonzero(crop >= int(thr.get("bright_thr", 200)), axis=(1, 2))
+    else:
+        v = crop.mean(axis=(1, 2)) if crop.shape[1] * crop.shape[2] else np.zeros(len(idx))
+    t = float(thr.get(key, default))
+    return v >= t if ge else v < t
+
+def classify_stack(stack: np.ndarray, cfg: Dict, classes: List[str], mask: Optional[np.ndarray] = None,
+                   vals: Optional[np.ndarray] = None, roi: Optional[Dict] = None, thr: Optional[Dict] = None,
+                   plans: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Cascade over an (N, H, W) stack, starting from known (mask, vals) bits
+    (none by default). Returns (pred, mask, vals): mask says which features
+    were computed (or known), vals their values. plans: plan_for(cfg, classes).
+    """
+    stack = np.asarray(stack)
+    if stack.ndim == 2:
+        stack = stack[None]
+    n, h, w = stack.shape
+    dec, nxt = plans or plan_for(cfg, classes)
+    mask = np.zeros(n, dtype=np.int64) if mask is None else np.asarray(mask, dtype=np.int64).copy()
+    vals = np.zeros(n, dtype=np.int64) if vals is None else np.asarray(vals, dtype=np.int64) & mask
+    sl = _roi_slices(roi or cfg["rules"]["roi"], h, w)
+    thr = thr or cfg["rules"]["thresholds"]
+    while True:
+        f = nxt[mask, vals]
+        active = np.flatnonzero(f >= 0)
+        if not len(active):
+            return dec[mask, vals], mask, vals
+        for k in np.unique(f[active]):
+            idx = active[f[active] == k]
+            v = _feature(stack, idx, FEATURE_NAMES[k], sl, thr)
+            mask[idx] |= 1 << k
+            vals[idx] |= v.astype(np.int64) << k
+
+def classify_arrays(arrs, cfg: Dict, classes: List[str], mask: Optional[np.ndarray] = None,
+                    vals: Optional[np.ndarray] = None, plans: Optional[Tuple[np.ndarray, np.ndarray]] = None
+                    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    classify_stack for an (N, H, W) stack or a list of (H, W) arrays, one call
+    per distinct size; sizes other than the reference follow rules.fullres
+    like detect_features_arrays.
+    """
+    n = len(arrs)
+    mask = np.zeros(n, dtype=np.int64) if mask is None else np.asarray(mask, dtype=np.int64)
+    vals = np.zeros(n, dtype=np.int64) if vals is None else np.asarray(vals, dtype=np.int64)
+    ref = reference_size(cfg)
+    mode = fullres_cfg(cfg)["mode"]
+    plans = plans or plan_for(cfg, classes)
+    if isinstance(arrs, np.ndarray) and arrs.ndim == 3:
+        if arrs.shape[1:] == ref[::-1] or mode == "off":
+            return classify_stack(arrs, cfg, classes, mask, vals, plans=plans)
+        arrs = list(arrs)
+    groups: Dict[Tuple[int, ...], List[int]] = {}
+    for i, a in enumerate(arrs):
+        groups.setdefault(a.shape, []).append(i)
+    pred = np.zeros(n, dtype=np.int64)
+    out_m, out_v = mask.copy(), vals.copy()
+    for (h, w), idx in groups.items():
+        roi = thr = None
+        if (w, h) != ref and mode == "decimate":
+            stack = np.stack([decimate(arrs[i], ref) for i in idx])
+        else:
+            stack = np.stack([arrs[i] for i in idx])
+            if (w, h) != ref and mode == "scale":
+                roi, thr = scaled_rules(cfg, h, w)
+        pred[idx], out_m[idx], out_v[idx] = classify_stack(stack, cfg, classes, mask[idx], vals[idx], roi, thr, plans)
+    return pred, out_m, out_v
+
+def _overlap(lo: int, hi: int, n: int, step: float) -> np.ndarray:
+    # length of [lo, hi) inside each of the n draft cells [j*step, (j+1)*step)
+    e = np.arange(n + 1) * step
+    return np.clip(np.minimum(hi, e[1:]) - np.maximum(lo, e[:-1]), 0, None)
+
+def draft_bounds(arr: np.ndarray, cfg: Dict) -> Dict[str, Tuple[float, float]]:
+    """
+    {feature: (lo, hi)} bounds on each feature statistic of the reference
+    image, from a draft whose pixels are block means of it. A block of B
+    pixels with mean m holds at most S/t and at least B(m - t + 1)/(256 - t)
+    pixels >= t (S = B*m), and a part of k of its pixels sums to between
+    S - (B - k)*255 and min(k*255, S).
+    """
+    rw, rh = reference_size(cfg)
+    dh, dw = arr.shape
+    bx, by = rw / float(dw), rh / float(dh)
+    B = bx * by
+    m = arr.astype(np.float64)
+    S = B * m
+    thr = cfg["rules"]["thresholds"]
+    t = float(int(thr.get("bright_thr", 200)))
+    c_hi = np.minimum(B, S / t)
+    c_lo = np.clip(B * (m - t + 1) / (256.0 - t), 0, B)
+    sl = _roi_slices(cfg["rules"]["roi"], rh, rw)
+    out = {}
+    for name, (roi, stat, _, _, _) in SPECS.items():
+        ys, xs = sl[roi]
+        k = np.outer(_overlap(ys.start, ys.stop, dh, by), _overlap(xs.start, xs.stop, dw, bx))
+        if stat == "bright":
+            lo = np.maximum(0, c_lo - (B - k))[k > 0].sum()
+            hi = np.minimum(k, c_hi)[k > 0].sum()
+        else:
+            area = (ys.stop - ys.start) * (xs.stop - xs.start)
+            lo = np.maximum(0, S - (B - k) * 255)[k > 0].sum() / max(area, 1)
+            hi = np.minimum(k * 255, S)[k > 0].sum() / max(area, 1)
+        out[name] = (float(lo), float(hi))
+    return out
+
+def _draft_bits(arr: np.ndarray, cfg: Dict, margin: float) -> Tuple[int, int]:
+    # features whose threshold lies outside the draft bounds (widened by margin for decoder error)
+    thr = cfg["rules"]["thresholds"]
+    bounds = draft_bounds(arr, cfg)
+    mask = vals = 0
+    for k, name in enumerate(FEATURE_NAMES):
+        _, _, key, default, ge = SPECS[name]
+        lo, hi = bounds[name]
+        t = float(thr.get(key, default))
+        tol = margin * max(t, 1.0)
+        if hi < t - tol or lo >= t + tol:
+            mask |= 1 << k
+            vals |= int((lo >= t) == ge) << k
+    return mask, vals
+
+def staged_decode(path, cfg: Dict, classes: List[str], decode_full, draft_scale: int = 2,
+                  margin: float = DRAFT_MARGIN, plans: Optional[Tuple[np.ndarray, np.ndarray]] = None
+                  ) -> Tuple[Optional[np.ndarray], int, int]:
+    """
+    Draft-first decode for the prefetch threads: (None, mask, vals) when the
+    draft alone settles the class, else (full array, mask, vals) with the
+    draft's confident bits for classify_arrays. Pass plans=plan_for(cfg,
+    classes) once rather than per image.
+    """
+    if draft_scale > 1:
+        with Image.open(path) as im:
+            jpeg = im.format == "JPEG"
+            if jpeg:
+                rw, rh = reference_size(cfg)
+                size = (max(1, rw // draft_scale), max(1, rh // draft_scale))
+                im.draft("L", size)
+                mask, vals = _draft_bits(decimate(im, size), cfg, margin)
+        if hasattr(path, "seek"):  # in-memory bytes (datasets/remote.py) are read again below
+            path.seek(0)
+        if jpeg:
+            dec, _ = plans or plan_for(cfg, classes)
+            if dec[mask, vals] >= 0:
+                return None, mask, vals
+            return decode_full(path), mask, vals
+    return decode_full(path), 0, 0
+
+def classify_staged(staged: List[Tuple[Optional[np.ndarray], int, int]], cfg: Dict, classes: List[str],
+                    plans: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (pred, mask, vals) for staged_decode results: draft-settled images are
+    looked up, the rest go through classify_arrays from their draft bits.
+    """
+    plans = plans or plan_for(cfg, classes)
+    dec = plans[0]
+    mask = np.array([s[1] for s in staged], dtype=np.int64)
+    vals = np.array([s[2] for s in staged], dtype=np.int64)
+    pred = dec[mask, vals]
+    full = [j for j, s in enumerate(staged) if s[0] is not None]
+    if full:
+        pred[full], mask[full], vals[full] = classify_arrays([staged[j][0] for j in full], cfg, classes,
+                                                             mask[full], vals[full], plans)
+    return pred, mask, vals
+
+def partial_features(mask: np.ndarray, vals: np.ndarray) -> Dict[str, List[Optional[bool]]]:
+    """
+    {feature_name: [bool or None (not computed)]}, the cascade's counterpart of
+    detect_features_batch output.
+    """
+    return {k: [bool(v >> b & 1) if m >> b & 1 else None for m, v in zip(mask.tolist(), vals.tolist())]
+            for b, k in enumerate(FEATURE_NAMES)}
@@ -0,0 +1,117 @@
+import hashlib, json, os, sqlite3, time
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+from utils.rules import FEATURE_NAMES
+
+"""
+Persistent per-image feature cache (SQLite, stdlib only).
+
+A row maps  <rules hash>:<file key>  to the 5-bit feature code (bit k =
+FEATURE_NAMES[k]). The rules hash covers rules.roi / rules.thresholds /
+rules.fullres, so editing any of them starts a fresh key space (old rows age
+out through LRU eviction). File keys:
+
+    stat     path + mtime_ns + size      (no file read at all on a hit)
+    content  sha1 of the file bytes      (survives copies / touch, costs a read)
+
+Config (classifier_letournel.yaml):
+
+    cache:
+      enabled: true                  # off unless set
+      path: "outputs/cache/features.sqlite"
+      key: "stat"
+      max_items: 2000000
+
+Safe to share between processes (WAL journal, busy timeout).
+"""
+
+def rules_hash(cfg: Dict) -> str:
+    r = cfg["rules"]
+    blob = json.dumps({k: r.get(k) for k in ("roi", "thresholds", "fullres")}, sort_keys=True)
+    return hashlib.sha1(blob.encode()).hexdigest()[:16]
+
+def file_key(path: str, mode: str = "stat") -> str:
+    if mode == "stat":
+        st = os.stat(path)
+        return f"{os.path.abspath(path)}|{st.st_mtime_ns}|{st.st_size}"
+    if mode == "content":
+        h = hashlib.sha1()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        return h.hexdigest()
+    raise ValueError(f"unknown cache key mode {mode!r}")
+
+def codes_to_features(codes: np.ndarray) -> Dict[str, np.ndarray]:
+    codes = np.asarray(codes, dtype=np.int64)
+    return {k: ((codes >> b) & 1).astype(bool) for b, k in enumerate(FEATURE_NAMES)}
+
+class FeatureCache:
+    def __init__(self, path: str, rules_key: str, key_mode: str = "stat", max_items: int = 2_000_000):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path, self.rules_key, self.key_mode, self.max_items = path, rules_key, key_mode, max_items
+        self.db = sqlite3.connect(path, timeout=60.0)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS features (key TEXT PRIMARY KEY, code INTEGER NOT NULL, used REAL NOT NULL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS features_used ON features(used)")
+        self.db.commit()
+        self.hits = self.misses = 0
+
+    @classmethod
+    def from_cfg(cls, cfg: Dict) -> Optional["FeatureCache"]:
+        c = cfg.get("cache") or {}
+        if not (c.get("enabled", False) and c.get("path")):
+            return None
+        return cls(c["path"], rules_hash(cfg), c.get("key", "stat"), int(c.get("max_items", 2_000_000)))
+
+    def keys(self, paths: Iterable[str]) -> List[Optional[str]]:
+        # None for files that cannot be stat'ed / read: they are always recomputed
+        out = []
+        for p in paths:
+            try:
+                out.append(f"{self.rules_key}:{file_key(p, self.key_mode)}")
+            except OSError:
+                out.append(None)
+        return out
+
+    def get_many(self, keys: List[Optional[str]]) -> Dict[str, int]:
+        """
+        {key: code} for the keys present; refreshes their LRU stamp.
+        """
+        found: Dict[str, int] = {}
+        want = [k for k in keys if k is not None]
+        for s in range(0, len(want), 500):  # stay under SQLite's host-parameter limit
+            part = want[s:s+500]
+            q = "SELECT key, code FROM features WHERE key IN (%s)" % ",".join("?" * len(part))
+            found.update(self.db.execute(q, part).fetchall())
+        if found:
+            now = time.time()
+            self.db.executemany("UPDATE features SET used=? WHERE key=?", [(now, k) for k in found])
+            self.db.commit()
+        self.hits += len(found); self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, keys: List[Optional[str]], codes: Iterable[int]):
+        now = time.time()
+        rows = [(k, int(c), now) for k, c in zip(keys, codes) if k is not None]
+        if rows:
+            self.db.executemany("INSERT OR REPLACE INTO features (key, code, used) VALUES (?, ?, ?)", rows)
+            self.db.commit()
+
+    def __len__(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM features").fetchone()[0]
+
+    def evict(self) -> int:
+        """
+        Drops least-recently-used rows beyond max_items; returns how many.
+        """
+        extra = len(self) - self.max_items
+        if extra <= 0:
+            return 0
+        self.db.execute("DELETE FROM features WHERE key IN (SELECT key FROM features ORDER BY used LIMIT ?)", (extra,))
+        self.db.commit()
+        return extra
+
+    def close(self):
+        self.db.close()
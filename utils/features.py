@@ -0,0 +1,154 @@
+import hashlib, json, os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from datasets.chunks import load_chunk
+from utils.rules import _roi_slices
+
+"""
+Hand-crafted ROI features for the ML baseline (configs/classifier_sklearn.yaml),
+computed for a whole (N, H, W) stack at once:
+
+    ip_line_mean  mean intensity of the iliopectineal line ROI
+    ii_line_mean  mean intensity of the ilioischial line ROI
+    pw_mean       mean intensity of the posterior wall ROI
+    iw_mean       mean intensity of the iliac wing ROI
+    spur_count    #pixels >= bright_thr in the spur area
+
+plus any number of "mean:<roi>" / "bright:<roi>" features, where <roi> is one
+of the rules.roi boxes, a rules.extra_rois box, or a "<box>@<scale>" variant
+for each scale in rules.roi_scales. Those are all answered by one
+summed-area-table pass per stack (utils/integral.py), so 100+ of them cost
+about the same as five.
+
+feature_matrix() turns a split into one float32 (N, F) matrix and caches it as
+<cache_dir>/feats_<key>.npz; the key covers the file list (path, size, mtime),
+the ROI config and the feature names, so hyperparameter searches and re-runs
+read the matrix instead of the images.
+"""
+
+def _mean(name):
+    def f(stack, sl, thr):
+        ys, xs = sl[name]
+        roi = stack[:, ys, xs]
+        n = roi.shape[1] * roi.shape[2]
+        return roi.reshape(len(stack), -1).sum(axis=1, dtype=np.int64) / float(n) if n else np.zeros(len(stack))
+    return f
+
+def _bright(name):
+    def f(stack, sl, thr):
+        ys, xs = sl[name]
+        return np.count_nonzero(stack[:, ys, xs] >= int(thr.get("bright_thr", 200)), axis=(1, 2))
+    return f
+
+FEATURES: Dict[str, Callable] = {
+    "ip_line_mean": _mean("iliopectineal"),
+    "ii_line_mean": _mean("ilioischial"),
+    "pw_mean":      _mean("posterior_wall"),
+    "iw_mean":      _mean("iliac_wing"),
+    "spur_count":   _bright("spur_area"),
+}
+
+def _engine(cfg: Dict):
+    from utils.integral import engine_for
+    r = cfg["rules"]
+    return engine_for(r["roi"], int(r.get("thresholds", {}).get("bright_thr", 200)),
+                      r.get("extra_rois"), r.get("roi_scales"))
+
+def _roi_feature(name: str) -> Optional[Tuple[str, str]]:
+    kind, _, roi = name.partition(":")
+    return (kind, roi) if kind in ("mean", "bright") and roi else None
+
+def feature_names(cfg: Dict) -> List[str]:
+    names = cfg.get("features") or list(FEATURES)
+    dyn = [n for n in names if n not in FEATURES]
+    boxes = _engine(cfg).index if dyn else {}
+    unknown = [n for n in dyn if (_roi_feature(n) or ("", ""))[1] not in boxes]
+    if unknown:
+        raise ValueError(f"unknown features {unknown}; available: {list(FEATURES)} "
+                         f"and mean:<roi> / bright:<roi> for roi in {list(boxes)}")
+    return names
+
+def extract_features(arrs, cfg: Dict, names: List[str]) -> np.ndarray:
+    """
+    (N, F) float32 for an (N, H, W) stack or a list of (H, W) arrays (grouped by shape).
+    """
+    roi = cfg["rules"]["roi"]; thr = cfg["rules"].get("thresholds", {})
+    if isinstance(arrs, np.ndarray) and arrs.ndim == 3:
+        groups = {arrs.shape[1:]: list(range(len(arrs)))}
+        get = lambda idx: arrs[idx[0]:idx[-1] + 1]
+    else:
+        groups = {}
+        for i, a in enumerate(arrs):
+            groups.setdefault(a.shape, []).append(i)
+        get = lambda idx: np.stack([arrs[i] for i in idx])
+    X = np.zeros((len(arrs), len(names)), dtype=np.float32)
+    dyn = [(j, _roi_feature(n)) for j, n in enumerate(names) if n not in FEATURES]
+    eng = _engine(cfg) if dyn else None
+    for (h, w), idx in groups.items():
+        stack = get(idx)
+        sl = _roi_slices(roi, h, w)
+        for j, n in enumerate(names):
+            if n in FEATURES:
+                X[idx, j] = FEATURES[n](stack, sl, thr)
+        if dyn:
+            r = eng.compute(stack, want=tuple({kind for _, (kind, _) in dyn}))
+            for j, (kind, box) in dyn:
+                X[idx, j] = r[kind][:, eng.index[box]]
+    return X
+
+def _extract_chunk(args) -> np.ndarray:
+    # pool worker: read + decode one chunk and featurize it
+    items, cfg, names, store, start = args
+    return extract_features(load_chunk(items, store, start), cfg, names)
+
+def hash_items(h, items: List[Tuple[str, int]], store: Optional[str] = None):
+    # path, label, size and mtime per item (plus the store files), so replaced images change the hash
+    for p, label in items:
+        try:
+            st = os.stat(p)
+            h.update(f"{p}|{label}|{st.st_size}|{st.st_mtime_ns}\n".encode())
+        except OSError:  # store-only entries: the store's own files are hashed below
+            h.update(f"{p}|{label}\n".encode())
+    if store:
+        for ext in (".json", ".shards.json", ".bin"):
+            if os.path.exists(store + ext):
+                st = os.stat(store + ext)
+                h.update(f"{ext}|{st.st_size}|{st.st_mtime_ns}".encode())
+
+def matrix_key(items: List[Tuple[str, int]], cfg: Dict, names: List[str], store: Optional[str] = None) -> str:
+    h = hashlib.sha1()
+    r = cfg["rules"]
+    h.update(json.dumps({"roi": r["roi"], "thr": r.get("thresholds", {}).get("bright_thr", 200),
+                         "extra_rois": r.get("extra_rois"), "roi_scales": r.get("roi_scales"),
+                         "names": names, "store": store}, sort_keys=True).encode())
+    hash_items(h, items, store)
+    return h.hexdigest()[:20]
+
+def feature_matrix(items: List[Tuple[str, int]], cfg: Dict, names: List[str], cache_dir: Optional[str] = None,
+                   workers: int = 1, chunk_size: int = 512, store: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (X float32 (N, F), y int64 (N,)) for items, loaded from the cache when the
+    key matches, otherwise extracted chunk by chunk (process pool when
+    workers > 1) and saved.
+    """
+    path = None
+    if cache_dir:
+        path = os.path.join(cache_dir, f"feats_{matrix_key(items, cfg, names, store)}.npz")
+        if os.path.exists(path):
+            with np.load(path) as z:
+                return z["X"], z["y"]
+    chunks = [(items[s:s+chunk_size], cfg, names, store, s) for s in range(0, len(items), chunk_size)]
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            parts = list(ex.map(_extract_chunk, chunks))
+    else:
+        parts = [_extract_chunk(c) for c in chunks]
+    X = np.concatenate(parts) if parts else np.zeros((0, len(names)), dtype=np.float32)
+    y = np.asarray([label for _, label in items], dtype=np.int64)
+    if path:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = path[:-4] + ".tmp.npz"
+        np.savez(tmp, X=X, y=y, names=np.asarray(names))
+        os.replace(tmp, path)
+    return X, y
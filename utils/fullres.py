@@ -0,0 +1,110 @@
+from typing import Dict, Tuple
+import numpy as np
+from PIL import Image
+
+"""
+Full-resolution radiographs for the rule classifier.
+
+ROI boxes and pixel-count thresholds in the config live on a
+roi.width x roi.height reference frame (256x256 for the synthetic data).
+Images of any other size are handled according to rules.fullres.mode:
+
+    decimate  box-downsample to the reference size (PIL reduce/resize on
+              uint8, JPEG decoders downscale while decoding) and run the normal
+              path; identical to the 256 path on the downsampled image.
+    scale     stay at full resolution: ROI boxes are scaled to the image and the
+              *_pixels thresholds by the area ratio; ROI pixels are counted in
+              strips of tile_rows rows, so temporaries are bounded per tile.
+    off       (default when the section is missing) old behaviour, ROIs are
+              simply clipped to the image.
+"""
+
+def fullres_cfg(cfg: Dict) -> Dict:
+    fr = cfg["rules"].get("fullres") or {}
+    return {"mode": str(fr.get("mode", "off")).lower(), "tile_rows": int(fr.get("tile_rows", 512))}
+
+def reference_size(cfg: Dict) -> Tuple[int, int]:
+    roi = cfg["rules"]["roi"]
+    return int(roi.get("width", 256)), int(roi.get("height", 256))
+
+def decimate(img, size: Tuple[int, int]) -> np.ndarray:
+    """
+    Box-downsample a PIL image or (H, W) uint8 array to size=(w, h). Integer
+    factors go through Image.reduce (exact block means), any remainder through a
+    BOX resize; never materializes a float copy of the full image.
+    """
+    im = img if isinstance(img, Image.Image) else Image.fromarray(np.ascontiguousarray(img))
+    if im.mode != "L":
+        im = im.convert("L")
+    w, h = im.size
+    if (w, h) == tuple(size):
+        return np.asarray(im)
+    f = min(w // size[0], h // size[1])
+    if f > 1:
+        im = im.reduce(f)
+    if im.size != tuple(size):
+        im = im.resize(size, Image.BOX)
+    return np.asarray(im)
+
+def decode_decimated(path: str, size: Tuple[int, int]) -> np.ndarray:
+    """
+    decode_gray + decimate. draft() lets the JPEG decoder do most of the
+    downscaling (1/2, 1/4, 1/8) before the full image is ever decoded.
+    """
+    im = Image.open(path)
+    im.draft("L", tuple(size))
+    return decimate(im, size)
+
+def scaled_rules(cfg: Dict, h: int, w: int) -> Tuple[Dict, Dict]:
+    """
+    ROI boxes and thresholds for an (h, w) image: boxes scale per axis, pixel
+    counts by the area ratio, bright_thr / fragment_mean (intensities) stay.
+    """
+    rw, rh = reference_size(cfg)
+    sx, sy = w / float(rw), h / float(rh)
+    roi = {}
+    for name in ["iliopectineal", "ilioischial", "spur_area", "posterior_wall", "iliac_wing"]:
+        x0, y0, x1, y1 = cfg["rules"]["roi"][name]
+        roi[name] = [int(round(x0 * sx)), int(round(y0 * sy)), int(round(x1 * sx)), int(round(y1 * sy))]
+    thr = dict(cfg["rules"]["thresholds"])
+    for k, default in (("line_pixels", 620), ("pw_pixels", 800), ("spur_pixels", 100)):
+        thr[k] = int(round(float(thr.get(k, default)) * sx * sy))
+    return roi, thr
+
+def roi_counts_tiled(arr: np.ndarray, roi: Dict, bright_thr: int, tile_rows: int = 512) -> Dict[str, float]:
+    """
+    Bright-pixel counts per ROI and the iliac-wing mean, accumulated over row
+    strips of an (H, W) uint8 image.
+    """
+    from utils.rules import _roi_slices
+    h, w = arr.shape
+    sl = _roi_slices(roi, h, w)
+    counts = {name: 0 for name in sl}
+    iw_sum = 0
+    for r0 in range(0, h, tile_rows):
+        r1 = min(h, r0 + tile_rows)
+        for name, (ys, xs) in sl.items():
+            a, b = max(ys.start, r0), min(ys.stop, r1)
+            if a >= b:
+                continue
+            tile = arr[a:b, xs]
+            if name == "iliac_wing":
+                iw_sum += int(tile.sum(dtype=np.int64))
+            else:
+                counts[name] += int(np.count_nonzero(tile >= bright_thr))
+    ys, xs = sl["iliac_wing"]
+    area = (ys.stop - ys.start) * (xs.stop - xs.start)
+    counts["iliac_wing_mean"] = iw_sum / area if area else 0.0
+    return counts
+
+def detect_features_scaled(arr: np.ndarray, cfg: Dict, tile_rows: int = 512) -> Dict[str, bool]:
+    h, w = arr.shape
+    roi, thr = scaled_rules(cfg, h, w)
+    c = roi_counts_tiled(arr, roi, int(thr.get("bright_thr", 200)), tile_rows)
+    return {
+        "iliopectineal_broken": c["iliopectineal"] < thr["line_pixels"],
+        "ilioischial_broken":   c["ilioischial"] < thr["line_pixels"],
+        "posterior_wall_frag":  c["posterior_wall"] >= thr["pw_pixels"],
+        "spur_sign":            c["spur_area"] >= thr["spur_pixels"],
+        "iliac_wing_involved":  c["iliac_wing_mean"] >= float(thr.get("fragment_mean", 170)),
+    }
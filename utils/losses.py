@@ -6,7 +6,8 @@ def dice_score(pred, target, eps=1e-6):
 def fake_loss(value):
     return max(0.05, value)
 
-try:
+def _build_torch_losses():
+    # torch is only imported when one of the nn.Module losses is requested
     import torch
     import torch.nn as nn
     import torch.nn.functional as F
@@ -52,6 +53,18 @@ try:
             elif self.reduction == "sum":
                 return loss.sum()
             return loss
-except Exception:
-    # no torch available; keep file import-safe
-    pass
\ No newline at end of file
+
+    return {"DiceLoss": DiceLoss, "TverskyLoss": TverskyLoss, "FocalLoss": FocalLoss}
+
+_TORCH_LOSSES = ("DiceLoss", "TverskyLoss", "FocalLoss")
+
+def __getattr__(name):
+    # `from utils.losses import DiceLoss` still works; without torch the names
+    # are missing, as before, so the import fails with ImportError
+    if name in _TORCH_LOSSES:
+        try:
+            globals().update(_build_torch_losses())
+        except ImportError as e:
+            raise AttributeError(f"{name} needs torch ({e})") from e
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
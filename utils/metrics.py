@@ -0,0 +1,227 @@
+from typing import Dict, List
+import numpy as np
+
+# ---------- classification ----------
+def confusion_matrix(y_true, y_pred, ncls: int) -> np.ndarray:
+    t = np.asarray(y_true, dtype=np.int64).ravel()
+    p = np.asarray(y_pred, dtype=np.int64).ravel()
+    return np.bincount(t * ncls + p, minlength=ncls * ncls).reshape(ncls, ncls)
+
+def _safe_div(num: np.ndarray, den: np.ndarray) -> np.ndarray:
+    num = np.asarray(num, dtype=np.float64); den = np.asarray(den, dtype=np.float64)
+    return np.divide(num, den, out=np.zeros_like(num), where=den > 0)
+
+def accuracy(cm: np.ndarray) -> float:
+    total = cm.sum()
+    return float(np.trace(cm)) / float(total) if total > 0 else 0.0
+
+def per_class_accuracy(cm: np.ndarray) -> List[float]:
+    # row-normalized diagonal (== per-class recall)
+    return _safe_div(np.diag(cm), cm.sum(axis=1)).tolist()
+
+def precision_recall_f1(cm: np.ndarray) -> Dict[str, np.ndarray]:
+    tp = np.diag(cm).astype(np.float64)
+    precision = _safe_div(tp, cm.sum(axis=0))
+    recall = _safe_div(tp, cm.sum(axis=1))
+    f1 = _safe_div(2 * precision * recall, precision + recall)
+    return {"precision": precision, "recall": recall, "f1": f1}
+
+class ConfusionAccumulator:
+    """
+    Streaming confusion matrix: update() per chunk, merge() across workers.
+    """
+    def __init__(self, ncls: int):
+        self.ncls = ncls
+        self.cm = np.zeros((ncls, ncls), dtype=np.int64)
+
+    def update(self, y_true, y_pred):
+        self.cm += confusion_matrix(y_true, y_pred, self.ncls)
+        return self
+
+    def merge(self, other):
+        cm = other.cm if isinstance(other, ConfusionAccumulator) else np.asarray(other)
+        self.cm += cm
+        return self
+
+    @property
+    def count(self) -> int:
+        return int(self.cm.sum())
+
+    def accuracy(self) -> float:
+        return accuracy(self.cm)
+
+    def per_class_accuracy(self) -> List[float]:
+        return per_class_accuracy(self.cm)
+
+    def precision_recall_f1(self) -> Dict[str, np.ndarray]:
+        return precision_recall_f1(self.cm)
+
+    def state(self) -> Dict:
+        # JSON-safe snapshot for checkpoints
+        return {"ncls": self.ncls, "cm": self.cm.tolist()}
+
+    @classmethod
+    def from_state(cls, state: Dict) -> "ConfusionAccumulator":
+        acc = cls(int(state["ncls"]))
+        acc.cm[:] = np.asarray(state["cm"], dtype=np.int64)
+        return acc
+
+# ---------- segmentation ----------
+def _as_stack(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x)
+    if x.dtype != bool:
+        x = x > 0.5
+    return x[None] if x.ndim == 2 else x
+
+def overlap_counts(pred: np.ndarray, target: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Per-image intersection / pred / target pixel counts for (N, H, W) (or (H, W))
+    masks; values > 0.5 count as foreground (works for 0/1, 0/255 and bool).
+    """
+    p = _as_stack(pred); t = _as_stack(target)
+    n = p.shape[0]
+    return {
+        "inter": np.count_nonzero((p & t).reshape(n, -1), axis=1),
+        "pred": np.count_nonzero(p.reshape(n, -1), axis=1),
+        "target": np.count_nonzero(t.reshape(n, -1), axis=1),
+    }
+
+def dice_batch(pred: np.ndarray, target: np.ndarray, eps: float = 1e-6) -> np.ndarray:
+    c = overlap_counts(pred, target)
+    return (2 * c["inter"] + eps) / (c["pred"] + c["target"] + eps)
+
+def iou_batch(pred: np.ndarray, target: np.ndarray, eps: float = 1e-6) -> np.ndarray:
+    c = overlap_counts(pred, target)
+    return (c["inter"] + eps) / (c["pred"] + c["target"] - c["inter"] + eps)
+
+def boundary(mask: np.ndarray) -> np.ndarray:
+    """
+    Foreground pixels with at least one 4-neighbour in the background (or on the
+    image border), for an (N, H, W) stack.
+    """
+    m = _as_stack(mask)
+    inner = np.zeros_like(m)
+    inner[:, 1:-1, 1:-1] = (m[:, 1:-1, 1:-1] & m[:, :-2, 1:-1] & m[:, 2:, 1:-1]
+                            & m[:, 1:-1, :-2] & m[:, 1:-1, 2:])
+    return m & ~inner
+
+def hausdorff_batch(pred: np.ndarray, target: np.ndarray, percentile: float = 95.0):
+    """
+    Per-image symmetric Hausdorff distance and its `percentile` variant (HD95)
+    between mask boundaries, in pixels. One exact 2-D distance transform per
+    image and direction, so peak memory is a few (H, W) maps whatever the
+    batch size. Returns two (N,) float arrays: 0 when both masks are empty,
+    nan when only one is.
+    """
+    from scipy.ndimage import distance_transform_edt
+    p, t = _as_stack(pred), _as_stack(target)
+    n = p.shape[0]
+    hd = np.zeros(n); hdp = np.zeros(n)
+    for i in range(n):
+        bp, bt = boundary(p[i])[0], boundary(t[i])[0]
+        has_p, has_t = bp.any(), bt.any()
+        if has_p != has_t:
+            hd[i] = hdp[i] = np.nan
+        elif has_p:
+            d = np.concatenate([distance_transform_edt(~bt)[bp], distance_transform_edt(~bp)[bt]])
+            hd[i] = d.max(); hdp[i] = np.percentile(d, percentile)
+    return hd, hdp
+
+class StreamingStats:
+    """
+    Bounded-memory summary of a score stream: exact count / mean / min / max,
+    quantiles from a fixed histogram over [0, hi] (linear bins, or log1p bins
+    for unbounded distances, i.e. constant relative precision), accurate to
+    half a bin. Values above hi land in the last bin; nan values are skipped.
+    Mergeable like the accumulators above.
+    """
+    def __init__(self, hi: float = 1.0, bins: int = 10000, log: bool = False):
+        self.hi, self.bins, self.log = hi, bins, log
+        self.edge = float(np.log1p(hi) if log else hi)
+        self.counts = np.zeros(bins + 1, dtype=np.int64)
+        self.n = 0
+        self.total = 0.0
+        self.min, self.max = np.inf, -np.inf
+
+    def update(self, values):
+        v = np.asarray(values, dtype=np.float64).ravel()
+        v = v[~np.isnan(v)]
+        if not len(v):
+            return self
+        x = np.log1p(np.maximum(v, 0)) if self.log else np.maximum(v, 0)
+        self.counts += np.bincount(np.clip(np.rint(x / self.edge * self.bins), 0, self.bins).astype(np.int64),
+                                   minlength=self.bins + 1)
+        self.n += len(v); self.total += float(v.sum())
+        self.min = min(self.min, float(v.min())); self.max = max(self.max, float(v.max()))
+        return self
+
+    def merge(self, other: "StreamingStats"):
+        self.counts += other.counts
+        self.n += other.n; self.total += other.total
+        self.min = min(self.min, other.min); self.max = max(self.max, other.max)
+        return self
+
+    def mean(self) -> float:
+        return self.total / self.n if self.n else 0.0
+
+    def _value(self, k: int) -> float:
+        # k-th smallest value (0-based), as its bin centre
+        b = int(np.searchsorted(np.cumsum(self.counts), k, side="right"))
+        x = b / self.bins * self.edge
+        return float(np.expm1(x) if self.log else x)
+
+    def percentile(self, q: float) -> float:
+        """
+        Like np.percentile (linear interpolation between ranks), clamped to [min, max].
+        """
+        if not self.n:
+            return 0.0
+        r = q / 100.0 * (self.n - 1)
+        lo = int(np.floor(r))
+        v = self._value(lo)
+        if lo + 1 < self.n:
+            v += (r - lo) * (self._value(lo + 1) - v)
+        return min(max(v, self.min), self.max)
+
+class SegmentationAccumulator:
+    """
+    Streaming Dice/IoU: keeps per-image score sums (mean over images) and global
+    pixel counts (dataset-level Dice/IoU). Mergeable like ConfusionAccumulator.
+    """
+    def __init__(self, eps: float = 1e-6):
+        self.eps = eps
+        self.n = 0
+        self.dice_sum = 0.0
+        self.iou_sum = 0.0
+        self.inter = 0
+        self.pred = 0
+        self.target = 0
+
+    def update(self, pred: np.ndarray, target: np.ndarray):
+        c = overlap_counts(pred, target)
+        return self.update_counts(c["inter"], c["pred"], c["target"])
+
+    def update_counts(self, inter, pred, target):
+        inter = np.asarray(inter); pred = np.asarray(pred); target = np.asarray(target)
+        e = self.eps
+        self.dice_sum += float(((2 * inter + e) / (pred + target + e)).sum())
+        self.iou_sum += float(((inter + e) / (pred + target - inter + e)).sum())
+        self.inter += int(inter.sum()); self.pred += int(pred.sum()); self.target += int(target.sum())
+        self.n += int(inter.size)
+        return self
+
+    def merge(self, other: "SegmentationAccumulator"):
+        self.n += other.n
+        self.dice_sum += other.dice_sum; self.iou_sum += other.iou_sum
+        self.inter += other.inter; self.pred += other.pred; self.target += other.target
+        return self
+
+    def summary(self) -> Dict[str, float]:
+        e = self.eps
+        return {
+            "n": self.n,
+            "mean_dice": self.dice_sum / self.n if self.n else 0.0,
+            "mean_iou": self.iou_sum / self.n if self.n else 0.0,
+            "global_dice": (2 * self.inter + e) / (self.pred + self.target + e),
+            "global_iou": (self.inter + e) / (self.pred + self.target - self.inter + e),
+        }
@@ -0,0 +1,154 @@
+import json, os, threading, time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+"""
+Opt-in per-stage timers and counters for the entry points.
+
+    instr = profiling.Instrument(enabled=True, trace=True)
+    profiling.use(instr)
+    with profiling.stage("decode", n=len(batch)):
+        ...
+    instr.save("outputs/logs/timing.json")          # summary
+    instr.save("outputs/logs/timing.trace.json")    # Chrome trace (chrome://tracing, Perfetto)
+
+When disabled (the default) stage() is a shared no-op context manager.
+"""
+
+class _Noop:
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+_NOOP = _Noop()
+
+class Instrument:
+    def __init__(self, enabled: bool = False, trace: bool = False):
+        self.enabled, self.trace = enabled, trace
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, int] = {}
+        self.events: List[Dict] = []
+        self.extra: Dict = {}
+        self._lock = threading.Lock()
+
+    def stage(self, name: str, n: int = 0):
+        if not self.enabled:
+            return _NOOP
+        return self._stage(name, n)
+
+    @contextmanager
+    def _stage(self, name: str, n: int):
+        t0 = time.perf_counter_ns()
+        try:
+            yield self
+        finally:
+            dt = time.perf_counter_ns() - t0
+            with self._lock:
+                s = self.stages.setdefault(name, {"calls": 0, "items": 0, "total_s": 0.0, "max_s": 0.0})
+                s["calls"] += 1; s["items"] += n
+                s["total_s"] += dt / 1e9; s["max_s"] = max(s["max_s"], dt / 1e9)
+                if self.trace:
+                    self.events.append({"name": name, "ph": "X", "ts": t0 / 1000.0, "dur": dt / 1000.0,
+                                        "pid": os.getpid(), "tid": threading.get_ident(), "args": {"n": n}})
+
+    def count(self, name: str, k: int = 1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + k
+
+    def state(self) -> Dict:
+        """
+        Picklable snapshot, e.g. to send back from a pool worker and merge().
+        """
+        return {"stages": self.stages, "counters": self.counters, "events": self.events}
+
+    def merge(self, state: Optional[Dict]):
+        if not state or not self.enabled:
+            return
+        with self._lock:
+            for name, o in state["stages"].items():
+                s = self.stages.setdefault(name, {"calls": 0, "items": 0, "total_s": 0.0, "max_s": 0.0})
+                s["calls"] += o["calls"]; s["items"] += o["items"]
+                s["total_s"] += o["total_s"]; s["max_s"] = max(s["max_s"], o["max_s"])
+            for k, v in state["counters"].items():
+                self.counters[k] = self.counters.get(k, 0) + v
+            if self.trace:
+                self.events.extend(state["events"])
+
+    def summary(self) -> Dict:
+        stages = {}
+        for name, s in self.stages.items():
+            stages[name] = dict(s, items_per_s=(s["items"] / s["total_s"]) if s["total_s"] > 0 and s["items"] else None)
+        return {"stages": stages, "counters": dict(self.counters), **self.extra}
+
+    def report(self) -> str:
+        lines = [f"{'stage':14s} {'calls':>7s} {'items':>8s} {'total s':>9s} {'items/s':>10s}"]
+        for name, s in self.summary()["stages"].items():
+            ips = f"{s['items_per_s']:10.1f}" if s["items_per_s"] else f"{'-':>10s}"
+            lines.append(f"{name:14s} {s['calls']:7d} {s['items']:8d} {s['total_s']:9.3f} {ips}")
+        for k, v in self.counters.items():
+            lines.append(f"{k}: {v}")
+        return "\n".join(lines)
+
+    def save(self, path: str, fmt: Optional[str] = None):
+        """
+        fmt "chrome" writes Chrome trace events; "json" the summary. Default:
+        chrome when path ends with .trace.json.
+        """
+        fmt = fmt or ("chrome" if path.endswith(".trace.json") else "json")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            if fmt == "chrome":
+                json.dump({"traceEvents": self.events, "displayTimeUnit": "ms", "otherData": self.summary()}, f)
+            else:
+                json.dump(self.summary(), f, indent=2)
+
+_current = Instrument(enabled=False)
+
+def current() -> Instrument:
+    return _current
+
+def use(instr: Instrument) -> Instrument:
+    global _current
+    _current = instr
+    return instr
+
+def stage(name: str, n: int = 0):
+    return _current.stage(name, n)
+
+def count(name: str, k: int = 1):
+    _current.count(name, k)
+
+@contextmanager
+def profiled(mode: Optional[str], out_prefix: str, top: int = 20):
+    """
+    mode "cprofile": dump <out_prefix>.prof and print the top cumulative entries.
+    mode "tracemalloc": record peak traced memory and top allocation sites into
+    current().extra["tracemalloc"]. None: no-op.
+    """
+    if mode == "cprofile":
+        import cProfile, pstats
+        pr = cProfile.Profile()
+        pr.enable()
+        try:
+            yield
+        finally:
+            pr.disable()
+            os.makedirs(os.path.dirname(out_prefix) or ".", exist_ok=True)
+            pr.dump_stats(out_prefix + ".prof")
+            pstats.Stats(pr).sort_stats("cumulative").print_stats(top)
+    elif mode == "tracemalloc":
+        import tracemalloc
+        tracemalloc.start()
+        try:
+            yield
+        finally:
+            snap = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            _current.extra["tracemalloc"] = {
+                "peak_mb": peak / (1024.0 * 1024.0),
+                "top": [{"where": str(s.traceback[0]), "size_kb": s.size / 1024.0, "count": s.count}
+                        for s in snap.statistics("lineno")[:top]],
+            }
+    else:
+        yield
@@ -0,0 +1,176 @@
+import csv, os, threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+"""
+Report artifacts for train_cls.py and a background writer for them.
+
+    with ReportWriter("thread") as rw:            # or "process" for CPU-heavy plots
+        rw.submit(write_report_csv, path, cm, classes)
+        rw.submit(render_heatmap, cm, classes, "cm.png")
+        ...                                        # main thread keeps going
+    # leaving the block waits for the writes and re-raises the first error
+
+render_heatmap is a NumPy/PIL confusion-matrix image: the cells are one
+colormap lookup plus np.repeat, and counts are only drawn when the cells are
+big enough to hold them, so hundreds of classes render in milliseconds.
+"""
+
+# viridis anchors (matplotlib's default imshow map), interpolated to 256 entries
+_VIRIDIS = np.array([
+    [68, 1, 84], [72, 40, 120], [62, 74, 137], [49, 104, 142], [38, 130, 142],
+    [31, 158, 137], [53, 183, 121], [109, 205, 89], [180, 222, 44], [253, 231, 37]], dtype=np.float64)
+_CMAP = np.stack([np.interp(np.linspace(0, 1, 256), np.linspace(0, 1, len(_VIRIDIS)), _VIRIDIS[:, c])
+                  for c in range(3)], axis=1).round().astype(np.uint8)
+
+def per_class_table(cm: np.ndarray, classes: List[str]) -> List[Dict]:
+    from utils.metrics import per_class_accuracy, precision_recall_f1
+    acc = per_class_accuracy(cm)
+    prf = precision_recall_f1(cm)
+    support = cm.sum(axis=1); predicted = cm.sum(axis=0)
+    return [{"class": c, "support": int(support[i]), "predicted": int(predicted[i]), "acc": acc[i],
+             "precision": float(prf["precision"][i]), "recall": float(prf["recall"][i]), "f1": float(prf["f1"][i])}
+            for i, c in enumerate(classes)]
+
+def write_report_csv(path: str, cm: np.ndarray, classes: List[str]):
+    """
+    metric,value CSV: accuracy, acc_<cls>, then precision_/recall_/f1_<cls>.
+    """
+    from utils.metrics import accuracy
+    rows = per_class_table(cm, classes)
+    with open(path, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["metric", "value"])
+        w.writerow(["accuracy", f"{accuracy(cm):.4f}"])
+        for r in rows:
+            w.writerow([f"acc_{r['class']}", f"{r['acc']:.4f}"])
+        for k in ["precision", "recall", "f1"]:
+            for r in rows:
+                w.writerow([f"{k}_{r['class']}", f"{r[k]:.4f}"])
+
+def write_per_class_csv(path: str, cm: np.ndarray, classes: List[str]):
+    """
+    One row per class: support, predicted count, acc, precision, recall, f1.
+    """
+    rows = per_class_table(cm, classes)
+    with open(path, "w", newline="") as f:
+        w = csv.DictWriter(f, ["class", "support", "predicted", "acc", "precision", "recall", "f1"])
+        w.writeheader()
+        for r in rows:
+            w.writerow({k: f"{v:.4f}" if isinstance(v, float) else v for k, v in r.items()})
+
+def _text_size(draw: ImageDraw.ImageDraw, text: str, font) -> tuple:
+    x0, y0, x1, y1 = draw.textbbox((0, 0), text, font=font)
+    return x1 - x0, y1 - y0
+
+def render_heatmap(cm: np.ndarray, classes: List[str], out_path: str,
+                   title: str = "Confusion Matrix (rule-based)", cell: Optional[int] = None):
+    """
+    Confusion-matrix PNG without matplotlib. Rows = true, columns = predicted.
+    cell is the cell size in pixels (default: shrinks with the class count).
+    """
+    cm = np.asarray(cm)
+    n = len(classes)
+    cell = cell or int(np.clip(600 // max(1, n), 4, 48))
+    font = ImageFont.load_default()
+    probe = ImageDraw.Draw(Image.new("L", (1, 1)))
+    labels = cell >= 8
+    lab_w = max((_text_size(probe, c, font)[0] for c in classes), default=0) + 8 if labels else 0
+    line_h = _text_size(probe, "Ag", font)[1] + 4
+    top = line_h + 8
+    left = lab_w + line_h + 4
+    bottom = lab_w + line_h + 4
+    W, H = left + n * cell + 8, top + n * cell + bottom
+    canvas = np.full((H, W, 3), 255, dtype=np.uint8)
+
+    v = cm.astype(np.float64)
+    idx = np.zeros(v.shape, dtype=np.int64) if v.max() <= v.min() else \
+        ((v - v.min()) / (v.max() - v.min()) * 255).round().astype(np.int64)
+    grid = np.repeat(np.repeat(_CMAP[idx], cell, axis=0), cell, axis=1)
+    canvas[top:top + n * cell, left:left + n * cell] = grid
+    im = Image.fromarray(canvas)
+    d = ImageDraw.Draw(im)
+    tw, _ = _text_size(d, title, font)
+    d.text((left + max(0, (n * cell - tw) // 2), 4), title, fill=(0, 0, 0), font=font)
+
+    if labels:
+        for i, c in enumerate(classes):
+            w_, h_ = _text_size(d, c, font)
+            d.text((left - w_ - 4, top + i * cell + (cell - h_) // 2), c, fill=(0, 0, 0), font=font)
+        # x labels: right-aligned on a horizontal strip, turned 90 degrees counter-clockwise
+        # (strip row j becomes column j, the text ends next to the grid)
+        strip = Image.new("RGB", (lab_w, n * cell), (255, 255, 255))
+        sd = ImageDraw.Draw(strip)
+        for j, c in enumerate(classes):
+            w_, h_ = _text_size(sd, c, font)
+            sd.text((lab_w - w_ - 4, j * cell + (cell - h_) // 2), c, fill=(0, 0, 0), font=font)
+        im.paste(strip.rotate(90, expand=True), (left, top + n * cell + 2))
+    yl = Image.new("RGB", (_text_size(d, "True", font)[0] + 2, line_h), (255, 255, 255))
+    ImageDraw.Draw(yl).text((0, 0), "True", fill=(0, 0, 0), font=font)
+    im.paste(yl.rotate(90, expand=True), (2, top + max(0, (n * cell - yl.size[0]) // 2)))
+    xw, _ = _text_size(d, "Predicted", font)
+    d.text((left + max(0, (n * cell - xw) // 2), H - line_h), "Predicted", fill=(0, 0, 0), font=font)
+
+    digits = len(str(int(cm.max()))) if cm.size else 1
+    if cell >= 6 * digits + 6:
+        dark = idx < 128
+        for i in range(n):
+            for j in range(n):
+                s = str(int(cm[i, j]))
+                w_, h_ = _text_size(d, s, font)
+                d.text((left + j * cell + (cell - w_) // 2, top + i * cell + (cell - h_) // 2), s,
+                       fill=(255, 255, 255) if dark[i, j] else (0, 0, 0), font=font)
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    im.save(out_path)
+
+class ReportWriter:
+    """
+    Runs artifact writers off the main thread: mode "thread" (one background
+    thread, good for I/O and PIL), "process" (one worker process, for
+    matplotlib), or "sync" (inline, for debugging). Jobs run in submit order;
+    close() waits for them and re-raises the first failure.
+    """
+    def __init__(self, mode: str = "thread"):
+        if mode not in ("thread", "process", "sync"):
+            raise ValueError(f"unknown report writer mode {mode!r}")
+        self.mode = mode
+        self.ex = None
+        if mode == "thread":
+            self.ex = ThreadPoolExecutor(max_workers=1, thread_name_prefix="report")
+        elif mode == "process":
+            self.ex = ProcessPoolExecutor(max_workers=1)
+        self.futures: List[Future] = []
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        if self.ex is None:
+            fut: Future = Future()
+            try:
+                fut.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                fut.set_exception(e)
+        else:
+            fut = self.ex.submit(fn, *args, **kwargs)
+        with self._lock:
+            self.futures.append(fut)
+        return fut
+
+    def close(self):
+        try:
+            for fut in self.futures:
+                fut.result()
+        finally:
+            if self.ex is not None:
+                self.ex.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.close()
+        elif self.ex is not None:
+            self.ex.shutdown(wait=True)
+        return False
@@ -1,4 +1,5 @@
-﻿from typing import Dict, Tuple, List
+﻿import json
+from typing import Dict, Tuple, List
 import numpy as np
 from PIL import Image
 
@@ -17,6 +18,134 @@ def _mean_intensity(arr: np.ndarray) -> float:
 def _bright_count(arr: np.ndarray, thr: int) -> int:
     return int((arr >= thr).sum())
 
+FEATURE_NAMES = [
+    "iliopectineal_broken",
+    "ilioischial_broken",
+    "posterior_wall_frag",
+    "spur_sign",
+    "iliac_wing_involved",
+]
+
+def _roi_slices(roi: Dict, h: int, w: int) -> Dict[str, Tuple[slice, slice]]:
+    """
+    Same clipping as _roi_crop, but as (rows, cols) slices into an (H, W) array.
+    """
+    out = {}
+    for name in ["iliopectineal", "ilioischial", "spur_area", "posterior_wall", "iliac_wing"]:
+        x0, y0, x1, y1 = roi[name]
+        x0 = max(0, min(x0, w-1)); x1 = max(0, min(x1, w))
+        y0 = max(0, min(y0, h-1)); y1 = max(0, min(y1, h))
+        out[name] = (slice(y0, max(y0, y1)), slice(x0, max(x0, x1)))
+    return out
+
+def detect_features_batch(stack: np.ndarray, cfg: Dict) -> Dict[str, np.ndarray]:
+    """
+    Vectorized detect_features over an (N, H, W) uint8 stack.
+    Returns {feature_name: bool array of shape (N,)}. rules.engine picks how
+    the ROIs are measured: "slices" (default) or "sat" (utils/integral.py).
+    """
+    stack = np.asarray(stack)
+    if stack.ndim == 2:
+        stack = stack[None]
+    n, h, w = stack.shape
+    thr = cfg["rules"]["thresholds"]
+    bright_thr = int(thr.get("bright_thr", 200))
+    engine = cfg["rules"].get("engine", "slices")
+    if engine == "sat":
+        from utils.integral import engine_for
+        eng = engine_for(cfg["rules"]["roi"], bright_thr)
+        r = eng.compute(stack)
+        bright = lambda name: r["bright"][:, eng.index[name]]
+        iw_mean = r["mean"][:, eng.index["iliac_wing"]]
+    elif engine == "slices":
+        sl = _roi_slices(cfg["rules"]["roi"], h, w)
+
+        def bright(name):
+            ys, xs = sl[name]
+            return np.count_nonzero(stack[:, ys, xs] >= bright_thr, axis=(1, 2))
+
+        ys, xs = sl["iliac_wing"]
+        iw = stack[:, ys, xs]
+        iw_mean = iw.mean(axis=(1, 2)) if iw.shape[1] * iw.shape[2] else np.zeros(n)
+    else:
+        raise ValueError(f"unknown rules.engine {engine!r}")
+
+    line_pixels_thr = int(thr.get("line_pixels", 620))
+    feats = {}
+    feats["iliopectineal_broken"] = bright("iliopectineal") < line_pixels_thr
+    feats["ilioischial_broken"]   = bright("ilioischial") < line_pixels_thr
+    feats["posterior_wall_frag"]  = bright("posterior_wall") >= int(thr.get("pw_pixels", 800))
+    feats["spur_sign"]            = bright("spur_area") >= int(thr.get("spur_pixels", 100))
+    feats["iliac_wing_involved"]  = iw_mean >= float(thr.get("fragment_mean", 170))
+    return feats
+
+def detect_features_arrays(arrs, cfg: Dict) -> Dict[str, np.ndarray]:
+    """
+    detect_features_batch for an (N, H, W) stack or a list of (H, W) arrays of
+    possibly different sizes (one batched call per distinct shape). Sizes other
+    than roi.width x roi.height go through utils.fullres when rules.fullres is set.
+    """
+    from utils import fullres
+    fr = fullres.fullres_cfg(cfg)
+    ref = fullres.reference_size(cfg)[::-1]
+    if isinstance(arrs, np.ndarray) and (arrs.shape[-2:] == ref or fr["mode"] == "off"):
+        return detect_features_batch(arrs, cfg)
+    groups: Dict[Tuple[int, ...], List[int]] = {}
+    for i, a in enumerate(arrs):
+        groups.setdefault(a.shape, []).append(i)
+    if len(groups) == 1 and (next(iter(groups)) == ref or fr["mode"] == "off"):
+        return detect_features_batch(np.stack(arrs), cfg)
+    out = {k: np.zeros(len(arrs), dtype=bool) for k in FEATURE_NAMES}
+    for shape, idx in groups.items():
+        if shape == ref or fr["mode"] == "off":
+            part = detect_features_batch(np.stack([arrs[i] for i in idx]), cfg)
+        elif fr["mode"] == "decimate":
+            part = detect_features_batch(np.stack([fullres.decimate(arrs[i], ref[::-1]) for i in idx]), cfg)
+        elif fr["mode"] == "scale":
+            part = stack_features([fullres.detect_features_scaled(arrs[i], cfg, fr["tile_rows"]) for i in idx])
+        else:
+            raise ValueError(f"unknown rules.fullres.mode {fr['mode']!r}")
+        for k in FEATURE_NAMES:
+            out[k][idx] = part[k]
+    return out
+
+def split_features(batch: Dict[str, np.ndarray]) -> List[Dict[str, bool]]:
+    """
+    Turns the output of detect_features_batch into per-image feature dicts.
+    """
+    n = len(batch[FEATURE_NAMES[0]])
+    return [{k: bool(batch[k][i]) for k in FEATURE_NAMES} for i in range(n)]
+
+BRIGHT_ROIS = ["iliopectineal", "ilioischial", "posterior_wall", "spur_area"]
+
+def roi_stats_batch(stack: np.ndarray, cfg: Dict) -> Dict[str, np.ndarray]:
+    """
+    Threshold-independent ROI statistics for an (N, H, W) uint8 stack:
+      {roi: (N, 257) int32} with [:, t] = #pixels >= t, for the BRIGHT_ROIS,
+      "iliac_wing_sum" / "iliac_wing_area" for the iliac wing mean.
+    Any bright_thr / *_pixels / fragment_mean combination can then be
+    evaluated with table lookups instead of touching the pixels again.
+    """
+    stack = np.asarray(stack)
+    if stack.ndim == 2:
+        stack = stack[None]
+    n, h, w = stack.shape
+    sl = _roi_slices(cfg["rules"]["roi"], h, w)
+    out = {}
+    rows = np.arange(n, dtype=np.int64)[:, None] * 256
+    for name in BRIGHT_ROIS:
+        ys, xs = sl[name]
+        flat = stack[:, ys, xs].reshape(n, -1)
+        hist = np.bincount((flat + rows).ravel(), minlength=256 * n).reshape(n, 256)
+        ge = np.zeros((n, 257), dtype=np.int32)
+        ge[:, :256] = np.cumsum(hist[:, ::-1], axis=1)[:, ::-1]
+        out[name] = ge
+    ys, xs = sl["iliac_wing"]
+    iw = stack[:, ys, xs]
+    out["iliac_wing_sum"] = iw.reshape(n, -1).sum(axis=1, dtype=np.int64)
+    out["iliac_wing_area"] = np.full(n, iw.shape[1] * iw.shape[2], dtype=np.int64)
+    return out
+
 def detect_features(img: Image.Image, cfg: Dict) -> Dict[str, bool]:
     roi = cfg["rules"]["roi"]
     thr = cfg["rules"]["thresholds"]
@@ -49,24 +178,114 @@ def detect_features(img: Image.Image, cfg: Dict) -> Dict[str, bool]:
     feats["iliac_wing_involved"]  = _mean_intensity(iw) >= float(thr.get("fragment_mean", 170))
     return feats
 
-def classify_from_features(feats: Dict[str, bool], class_order: List[str]) -> int:
-    ilp_broken = feats["iliopectineal_broken"]
-    ilis_broken = feats["ilioischial_broken"]
-    pw_frag = feats["posterior_wall_frag"]
-    spur = feats["spur_sign"]
-    iw_inv = feats["iliac_wing_involved"]
-
-    if ilp_broken and ilis_broken and spur:
-        return class_order.index("BC") if "BC" in class_order else 0
-    if ilp_broken and ilis_broken and not spur:
-        return class_order.index("T") if "T" in class_order else 0
-    if ilis_broken and pw_frag:
-        return class_order.index("PC") if "PC" in class_order else 0
-    if pw_frag and not ilp_broken and not ilis_broken:
-        return class_order.index("PW") if "PW" in class_order else 0
-    if ilp_broken and iw_inv:
-        return class_order.index("AC") if "AC" in class_order else 0
-    if ilp_broken and "AC" in class_order: return class_order.index("AC")
-    if ilis_broken and "PC" in class_order: return class_order.index("PC")
-    if pw_frag and "PW" in class_order: return class_order.index("PW")
-    return 0
+# Letournel precedence, first match wins. A matching rule whose class is not in
+# class_order yields index 0, unless "if_present" is set (then it is skipped).
+DEFAULT_RULE_TABLE = [
+    {"when": {"iliopectineal_broken": True, "ilioischial_broken": True, "spur_sign": True}, "then": "BC"},
+    {"when": {"iliopectineal_broken": True, "ilioischial_broken": True, "spur_sign": False}, "then": "T"},
+    {"when": {"ilioischial_broken": True, "posterior_wall_frag": True}, "then": "PC"},
+    {"when": {"posterior_wall_frag": True, "iliopectineal_broken": False, "ilioischial_broken": False}, "then": "PW"},
+    {"when": {"iliopectineal_broken": True, "iliac_wing_involved": True}, "then": "AC"},
+    {"when": {"iliopectineal_broken": True}, "then": "AC", "if_present": True},
+    {"when": {"ilioischial_broken": True}, "then": "PC", "if_present": True},
+    {"when": {"posterior_wall_frag": True}, "then": "PW", "if_present": True},
+]
+
+_COMPILED: Dict[Tuple, np.ndarray] = {}
+_LOADED: Dict[str, List[Dict]] = {}
+
+def load_rule_table(path: str) -> List[Dict]:
+    """
+    Reads a rule table from YAML: either a top-level list or {"table": [...]},
+    entries shaped like DEFAULT_RULE_TABLE.
+    """
+    if path in _LOADED:
+        return _LOADED[path]
+    import yaml
+    with open(path, "r") as f:
+        data = yaml.safe_load(f)
+    table = data["table"] if isinstance(data, dict) else data
+    for r in table:
+        unknown = set(r["when"]) - set(FEATURE_NAMES)
+        if unknown:
+            raise ValueError(f"{path}: unknown feature(s) {sorted(unknown)} in rule {r}")
+    _LOADED[path] = table
+    return table
+
+def rule_table_from_cfg(cfg: Dict) -> List[Dict]:
+    """
+    cfg["rules"]["table"] may be an inline list or a path to a YAML rule file;
+    falls back to DEFAULT_RULE_TABLE.
+    """
+    table = cfg.get("rules", {}).get("table")
+    if table is None:
+        return DEFAULT_RULE_TABLE
+    if isinstance(table, str):
+        return load_rule_table(table)
+    return table
+
+_KEYS: Dict[int, Tuple[List[Dict], str]] = {}
+
+def table_key(table: List[Dict]) -> str:
+    """
+    Content key for caches (equal tables from different cfgs share one entry),
+    serialized once per table object. The entry keeps the table alive so its
+    id() cannot be reused; tables are treated as read-only once used.
+    """
+    hit = _KEYS.get(id(table))
+    if hit is None or hit[0] is not table:
+        if len(_KEYS) >= 256:
+            _KEYS.clear()
+        hit = _KEYS[id(table)] = (table, json.dumps(table, sort_keys=True))
+    return hit[1]
+
+def compile_rules(class_order: List[str], table: List[Dict] = None) -> np.ndarray:
+    """
+    32-entry lookup table: index = feature_codes(...) (bit k <-> FEATURE_NAMES[k]),
+    value = predicted class index. Cached per (class_order, table).
+    """
+    table = DEFAULT_RULE_TABLE if table is None else table
+    key = (tuple(class_order), table_key(table))
+    if key in _COMPILED:
+        return _COMPILED[key]
+    lut = np.zeros(32, dtype=np.int64)
+    for code in range(32):
+        feats = {name: bool(code >> k & 1) for k, name in enumerate(FEATURE_NAMES)}
+        for r in table:
+            if all(feats[f] == bool(v) for f, v in r["when"].items()):
+                if r["then"] in class_order:
+                    lut[code] = class_order.index(r["then"])
+                    break
+                if not r.get("if_present", False):
+                    break
+    _COMPILED[key] = lut
+    return lut
+
+def feature_codes(batch: Dict[str, np.ndarray]) -> np.ndarray:
+    """
+    Packs a detect_features_batch dict into (N,) uint8 codes for compile_rules.
+    """
+    code = np.zeros(len(batch[FEATURE_NAMES[0]]), dtype=np.uint8)
+    for k, name in enumerate(FEATURE_NAMES):
+        code |= np.asarray(batch[name], dtype=np.uint8) << k
+    return code
+
+def stack_features(feats: List[Dict[str, bool]]) -> Dict[str, np.ndarray]:
+    """
+    Inverse of split_features.
+    """
+    return {k: np.array([f[k] for f in feats], dtype=bool) for k in FEATURE_NAMES}
+
+def classify_batch(batch: Dict[str, np.ndarray], class_order: List[str], table: List[Dict] = None,
+                   lut: np.ndarray = None) -> np.ndarray:
+    # lut: a compile_rules result, so hot loops skip the cache lookup
+    lut = compile_rules(class_order, table) if lut is None else lut
+    return lut[feature_codes(batch)]
+
+def classify_from_features(feats: Dict[str, bool], class_order: List[str], table: List[Dict] = None,
+                           lut: np.ndarray = None) -> int:
+    code = 0
+    for k, name in enumerate(FEATURE_NAMES):
+        code |= int(bool(feats[name])) << k
+    lut = compile_rules(class_order, table) if lut is None else lut
+    return int(lut[code])
@@ -1,14 +1,18 @@
-import random, numpy as np, os
+import random, sys, numpy as np, os
 
 def set_seed(seed: int = 42):
     random.seed(seed)
     np.random.seed(seed)
     os.environ["PYTHONHASHSEED"] = str(seed)
+    # only seed torch if the caller already imported it; importing it here
+    # would add seconds of startup to torch-free runs
+    torch = sys.modules.get("torch")
+    if torch is None:
+        return
     try:
-        import torch
         torch.manual_seed(seed)
         torch.cuda.manual_seed_all(seed)
         torch.backends.cudnn.deterministic = True
         torch.backends.cudnn.benchmark = False
     except Exception:
-        pass
\ No newline at end of file
+        pass
@@ -0,0 +1,73 @@
+import itertools
+from typing import Dict, List, Tuple
+import numpy as np
+from utils.rules import compile_rules
+
+TUNE_KEYS = ["bright_thr", "line_pixels", "pw_pixels", "spur_pixels", "fragment_mean"]
+_DEFAULTS = {"bright_thr": 200, "line_pixels": 620, "pw_pixels": 800, "spur_pixels": 100, "fragment_mean": 170}
+
+def expand_grid(spec: Dict, thresholds: Dict) -> Dict[str, List]:
+    """
+    spec[key] is a list of values or {start, stop, step} (stop inclusive).
+    Keys missing from spec stay at the current threshold.
+    """
+    grid = {}
+    for k in TUNE_KEYS:
+        v = (spec or {}).get(k)
+        if v is None:
+            v = [thresholds.get(k, _DEFAULTS[k])]
+        elif isinstance(v, dict):
+            v = list(np.arange(v["start"], v["stop"] + v["step"] / 2.0, v["step"]))
+        cast = float if k == "fragment_mean" else int
+        grid[k] = [cast(x) for x in v]
+    return grid
+
+def concat_stats(parts: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    return {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+
+def sweep(stats: Dict[str, np.ndarray], y_true: List[int], classes: List[str], grid: Dict[str, List],
+          rule_table: List[Dict] = None, max_elems: int = 1 << 24) -> np.ndarray:
+    """
+    Accuracy for every combination in grid, from roi_stats_batch output.
+    Returns an array shaped like the grid, axes in TUNE_KEYS order.
+    """
+    y = np.asarray(y_true, dtype=np.int64)
+    n = len(y)
+    table = compile_rules(classes, rule_table)
+    lp = np.asarray(grid["line_pixels"])[:, None]
+    pp = np.asarray(grid["pw_pixels"])[:, None]
+    sp = np.asarray(grid["spur_pixels"])[:, None]
+    fm = np.asarray(grid["fragment_mean"], dtype=np.float64)[:, None]
+    area = stats["iliac_wing_area"]
+    iw_mean = np.where(area > 0, stats["iliac_wing_sum"] / np.maximum(area, 1), 0.0)
+    iw = (iw_mean[None, :] >= fm).astype(np.uint8)[None, None, None, :, :] << 4
+
+    inner = len(lp) * len(pp) * len(sp) * len(fm)
+    step = max(1, max_elems // inner)
+    correct = np.zeros((len(grid["bright_thr"]), len(lp), len(pp), len(sp), len(fm)), dtype=np.int64)
+    for bi, bt in enumerate(grid["bright_thr"]):
+        t = min(max(int(bt), 0), 256)
+        ilp  = (stats["iliopectineal"][:, t][None, :] < lp).astype(np.uint8)
+        ilis = (stats["ilioischial"][:, t][None, :] < lp).astype(np.uint8)
+        pw   = (stats["posterior_wall"][:, t][None, :] >= pp).astype(np.uint8)
+        spur = (stats["spur_area"][:, t][None, :] >= sp).astype(np.uint8)
+        lines = (ilp | ilis << 1)[:, None, None, None, :]
+        pw = (pw << 2)[None, :, None, None, :]
+        spur = (spur << 3)[None, None, :, None, :]
+        for s in range(0, n, step):
+            e = s + step
+            code = lines[..., s:e] | pw[..., s:e] | spur[..., s:e] | iw[..., s:e]
+            correct[bi] += (table[code] == y[s:e]).sum(axis=-1)
+    return correct / float(n) if n else correct.astype(np.float64)
+
+def surface_rows(acc: np.ndarray, grid: Dict[str, List]) -> List[Dict]:
+    rows = []
+    for idx in itertools.product(*[range(len(grid[k])) for k in TUNE_KEYS]):
+        row = {k: grid[k][i] for k, i in zip(TUNE_KEYS, idx)}
+        row["accuracy"] = float(acc[idx])
+        rows.append(row)
+    return rows
+
+def best_params(acc: np.ndarray, grid: Dict[str, List]) -> Tuple[Dict, float]:
+    idx = np.unravel_index(int(np.argmax(acc)), acc.shape)
+    return {k: grid[k][i] for k, i in zip(TUNE_KEYS, idx)}, float(acc[idx])